@@ -0,0 +1,222 @@
+"""Offline throughput benchmark of the Kafka -> ClickHouse ETL loop.
+
+Kafka consumer and ClickHouse client are replaced with in-process stand-ins,
+everything in between (parsing, buffering, background flushes, compaction,
+columnar transpose, offset commits) is the real ETL code.
+
+Run from the ETL directory:
+    python -m benchmarks.etl_benchmark --messages 1000000 --cardinality 10000
+"""
+import argparse
+import json
+import logging
+import resource
+import statistics
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, NamedTuple
+
+from kafka.structs import TopicPartition
+
+from core import config
+import etl_run
+
+logger = logging.getLogger(__name__)
+
+
+class Message(NamedTuple):
+    key: bytes
+    value: bytes
+    offset: int
+    topic: str
+    timestamp: int
+
+
+class StreamExhausted(Exception):
+    pass
+
+
+class StubConsumer:
+    """Serves a synthetic watch mark stream spread evenly across partitions."""
+
+    def __init__(self, messages: int, cardinality: int, partitions: int, poll_records: int):
+        self.remaining = messages
+        self.poll_records = poll_records
+        self.partitions = [TopicPartition('auth_views_labels', number) for number in range(partitions)]
+        self.positions = {partition: 0 for partition in self.partitions}
+        self.keys = [f'{uuid.uuid4()}_{uuid.uuid4()}'.encode() for _ in range(cardinality)]
+        self.values = [f'01:{minute:02d}:{second:02d}.000000'.encode() for minute in range(60) for second in range(60)]
+        self.timestamp_ms = int(time.time() * 1000)
+        self.commits = 0
+        self.sent = 0
+
+    def poll(self, timeout_ms=0):
+        if not self.remaining:
+            raise StreamExhausted
+        records = {}
+        per_partition = max(1, self.poll_records // len(self.partitions))
+        for partition in self.partitions:
+            count = min(per_partition, self.remaining)
+            if not count:
+                break
+            start = self.positions[partition]
+            records[partition] = [
+                Message(
+                    key=self.keys[(self.sent + i) % len(self.keys)],
+                    value=self.values[(self.sent + i) % len(self.values)],
+                    offset=start + i,
+                    topic=partition.topic,
+                    timestamp=self.timestamp_ms,
+                )
+                for i in range(count)
+            ]
+            self.positions[partition] += count
+            self.remaining -= count
+            self.sent += count
+        return records
+
+    def commit(self, offsets=None):
+        self.commits += 1
+
+    def assignment(self):
+        return set(self.partitions)
+
+    def seek(self, partition, offset):
+        self.positions[partition] = offset
+
+    def close(self, autocommit=True):
+        pass
+
+
+class StubConsumerClient:
+    def __init__(self, consumer: StubConsumer):
+        self.consumer = consumer
+
+    def create_consumer(self, listener=None, partitions=None):
+        return self.consumer
+
+
+class StubClickHouseClient:
+    """Takes inserted data like the driver would (generators are drained) and waits a fixed time."""
+
+    def __init__(self, latency_sec: float):
+        self.latency_sec = latency_sec
+        self.rows = 0
+
+    def execute(self, query, params=None, columnar=False):
+        if columnar:
+            self.rows += len(params[0]) if params else 0
+        else:
+            self.rows += sum(1 for _ in params)
+        time.sleep(self.latency_sec)
+
+
+class StubPool:
+    def __init__(self, client: StubClickHouseClient):
+        self.stub_client = client
+
+    @contextmanager
+    def client(self):
+        yield self.stub_client
+
+    def close(self):
+        pass
+
+
+class BenchmarkRunner(etl_run.ETLProcessRunner):
+    def __init__(self, consumer: StubConsumer, clickhouse_client: StubClickHouseClient):
+        super().__init__()
+        self.kafka_consumer = StubConsumerClient(consumer)
+        self.clickhouse_operate.pool = StubPool(clickhouse_client)
+        self.flush_latencies: List[float] = []
+        self.batch_ages: List[float] = []
+
+    def on_batch_written(self, batch):
+        if batch is not None and batch.error is None:
+            self.flush_latencies.append(batch.flush_sec)
+            self.batch_ages.append(time.monotonic() - batch.created_at)
+        return super().on_batch_written(batch)
+
+
+def percentile(values: List[float], percent: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+def run_benchmark(args) -> dict:
+    config.KAFKA_BATCH_SIZE = args.batch_size
+    config.ETL_FLUSH_MAX_BYTES = args.batch_bytes
+    config.ETL_FLUSH_LINGER_SEC = args.linger_sec
+    config.ETL_COMPACT_WATCH_MARKS = args.compact
+    config.CLICKHOUSE_INSERT_MODE = args.insert_mode
+    config.ETL_SPILL_DIR = ''
+    config.ETL_METRICS_PORT = 0
+
+    consumer = StubConsumer(args.messages, args.cardinality, args.partitions, args.poll_records)
+    clickhouse_client = StubClickHouseClient(args.insert_latency_ms / 1000)
+    runner = BenchmarkRunner(consumer, clickhouse_client)
+    started = time.monotonic()
+    try:
+        runner.run()
+    except StreamExhausted:
+        pass
+    runner.drain()
+    elapsed = time.monotonic() - started
+    runner.flusher.close()
+
+    return {
+        'messages': args.messages,
+        'rows_inserted': clickhouse_client.rows,
+        'elapsed_sec': round(elapsed, 3),
+        'rows_per_sec': round(args.messages / elapsed),
+        'batches': len(runner.flush_latencies),
+        'commits': consumer.commits,
+        'flush_latency_p50_ms': round(percentile(runner.flush_latencies, 50) * 1000, 2),
+        'flush_latency_p99_ms': round(percentile(runner.flush_latencies, 99) * 1000, 2),
+        'batch_age_p50_ms': round(percentile(runner.batch_ages, 50) * 1000, 2),
+        'batch_age_p99_ms': round(percentile(runner.batch_ages, 99) * 1000, 2),
+        # ru_maxrss is reported in kilobytes on linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200000, help='watch marks in the stream')
+    parser.add_argument('--cardinality', type=int, default=10000, help='distinct film/user keys')
+    parser.add_argument('--partitions', type=int, default=3)
+    parser.add_argument('--poll-records', type=int, default=500, help='records returned by one poll')
+    parser.add_argument('--batch-size', type=int, default=config.KAFKA_BATCH_SIZE)
+    parser.add_argument('--batch-bytes', type=int, default=config.ETL_FLUSH_MAX_BYTES)
+    parser.add_argument('--linger-sec', type=float, default=config.ETL_FLUSH_LINGER_SEC)
+    parser.add_argument('--insert-latency-ms', type=float, default=5, help='simulated clickhouse round-trip')
+    parser.add_argument('--insert-mode', choices=('rows', 'columnar', 'typed'), default=config.CLICKHOUSE_INSERT_MODE)
+    parser.add_argument('--compact', action='store_true', help='enable watch mark compaction')
+    parser.add_argument('--min-rows-per-sec', type=int, default=0, help='exit with 1 when throughput is lower')
+    parser.add_argument('--json', action='store_true', help='print the report as json')
+    args = parser.parse_args(argv)
+    if args.compact and args.insert_mode == 'rows':
+        parser.error('--compact needs --insert-mode columnar or typed')
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for name, value in report.items():
+            print(f'{name:>22}: {value}')
+    if report['rows_per_sec'] < args.min_rows_per_sec:
+        logger.error(f"Throughput {report['rows_per_sec']} rows/s is below {args.min_rows_per_sec} rows/s.")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
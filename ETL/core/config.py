@@ -8,7 +8,7 @@ logging_config.dictConfig(LOGGING)
 KAFKA_HOST = os.getenv('KAFKA_HOST', 'host.docker.internal')
 KAFKA_PORT = os.getenv('KAFKA_PORT', '9092')
 
-KAFKA_TOPICS = os.getenv('KAFKA_TOPICS', ['auth_views_labels', 'unauth_views_labels'])
+KAFKA_TOPICS = os.getenv('KAFKA_TOPICS', 'auth_views_labels,unauth_views_labels').split(',')
 KAFKA_AUTO_OFFSET_RESET = os.getenv('KAFKA_AUTO_OFFSET_RESET', 'earliest')
 KAFKA_ENABLE_AUTO_COMMIT = os.getenv('KAFKA_ENABLE_AUTO_COMMIT', False)
 KAFKA_GROUP_ID = os.getenv('KAFKA_GROUP_ID', 'upload_to_clickhouse')
@@ -19,10 +19,87 @@ KAFKA_RECONNECT_BACKOFF_MAX_MS = os.getenv('KAFKA_RECONNECT_BACKOFF_MAX_MS', 100
 KAFKA_HEARTBEAT_INTERVAL_MS = os.getenv('KAFKA_HEARTBEAT_INTERVAL_MS', 5000)
 KAFKA_API_VERSION_AUTO_TIMEOUT_MS = os.getenv('KAFKA_API_VERSION_AUTO_TIMEOUT_MS', 5000)
 KAFKA_BATCH_SIZE = int(os.getenv('KAFKA_BATCH_SIZE', 1000))
+KAFKA_POLL_TIMEOUT_MS = int(os.getenv('KAFKA_POLL_TIMEOUT_MS', 1000))
+
+# worker processes; each one has its own consumer, buffer and clickhouse connections
+ETL_WORKERS = int(os.getenv('ETL_WORKERS', 1))
+# optional 'topic:partition,...' list spread across workers instead of group subscription
+ETL_PARTITIONS = os.getenv('ETL_PARTITIONS', '')
+ETL_WORKER_STOP_TIMEOUT_SEC = float(os.getenv('ETL_WORKER_STOP_TIMEOUT_SEC', 90))
+# a failed worker is restarted after a delay doubling with every failure in a row,
+# a worker that ran for ETL_WORKER_RESTART_MAX_DELAY_SEC counts as healthy again
+ETL_WORKER_RESTART_DELAY_SEC = float(os.getenv('ETL_WORKER_RESTART_DELAY_SEC', 1))
+ETL_WORKER_RESTART_MAX_DELAY_SEC = float(os.getenv('ETL_WORKER_RESTART_MAX_DELAY_SEC', 60))
+# 'sync' - ETLProcessRunner, 'async' - AsyncETLProcessRunner (etl_async_run.py)
+ETL_ENGINE = os.getenv('ETL_ENGINE', 'sync')
+# async engine: bounded queues between its stages and number of concurrent inserts
+ETL_ASYNC_QUEUE_SIZE = int(os.getenv('ETL_ASYNC_QUEUE_SIZE', 4))
+ETL_ASYNC_FETCH_MAX_RECORDS = int(os.getenv('ETL_ASYNC_FETCH_MAX_RECORDS', 1000))
+ETL_ASYNC_INSERT_CONCURRENCY = int(os.getenv('ETL_ASYNC_INSERT_CONCURRENCY', 2))
+
+# batch flush settings (a batch is flushed on whichever limit is hit first)
+ETL_FLUSH_MAX_BYTES = int(os.getenv('ETL_FLUSH_MAX_BYTES', 1024 * 1024))
+ETL_FLUSH_LINGER_SEC = float(os.getenv('ETL_FLUSH_LINGER_SEC', 5))
+# keep only the latest watch mark per film/user pair of a batch (and the marks count),
+# needs the columnar or typed insert mode, the rows mode writes no marks
+ETL_COMPACT_WATCH_MARKS = os.getenv('ETL_COMPACT_WATCH_MARKS', 'false').lower() == 'true'
+
+# attempts to write a batch that fails with anything but a connection error; a batch clickhouse
+# still refuses the values of is then moved to the dead letter directory and committed,
+# when the directory is empty the worker stops instead, other errors are consumed again later
+ETL_INSERT_MAX_ATTEMPTS = int(os.getenv('ETL_INSERT_MAX_ATTEMPTS', 3))
+ETL_INSERT_RETRY_DELAY_SEC = float(os.getenv('ETL_INSERT_RETRY_DELAY_SEC', 1))
+ETL_DEAD_LETTER_DIR = os.getenv('ETL_DEAD_LETTER_DIR', '')
+
+# etl_replay.py defaults
+ETL_REPLAY_BATCH_SIZE = int(os.getenv('ETL_REPLAY_BATCH_SIZE', 100000))
+ETL_REPLAY_WORKERS = int(os.getenv('ETL_REPLAY_WORKERS', 4))
+
+# spill queue for batches clickhouse can not take, disabled when the directory is empty
+ETL_SPILL_DIR = os.getenv('ETL_SPILL_DIR', '')
+ETL_SPILL_SEGMENT_MAX_BYTES = int(os.getenv('ETL_SPILL_SEGMENT_MAX_BYTES', 64 * 1024 * 1024))
+ETL_SPILL_RETRY_INTERVAL_SEC = float(os.getenv('ETL_SPILL_RETRY_INTERVAL_SEC', 10))
+# spilled batches replayed at once (per flushed batch or retry interval), so replay does not stall consumption
+ETL_SPILL_REPLAY_BATCHES = int(os.getenv('ETL_SPILL_REPLAY_BATCHES', 5))
+# when the queue grows past this size batches are consumed again later instead, 0 - no limit
+ETL_SPILL_MAX_BYTES = int(os.getenv('ETL_SPILL_MAX_BYTES', 1024 * 1024 * 1024))
+# time a stopping worker spends replaying spilled batches, the rest waits on disk for the restart
+ETL_SPILL_DRAIN_TIMEOUT_SEC = float(os.getenv('ETL_SPILL_DRAIN_TIMEOUT_SEC', 30))
+
+# prometheus metrics, every worker serves them on ETL_METRICS_PORT + worker number, 0 disables
+ETL_METRICS_PORT = int(os.getenv('ETL_METRICS_PORT', 9101))
+ETL_METRICS_LAG_INTERVAL_SEC = float(os.getenv('ETL_METRICS_LAG_INTERVAL_SEC', 10))
 
 # clickhouse settings
 CLICKHOUSE_HOST = os.getenv('CLICKHOUSE_HOST', 'clickhouse-node1')
+# nodes holding the distributed table, connections are spread across them
+CLICKHOUSE_HOSTS = os.getenv('CLICKHOUSE_HOSTS', f'{CLICKHOUSE_HOST},clickhouse-node3,clickhouse-node5').split(',')
+# 'distributed' - insert into the distributed table of CLICKHOUSE_DATABASE
+# 'shard' - insert straight into the shard table of the node owning the film
+CLICKHOUSE_INSERT_ROUTING = os.getenv('CLICKHOUSE_INSERT_ROUTING', 'distributed')
+# first replica of every shard, in the order of company_cluster shards
+CLICKHOUSE_SHARD_HOSTS = os.getenv(
+    'CLICKHOUSE_SHARD_HOSTS', 'clickhouse-node1,clickhouse-node3,clickhouse-node5'
+).split(',')
+CLICKHOUSE_SHARD_DATABASE = os.getenv('CLICKHOUSE_SHARD_DATABASE', 'shard')
+# second replica of every shard, in the same order, and the database of its replicated tables
+# (see remote_servers of the node configs), empty when shards have no second replica
+CLICKHOUSE_REPLICA_HOSTS = [
+    host for host in os.getenv(
+        'CLICKHOUSE_REPLICA_HOSTS', 'clickhouse-node2,clickhouse-node4,clickhouse-node6'
+    ).split(',') if host
+]
+CLICKHOUSE_REPLICA_DATABASE = os.getenv('CLICKHOUSE_REPLICA_DATABASE', 'replica')
+# create rollup tables and materialized views (pkg/clickhouse_schema.py) on ETL start
+CLICKHOUSE_MANAGE_ROLLUPS = os.getenv('CLICKHOUSE_MANAGE_ROLLUPS', 'false').lower() == 'true'
+CLICKHOUSE_POOL_SIZE = int(os.getenv('CLICKHOUSE_POOL_SIZE', 2))
+CLICKHOUSE_HEALTH_CHECK_INTERVAL_SEC = float(os.getenv('CLICKHOUSE_HEALTH_CHECK_INTERVAL_SEC', 30))
 CLICKHOUSE_DATABASE = os.getenv('CLICKHOUSE_DATABASE', 'default')
 CLICKHOUSE_TABLE = os.getenv('CLICKHOUSE_TABLE', 'views')
 CLICKHOUSE_USER = os.getenv('CLICKHOUSE_USER', 'app')
 CLICKHOUSE_PASSWORD = os.getenv('CLICKHOUSE_PASSWORD', 'qwe123')
+# 'rows' - row-wise insert of (film_id, user_id, timestamp)
+# 'columnar' - typed per-column insert, also fills position_ms and marks (see clickhouse.ddl)
+# 'typed' - per-column insert into the views_v2 layout: event_time, position_ms, marks and topic,
+#           no timestamp string (see pkg/clickhouse_schema.py, set CLICKHOUSE_TABLE=views_v2)
+CLICKHOUSE_INSERT_MODE = os.getenv('CLICKHOUSE_INSERT_MODE', 'rows')
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from aiokafka.abc import ConsumerRebalanceListener
+from kafka.errors import KafkaError
+from kafka.structs import TopicPartition
+
+from pkg.batch_buffer import Batch, BatchBuffer
+from pkg.batch_writer import BatchWriter, RejectedBatch
+from pkg.clickhouse_operate import ClickHouse
+from pkg.kafka_consumer import KafkaConsumerClient
+from pkg.metrics import BUFFERED_ROWS, LagReporter, observe_batch
+from pkg.view_events import parse_view_event
+from core import config
+
+logger = logging.getLogger(__name__)
+
+
+class FlushRequest:
+    """Queue marker asking the transform stage to hand its buffer over right away."""
+
+    def __init__(self):
+        self.done = asyncio.get_running_loop().create_future()
+
+
+class AsyncETLProcessRunner:
+    """Fetch, transform and insert stages running concurrently, linked by bounded queues.
+
+    Inserts run in a thread pool, so kafka fetches and clickhouse round-trips overlap.
+    Offsets are committed in batch order. A failed insert starts a new generation: records,
+    buffered rows and batches of older ones are dropped without committing their offsets,
+    and the fetch stage seeks back to the last committed offsets. A batch clickhouse
+    refuses with no dead letter queue to move it to stops the runner.
+    """
+
+    def __init__(self, partitions: Optional[List[TopicPartition]] = None):
+        self.partitions = partitions
+        self.clickhouse_operate = ClickHouse()
+        self.batch_writer = BatchWriter(self.clickhouse_operate)
+        self.kafka_consumer = KafkaConsumerClient()
+        self.consumer = None
+        self.buffer = BatchBuffer(
+            max_rows=config.KAFKA_BATCH_SIZE,
+            max_bytes=config.ETL_FLUSH_MAX_BYTES,
+            linger_sec=config.ETL_FLUSH_LINGER_SEC,
+        )
+        # The spill queue is not thread-safe, spilled batches are written one at a time.
+        self.insert_concurrency = 1 if config.ETL_SPILL_DIR else config.ETL_ASYNC_INSERT_CONCURRENCY
+        self.executor = ThreadPoolExecutor(max_workers=self.insert_concurrency, thread_name_prefix='etl-insert')
+        self.records_queue = None
+        self.batches_queue = None
+        self.commit_lock = None
+        self.next_sequence = 0
+        self.commit_sequence = 0
+        # sequence -> (generation, batch) of batches done with, written or not
+        self.written: Dict[int, Tuple[int, Batch]] = {}
+        self.committed_offsets: Dict[TopicPartition, int] = {}
+        # first fetched offset of every partition, the rewind target while nothing is committed
+        self.fetched_from: Dict[TopicPartition, int] = {}
+        # bumped by a failed insert; generation the consumer has been rewound for and of the buffered rows
+        self.generation = 0
+        self.fetch_generation = 0
+        self.buffer_generation = 0
+        # rows handed over to the insert stage and not committed yet
+        self.pending_rows = 0
+        self.lag_reporter = LagReporter()
+
+    @classmethod
+    def start_etl(cls, partitions: Optional[List[TopicPartition]] = None):
+        asyncio.run(cls(partitions).run())
+
+    async def run(self):
+        logger.info('Async ETL process has been started.')
+        self.records_queue = asyncio.Queue(maxsize=config.ETL_ASYNC_QUEUE_SIZE)
+        self.batches_queue = asyncio.Queue(maxsize=config.ETL_ASYNC_QUEUE_SIZE)
+        self.commit_lock = asyncio.Lock()
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopping.set)
+
+        self.consumer = await self.kafka_consumer.create_async_consumer(
+            listener=RebalanceListener(self),
+            partitions=self.partitions,
+        )
+        fetch = asyncio.create_task(self.fetch())
+        stages = [fetch, asyncio.create_task(self.transform())]
+        stages += [asyncio.create_task(self.insert()) for _ in range(self.insert_concurrency)]
+        if config.ETL_SPILL_DIR:
+            stages.append(asyncio.create_task(self.replay_spill()))
+        stop = asyncio.create_task(stopping.wait())
+        try:
+            done, _ = await asyncio.wait([*stages, stop], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # A stage only ends on error, raise it.
+                task.result()
+            logger.info('Stopping async ETL process.')
+            fetch.cancel()
+            await self.drain()
+        finally:
+            for task in [*stages, stop]:
+                task.cancel()
+            await asyncio.gather(*stages, stop, return_exceptions=True)
+            await self.consumer.stop()
+            self.executor.shutdown()
+            self.batch_writer.close()
+            self.clickhouse_operate.close()
+
+    async def fetch(self):
+        while True:
+            if self.fetch_generation != self.generation:
+                self.rewind()
+            # Records fetched while a rewind is requested are tagged with the old generation and dropped.
+            generation = self.fetch_generation
+            records = await self.consumer.getmany(
+                timeout_ms=config.KAFKA_POLL_TIMEOUT_MS,
+                max_records=config.ETL_ASYNC_FETCH_MAX_RECORDS,
+            )
+            if records:
+                for partition, messages in records.items():
+                    self.fetched_from.setdefault(partition, messages[0].offset)
+                await self.records_queue.put((generation, records))
+            await self.report_metrics()
+
+    def rewind(self):
+        """Seek every assigned partition back to its last committed offset."""
+        generation = self.generation
+        seek_offsets = {}
+        for partition in self.consumer.assignment():
+            offset = self.committed_offsets.get(partition, self.fetched_from.get(partition))
+            if offset is not None:
+                self.consumer.seek(partition, offset)
+                seek_offsets[partition] = offset
+        self.fetch_generation = generation
+        logger.warning(f'Rewound {len(seek_offsets)} partition(s) to {seek_offsets}.')
+
+    async def report_metrics(self):
+        BUFFERED_ROWS.set(len(self.buffer) + self.pending_rows)
+        if not self.lag_reporter.is_due():
+            return
+        highwaters, offsets = {}, {}
+        for partition in self.consumer.assignment():
+            highwaters[partition] = self.consumer.highwater(partition)
+            # Nothing committed by this runner yet, lag is counted from the fetched position.
+            offsets[partition] = self.committed_offsets.get(partition)
+            if offsets[partition] is None:
+                offsets[partition] = await self.consumer.position(partition)
+        self.lag_reporter.report(highwaters, offsets)
+
+    async def transform(self):
+        # The pending get outlives a linger timeout, wait_for would cancel and recreate it
+        # every time and may swallow the cancellation of the stage itself.
+        getter = None
+        try:
+            while True:
+                if getter is None:
+                    getter = asyncio.ensure_future(self.records_queue.get())
+                timeout_sec = self.buffer.linger_left_ms(config.KAFKA_POLL_TIMEOUT_MS) / 1000
+                done, _ = await asyncio.wait({getter}, timeout=timeout_sec)
+                item = None
+                if done:
+                    item, getter = getter.result(), None
+                await self.handle(item)
+        finally:
+            if getter is not None:
+                getter.cancel()
+
+    async def handle(self, item):
+        if self.buffer_generation != self.generation:
+            # A failed insert rewound the consumer, the buffered rows come again.
+            self.buffer.swap()
+            self.buffer_generation = self.generation
+        if isinstance(item, FlushRequest):
+            await self.hand_over()
+            item.done.set_result(None)
+        elif item is not None:
+            generation, records = item
+            if generation == self.generation:
+                await self.consume(records)
+        if item is not None:
+            self.records_queue.task_done()
+        if self.buffer.is_expired():
+            await self.hand_over()
+
+    async def consume(self, records: dict):
+        for partition, messages in records.items():
+            for msg in messages:
+                try:
+                    event = parse_view_event(msg.key, msg.value, msg.topic, msg.timestamp)
+                except (AttributeError, ValueError) as ex:
+                    logger.error(f'Skipping malformed message {partition}:{msg.offset}. {ex}')
+                    self.buffer.track(partition, msg.offset)
+                    continue
+                self.buffer.append(
+                    event,
+                    size=len(msg.key) + len(msg.value),
+                    partition=partition,
+                    offset=msg.offset,
+                )
+                if self.buffer.is_full():
+                    await self.hand_over()
+
+    async def hand_over(self):
+        if len(self.buffer):
+            self.pending_rows += len(self.buffer)
+            await self.batches_queue.put((self.buffer_generation, self.next_sequence, self.buffer.swap()))
+            self.next_sequence += 1
+
+    async def insert(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            generation, sequence, batch = await self.batches_queue.get()
+            try:
+                if generation == self.generation:
+                    await self.write(loop, generation, batch)
+                self.written[sequence] = (generation, batch)
+                await self.commit_written()
+            finally:
+                self.batches_queue.task_done()
+
+    async def write(self, loop: asyncio.AbstractEventLoop, generation: int, batch: Batch):
+        started = time.monotonic()
+        try:
+            await loop.run_in_executor(self.executor, self.batch_writer.write, batch.rows)
+        except RejectedBatch:
+            raise
+        except Exception as ex:
+            logger.error(f'Batch of {len(batch.rows)} row(s) has not been written, consuming it again. {ex}')
+            if generation == self.generation:
+                self.generation += 1
+            return
+        batch.flush_sec = time.monotonic() - started
+        logger.info(f'Flushed {len(batch.rows)} row(s) ({batch.size_bytes} bytes) in {batch.flush_sec:0.3f}s.')
+        observe_batch(len(batch.rows), batch.size_bytes, batch.flush_sec)
+
+    async def replay_spill(self):
+        """Replay spilled batches on a quiet topic too, in the single insert thread."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(config.ETL_SPILL_RETRY_INTERVAL_SEC)
+            if not self.batch_writer.is_replay_due():
+                continue
+            try:
+                await loop.run_in_executor(self.executor, self.batch_writer.replay_spill)
+            except RejectedBatch:
+                raise
+            except Exception as ex:
+                logger.error(f'Spill queue replay failed. {ex}')
+
+    async def commit_written(self):
+        # Batches may finish out of order, only the unbroken run from the oldest one is committed.
+        async with self.commit_lock:
+            offsets = {}
+            while self.commit_sequence in self.written:
+                generation, batch = self.written.pop(self.commit_sequence)
+                # Older generations are consumed again, a failed batch may be among them.
+                if generation == self.generation:
+                    offsets.update(batch.end_offsets)
+                self.pending_rows -= len(batch.rows)
+                self.commit_sequence += 1
+            if not offsets:
+                return
+            try:
+                await self.consumer.commit(offsets)
+            except KafkaError as ex:
+                logger.error(f'Error kafka consumer commit {ex}')
+                return
+            self.committed_offsets.update(offsets)
+
+    async def drain(self):
+        """Write out and commit everything handed to the pipeline so far."""
+        request = FlushRequest()
+        try:
+            await asyncio.wait_for(self._drain(request), timeout=config.ETL_WORKER_STOP_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            logger.error('Pipeline has not been drained in time, uncommitted rows will be consumed again.')
+
+    async def _drain(self, request: FlushRequest):
+        await self.records_queue.put(request)
+        await request.done
+        await self.batches_queue.join()
+
+
+class RebalanceListener(ConsumerRebalanceListener):
+    """Settles the pipeline before the group takes partitions away from the runner."""
+
+    def __init__(self, runner: AsyncETLProcessRunner):
+        self.runner = runner
+
+    async def on_partitions_revoked(self, revoked):
+        logger.info(f'Partitions revoked: {sorted(revoked)}')
+        await self.runner.drain()
+        for partition in revoked:
+            self.runner.committed_offsets.pop(partition, None)
+            self.runner.fetched_from.pop(partition, None)
+
+    async def on_partitions_assigned(self, assigned):
+        logger.info(f'Partitions assigned: {sorted(assigned)}')
+
+
+if __name__ == '__main__':
+    AsyncETLProcessRunner.start_etl()
@@ -0,0 +1,206 @@
+"""Replay a range of the view topics into a clickhouse table.
+
+The replay consumer is not a member of the live consumer group and commits nothing,
+so it can run next to the ETL. Partitions are replayed in parallel worker processes.
+
+Examples (from the ETL directory):
+    python etl_replay.py --from-time 2022-09-01T00:00 --to-time 2022-09-02T00:00 --table views_v2
+    python etl_replay.py --topics auth_views_labels --partitions 0 1 --from-offset 1000 --to-offset 5000
+"""
+import argparse
+import logging
+import multiprocessing
+import queue
+import sys
+import time
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from kafka.structs import TopicPartition
+
+from pkg.clickhouse_operate import ClickHouse
+from pkg.kafka_consumer import KafkaConsumerClient
+from pkg.view_events import parse_view_event
+from core import config
+
+logger = logging.getLogger(__name__)
+
+progress_queue: Optional[multiprocessing.Queue] = None
+
+
+def init_worker(worker_progress_queue: multiprocessing.Queue):
+    global progress_queue
+    progress_queue = worker_progress_queue
+
+
+def to_ms(value: Optional[datetime]) -> Optional[int]:
+    return int(value.timestamp() * 1000) if value else None
+
+
+def offsets_for_time(consumer, partitions: List[TopicPartition], timestamp_ms: int,
+                     default: Dict[TopicPartition, int]) -> Dict[TopicPartition, int]:
+    """Earliest offset at or after the timestamp, or the default one when there is none."""
+    found = consumer.offsets_for_times({partition: timestamp_ms for partition in partitions})
+    return {
+        partition: found[partition].offset if found.get(partition) else default[partition]
+        for partition in partitions
+    }
+
+
+def plan_ranges(consumer, args) -> Dict[TopicPartition, Tuple[int, int]]:
+    """Offset range [start, stop) to replay for every requested partition."""
+    partitions = [
+        TopicPartition(topic, number)
+        for topic in args.topics
+        for number in sorted(consumer.partitions_for_topic(topic) or ())
+        if args.partitions is None or number in args.partitions
+    ]
+    beginning = consumer.beginning_offsets(partitions)
+    end = consumer.end_offsets(partitions)
+
+    if args.from_offset is not None:
+        start = {partition: args.from_offset for partition in partitions}
+    elif args.from_time is not None:
+        start = offsets_for_time(consumer, partitions, to_ms(args.from_time), default=end)
+    else:
+        start = beginning
+
+    if args.to_offset is not None:
+        stop = {partition: args.to_offset for partition in partitions}
+    elif args.to_time is not None:
+        stop = offsets_for_time(consumer, partitions, to_ms(args.to_time), default=end)
+    else:
+        stop = end
+
+    ranges = {}
+    for partition in partitions:
+        first, last = max(start[partition], beginning[partition]), min(stop[partition], end[partition])
+        if first < last:
+            ranges[partition] = (first, last)
+    return ranges
+
+
+def replay_partition(partition: TopicPartition, start: int, stop: int, args) -> Tuple[int, int]:
+    """Load offsets [start, stop) of one partition into clickhouse, return inserted and skipped counts."""
+    consumer = KafkaConsumerClient().create_replay_consumer(max_poll_records=args.poll_records)
+    clickhouse_operate = ClickHouse(
+        database=args.database,
+        table=args.table,
+        insert_mode=args.insert_mode,
+        pool_size=1,
+        shard_database=args.shard_database,
+    )
+    consumer.assign([partition])
+    consumer.seek(partition, start)
+    rows, inserted, skipped, position = [], 0, 0, start
+    try:
+        while position < stop:
+            records = consumer.poll(timeout_ms=config.KAFKA_POLL_TIMEOUT_MS).get(partition, [])
+            for msg in records:
+                if msg.offset >= stop:
+                    break
+                try:
+                    rows.append(parse_view_event(msg.key, msg.value, msg.topic, msg.timestamp))
+                except (AttributeError, ValueError):
+                    skipped += 1
+            # Position also moves over offsets without records, e.g. transaction markers.
+            consumed = min(consumer.position(partition), stop) - position
+            if consumed:
+                position += consumed
+                progress_queue.put(consumed)
+            if len(rows) >= args.batch_size or (rows and position >= stop):
+                clickhouse_operate.ch_insert(insert_values=rows)
+                inserted += len(rows)
+                rows = []
+    finally:
+        consumer.close(autocommit=False)
+        clickhouse_operate.close()
+    logger.info(f'{partition.topic}:{partition.partition} replayed, {inserted} row(s) inserted, {skipped} skipped.')
+    return inserted, skipped
+
+
+def target_table(args) -> str:
+    if config.CLICKHOUSE_INSERT_ROUTING == 'shard':
+        return f'{args.shard_database}.{args.table} of every shard'
+    return f'{args.database}.{args.table}'
+
+
+def report_progress(done: int, total: int, started: float):
+    elapsed = time.monotonic() - started
+    rate = done / elapsed if elapsed else 0
+    eta = (total - done) / rate if rate else 0
+    logger.info(f'Replayed {done}/{total} message(s) ({done * 100 / total:0.1f}%), '
+                f'{rate:0.0f} msg/s, ETA {eta:0.0f}s.')
+
+
+def run_replay(args) -> int:
+    consumer = KafkaConsumerClient().create_replay_consumer()
+    try:
+        ranges = plan_ranges(consumer, args)
+    finally:
+        consumer.close(autocommit=False)
+    total = sum(stop - start for start, stop in ranges.values())
+    if not total:
+        logger.info('Nothing to replay.')
+        return 0
+    for partition, (start, stop) in ranges.items():
+        logger.info(f'{partition.topic}:{partition.partition} offsets [{start}, {stop}) will be replayed.')
+
+    worker_progress_queue = multiprocessing.Queue()
+    done, started = 0, time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(worker_progress_queue,)) as executor:
+        futures = [
+            executor.submit(replay_partition, partition, start, stop, args)
+            for partition, (start, stop) in ranges.items()
+        ]
+        pending = futures
+        while pending:
+            _, pending = wait(pending, timeout=args.progress_interval_sec, return_when=FIRST_EXCEPTION)
+            while True:
+                try:
+                    done += worker_progress_queue.get_nowait()
+                except queue.Empty:
+                    break
+            report_progress(done, total, started)
+            if any(future.done() and future.exception() for future in futures):
+                break
+        for future in pending:
+            future.cancel()
+
+    finished = [future for future in futures if future.done() and not future.cancelled()]
+    failed = [future.exception() for future in finished if future.exception()]
+    for error in failed:
+        logger.error(f'Partition replay failed. {error}')
+    inserted = sum(future.result()[0] for future in finished if not future.exception())
+    logger.info(f'Replay finished in {time.monotonic() - started:0.1f}s, {inserted} row(s) inserted '
+                f'into {target_table(args)}.')
+    return 1 if failed else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--topics', nargs='+', default=config.KAFKA_TOPICS)
+    parser.add_argument('--partitions', nargs='+', type=int, help='partition numbers, all by default')
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument('--from-offset', type=int)
+    start.add_argument('--from-time', type=datetime.fromisoformat, help='ISO 8601 date and time')
+    stop = parser.add_mutually_exclusive_group()
+    stop.add_argument('--to-offset', type=int, help='first offset not to replay')
+    stop.add_argument('--to-time', type=datetime.fromisoformat, help='ISO 8601 date and time, exclusive')
+    parser.add_argument('--database', default=config.CLICKHOUSE_DATABASE, help='database of the distributed table')
+    parser.add_argument('--shard-database', default=config.CLICKHOUSE_SHARD_DATABASE,
+                        help='database of the shard tables, used with CLICKHOUSE_INSERT_ROUTING=shard')
+    parser.add_argument('--table', default=config.CLICKHOUSE_TABLE)
+    parser.add_argument('--insert-mode', choices=('rows', 'columnar', 'typed'), default=config.CLICKHOUSE_INSERT_MODE)
+    parser.add_argument('--batch-size', type=int, default=config.ETL_REPLAY_BATCH_SIZE)
+    parser.add_argument('--poll-records', type=int, default=5000, help='max records returned by one poll')
+    parser.add_argument('--workers', type=int, default=config.ETL_REPLAY_WORKERS,
+                        help='partitions replayed in parallel')
+    parser.add_argument('--progress-interval-sec', type=float, default=10)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(run_replay(parse_args()))
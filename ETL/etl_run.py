@@ -1,7 +1,22 @@
 import logging
+import multiprocessing
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
 
+from kafka import ConsumerRebalanceListener
+from kafka.errors import KafkaError
+from kafka.structs import OffsetAndMetadata, TopicPartition
+
+from etl_async_run import AsyncETLProcessRunner
+from pkg.batch_buffer import BackgroundFlusher, Batch, BatchBuffer
+from pkg.batch_writer import BatchWriter, RejectedBatch
 from pkg.clickhouse_operate import ClickHouse
+from pkg.clickhouse_schema import create_rollups
 from pkg.kafka_consumer import KafkaConsumerClient
+from pkg.metrics import BUFFERED_ROWS, LagReporter, observe_batch, start_metrics_server
+from pkg.view_events import parse_view_event
 from core.req_handler import create_backoff_hdlr
 from core import config
 
@@ -10,34 +25,298 @@ back_off_hdlr = create_backoff_hdlr(logger)
 
 
 class ETLProcessRunner:
+    def __init__(self, partitions: Optional[List[TopicPartition]] = None):
+        self.partitions = partitions
+        self.clickhouse_operate = ClickHouse()
+        self.kafka_consumer = KafkaConsumerClient()
+        self.consumer = None
+        self.buffer = BatchBuffer(
+            max_rows=config.KAFKA_BATCH_SIZE,
+            max_bytes=config.ETL_FLUSH_MAX_BYTES,
+            linger_sec=config.ETL_FLUSH_LINGER_SEC,
+        )
+        self.batch_writer = BatchWriter(self.clickhouse_operate)
+        # Writes run in the flusher thread, off the consuming loop.
+        self.flusher = BackgroundFlusher(insert_func=self.batch_writer.write)
+        self.committed_offsets: Dict[TopicPartition, int] = {}
+        self.in_flight_rows = 0
+        self.lag_reporter = LagReporter()
+        self.spill_replay = None
+        # partitions and offsets the last rewind has sought to
+        self.rewound_offsets: Dict[TopicPartition, int] = {}
+
     @classmethod
-    def start_etl(cls):
+    def start_etl(cls, partitions: Optional[List[TopicPartition]] = None):
         logger.info('ETL process has been started.')
-        insert_list = []
-        clickhouse_operate = ClickHouse()
-        kafka_consumer = KafkaConsumerClient()
-        consumer = kafka_consumer.create_consumer()
+        runner = cls(partitions)
+        try:
+            runner.run()
+        except (SystemExit, KeyboardInterrupt):
+            # A clean stop writes and commits what has been consumed. After a failure the
+            # buffered offsets may lie past a batch that has not been written, nothing is committed.
+            runner.drain()
+            raise
+        finally:
+            runner.flusher.close()
+            runner.batch_writer.close()
+            runner.clickhouse_operate.close()
+            if runner.consumer is not None:
+                runner.consumer.close(autocommit=False)
+
+    def run(self):
+        self.consumer = self.kafka_consumer.create_consumer(
+            listener=RebalanceListener(self),
+            partitions=self.partitions,
+        )
         while True:
-            for msg in consumer:
+            records = self.consumer.poll(timeout_ms=self.buffer.linger_left_ms(config.KAFKA_POLL_TIMEOUT_MS))
+            self.consume(records)
+            if self.buffer.is_expired():
+                self.flush()
+            self.on_batch_written(self.flusher.collect())
+            self.replay_spill()
+            self.report_metrics()
+
+    def replay_spill(self):
+        # Runs in the flusher thread, after the batch being written and before the next one.
+        if self.spill_replay is not None:
+            if not self.spill_replay.done():
+                return
+            error, self.spill_replay = self.spill_replay.exception(), None
+            if isinstance(error, RejectedBatch):
+                raise error
+            if error is not None:
+                logger.error(f'Spill queue replay failed. {error}')
+        if self.batch_writer.is_replay_due():
+            self.spill_replay = self.flusher.executor.submit(self.batch_writer.replay_spill)
+
+    def report_metrics(self):
+        BUFFERED_ROWS.set(len(self.buffer) + self.in_flight_rows)
+        if not self.lag_reporter.is_due():
+            return
+        highwaters, offsets = {}, {}
+        for partition in self.consumer.assignment():
+            highwaters[partition] = self.consumer.highwater(partition)
+            # Nothing committed by this worker yet, lag is counted from the consumed position.
+            offsets[partition] = self.committed_offsets.get(partition)
+            if offsets[partition] is None:
+                offsets[partition] = self.consumer.position(partition)
+        self.lag_reporter.report(highwaters, offsets)
+
+    def consume(self, records: dict):
+        for partition, messages in records.items():
+            for msg in messages:
                 try:
-                    consumer.commit()
-                except Exception as ex:
-                    logger.error(f'Error kafka consumer {ex}')
-                    if insert_list:
-                        clickhouse_operate.ch_insert(insert_values=insert_list)
-                        insert_list.clear()
-                    consumer.close()
-                    consumer = kafka_consumer.create_consumer()
+                    event = parse_view_event(msg.key, msg.value, msg.topic, msg.timestamp)
+                except (AttributeError, ValueError) as ex:
+                    logger.error(f'Skipping malformed message {partition}:{msg.offset}. {ex}')
+                    self.buffer.track(partition, msg.offset)
                     continue
-                if len(insert_list) == config.KAFKA_BATCH_SIZE:
-                    consumer.paused()
-                    logger.info("Kafka consumer paused")
-                    clickhouse_operate.ch_insert(insert_values=insert_list)
-                    insert_list.clear()
-                    consumer.resume()
-                    logger.info("Kafka consumer resumed")
-                insert_list.append([*msg.key.decode("utf-8").split('_'), msg.value.decode("utf-8")])
+                self.buffer.append(
+                    event,
+                    size=len(msg.key) + len(msg.value),
+                    partition=partition,
+                    offset=msg.offset,
+                )
+                if self.buffer.is_full() and not self.flush():
+                    # The consumer has been rewound, the rest of these records comes again.
+                    self.rewind_unbuffered(records, partition)
+                    return
+
+    def flush(self) -> bool:
+        # The previous batch must be settled first: its offsets are committed
+        # before anything newer, and a failed insert rewinds the current buffer too.
+        if not self.on_batch_written(self.flusher.wait()):
+            return False
+        if len(self.buffer):
+            self.in_flight_rows = len(self.buffer)
+            self.flusher.submit(self.buffer.swap())
+        return True
+
+    def drain(self):
+        """Write out and commit everything consumed so far."""
+        self.flush()
+        self.on_batch_written(self.flusher.wait())
+
+    def on_batch_written(self, batch: Optional[Batch]) -> bool:
+        if batch is None:
+            return True
+        self.in_flight_rows = 0
+        if batch.error is not None:
+            # A batch clickhouse refuses the values of with no dead letter queue to move it to
+            # stops the worker, anything else is consumed again.
+            if isinstance(batch.error, RejectedBatch):
+                raise batch.error
+            self.rewind(batch)
+            return False
+        observe_batch(len(batch.rows), batch.size_bytes, batch.flush_sec)
+        self.commit(batch.end_offsets)
+        return True
+
+    def commit(self, offsets: Dict[TopicPartition, int]):
+        try:
+            self.consumer.commit(
+                offsets={partition: OffsetAndMetadata(offset, None) for partition, offset in offsets.items()}
+            )
+        except KafkaError as ex:
+            # Partitions were most likely reassigned; their new owner replays the batch.
+            logger.error(f'Error kafka consumer commit {ex}')
+            return
+        self.committed_offsets.update(offsets)
+
+    def rewind(self, failed_batch: Batch):
+        """Drop the buffered rows and seek back to the start of the failed batch."""
+        pending = self.buffer.swap()
+        seek_offsets = dict(pending.start_offsets)
+        for partition, offset in failed_batch.start_offsets.items():
+            seek_offsets[partition] = min(offset, seek_offsets.get(partition, offset))
+        assignment = self.consumer.assignment()
+        for partition, offset in seek_offsets.items():
+            if partition in assignment:
+                self.consumer.seek(partition, offset)
+        self.rewound_offsets = seek_offsets
+        logger.warning(
+            f'Rewound {len(seek_offsets)} partition(s), '
+            f'{len(failed_batch.rows) + len(pending.rows)} row(s) will be consumed again.'
+        )
+
+    def rewind_unbuffered(self, records: dict, current: TopicPartition):
+        """Seek back the partitions of a poll that come after the one being consumed when an insert failed.
+
+        Their records have not been buffered, so the rewind did not see them, while the
+        consumer position is already past them.
+        """
+        partitions = list(records)
+        assignment = self.consumer.assignment()
+        for partition in partitions[partitions.index(current) + 1:]:
+            # A partition with rows buffered from earlier polls has been rewound further back.
+            if partition in assignment and partition not in self.rewound_offsets and records[partition]:
+                self.consumer.seek(partition, records[partition][0].offset)
+
+
+class RebalanceListener(ConsumerRebalanceListener):
+    """Settles buffered rows before the group takes partitions away from the worker."""
+
+    def __init__(self, runner: ETLProcessRunner):
+        self.runner = runner
+
+    def on_partitions_revoked(self, revoked):
+        logger.info(f'Partitions revoked: {sorted(revoked)}')
+        self.runner.drain()
+        for partition in revoked:
+            self.runner.committed_offsets.pop(partition, None)
+
+    def on_partitions_assigned(self, assigned):
+        logger.info(f'Partitions assigned: {sorted(assigned)}')
+
+
+def exit_on_sigterm():
+    # SystemExit unwinds through start_etl, so the process commits what it has written.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+
+def start_engine(partitions: Optional[List[TopicPartition]] = None):
+    start_metrics_server()
+    if config.ETL_ENGINE == 'async':
+        AsyncETLProcessRunner.start_etl(partitions)
+    else:
+        ETLProcessRunner.start_etl(partitions)
+
+
+def run_worker(partitions: Optional[List[TopicPartition]] = None):
+    exit_on_sigterm()
+    # Ctrl+C reaches the whole process group, the supervisor stops workers itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    start_engine(partitions)
+
+
+class ETLSupervisor:
+    """Runs ETL workers as separate processes and restarts the ones that fail."""
+
+    def __init__(self, workers: int, partitions: Optional[List[TopicPartition]] = None):
+        if partitions is not None and workers > len(partitions):
+            # A worker without partitions would join the group and consume pinned ones again.
+            logger.warning(f'{workers} worker(s) requested for {len(partitions)} partition(s), '
+                           f'starting {len(partitions)}.')
+            workers = len(partitions)
+        self.workers = workers
+        self.partitions = partitions
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.started_at: Dict[int, float] = {}
+        self.failures: Dict[int, int] = {}
+        self.restart_at: Dict[int, float] = {}
+        self.stopping = False
+
+    def worker_partitions(self, number: int) -> Optional[List[TopicPartition]]:
+        if self.partitions is None:
+            return None
+        return self.partitions[number::self.workers]
+
+    def spawn(self, number: int):
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(self.worker_partitions(number),),
+            name=f'etl-worker-{number}',
+        )
+        process.start()
+        self.processes[number] = process
+        self.started_at[number] = time.monotonic()
+        logger.info(f'Started {process.name} (pid {process.pid}).')
+
+    def restart_delay(self, number: int) -> float:
+        """Delay before restarting a worker that has just exited."""
+        if time.monotonic() - self.started_at[number] >= config.ETL_WORKER_RESTART_MAX_DELAY_SEC:
+            self.failures[number] = 0
+        self.failures[number] = self.failures.get(number, 0) + 1
+        delay = config.ETL_WORKER_RESTART_DELAY_SEC * 2 ** (self.failures[number] - 1)
+        return min(delay, config.ETL_WORKER_RESTART_MAX_DELAY_SEC)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def start(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for number in range(self.workers):
+            self.spawn(number)
+        while not self.stopping:
+            time.sleep(1)
+            for number, process in list(self.processes.items()):
+                if self.stopping or process.is_alive():
+                    continue
+                if number not in self.restart_at:
+                    delay = self.restart_delay(number)
+                    self.restart_at[number] = time.monotonic() + delay
+                    logger.error(f'{process.name} exited with code {process.exitcode}, '
+                                 f'restarting in {delay:0.0f}s.')
+                if time.monotonic() >= self.restart_at[number]:
+                    del self.restart_at[number]
+                    self.spawn(number)
+        logger.info('Stopping ETL workers.')
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            process.join(config.ETL_WORKER_STOP_TIMEOUT_SEC)
+            if process.is_alive():
+                logger.error(f'{process.name} did not stop in time, killing it.')
+                process.kill()
+
+
+def parse_partitions(partitions: str) -> List[TopicPartition]:
+    """Parse 'topic:partition,...' into topic partitions."""
+    result = []
+    for item in filter(None, partitions.split(',')):
+        topic, partition = item.strip().rsplit(':', 1)
+        result.append(TopicPartition(topic, int(partition)))
+    return result
 
 
 if __name__ == '__main__':
-    ETLProcessRunner.start_etl()
+    if config.CLICKHOUSE_MANAGE_ROLLUPS:
+        create_rollups()
+    pinned_partitions = parse_partitions(config.ETL_PARTITIONS) or None
+    if config.ETL_WORKERS > 1 or pinned_partitions is not None:
+        ETLSupervisor(workers=config.ETL_WORKERS, partitions=pinned_partitions).start()
+    else:
+        exit_on_sigterm()
+        start_engine()
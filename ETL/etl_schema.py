@@ -0,0 +1,65 @@
+"""ClickHouse schema management for the tables the ETL writes to.
+
+Examples (from the ETL directory):
+    python etl_schema.py rollups
+    python etl_schema.py rollups --table views --backfill
+
+Migration to the typed views layout:
+    python etl_schema.py views-v2 --table views_v2
+    python etl_schema.py rollups --table views_v2 --typed
+    (run the ETL with CLICKHOUSE_TABLE=views_v2 CLICKHOUSE_INSERT_MODE=typed)
+    python etl_schema.py backfill-v2 --source views --table views_v2 --before 2022-09-01T12:00
+Rollups of the new table are filled by the backfill itself, do not pass --backfill to them.
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from pkg.clickhouse_schema import backfill_views_v2, create_rollups, create_views_v2
+from core import config
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rollups = commands.add_parser('rollups', help='create rollup tables and materialized views')
+    rollups.add_argument('--table', default=config.CLICKHOUSE_TABLE, help='raw views table')
+    rollups.add_argument('--backfill', action='store_true',
+                         help='aggregate rows already in the table, only on the first creation')
+    rollups.add_argument('--typed', action='store_true', default=None,
+                         help='the table has the typed views layout, by default when CLICKHOUSE_INSERT_MODE=typed')
+
+    views_v2 = commands.add_parser('views-v2', help='create the typed views table')
+    views_v2.add_argument('--table', default='views_v2')
+
+    backfill = commands.add_parser('backfill-v2', help='copy the raw views table into the typed one')
+    backfill.add_argument('--source', default='views')
+    backfill.add_argument('--table', default='views_v2')
+    backfill.add_argument('--before', type=datetime.fromisoformat,
+                          help='ISO 8601 date and time the ETL switched to the typed table, now by default')
+    backfill.add_argument('--partitions', nargs='+', help='daily partitions (YYYYMMDD) to copy, all by default')
+    backfill.add_argument('--skip-partitions', type=int, default=0,
+                          help='number of partitions of every shard already copied by an interrupted run')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.command == 'rollups':
+        create_rollups(table=args.table, backfill=args.backfill, typed=args.typed)
+    elif args.command == 'views-v2':
+        create_views_v2(table=args.table)
+    elif args.command == 'backfill-v2':
+        backfill_views_v2(
+            source=args.source,
+            table=args.table,
+            before=args.before,
+            partitions=args.partitions,
+            skip_partitions=args.skip_partitions,
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from kafka.structs import TopicPartition
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Batch:
+    rows: List[list] = field(default_factory=list)
+    size_bytes: int = 0
+    created_at: float = 0.0
+    # first consumed and next-to-commit offset of every partition in the batch
+    start_offsets: Dict[TopicPartition, int] = field(default_factory=dict)
+    end_offsets: Dict[TopicPartition, int] = field(default_factory=dict)
+    error: Optional[Exception] = None
+    flush_sec: float = 0.0
+
+
+class BatchBuffer:
+    """Accumulates rows until max rows, max bytes or max linger time is reached."""
+
+    def __init__(self, max_rows: int, max_bytes: int, linger_sec: float):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.linger_sec = linger_sec
+        self.batch = Batch()
+
+    def __len__(self):
+        return len(self.batch.rows)
+
+    def append(self, row: list, size: int, partition: TopicPartition, offset: int):
+        if not self.batch.rows:
+            self.batch.created_at = time.monotonic()
+        self.batch.rows.append(row)
+        self.batch.size_bytes += size
+        self.track(partition, offset)
+
+    def track(self, partition: TopicPartition, offset: int):
+        """Account a consumed offset, also for messages that produced no row."""
+        self.batch.start_offsets.setdefault(partition, offset)
+        self.batch.end_offsets[partition] = offset + 1
+
+    def is_full(self) -> bool:
+        return len(self.batch.rows) >= self.max_rows or self.batch.size_bytes >= self.max_bytes
+
+    def is_expired(self) -> bool:
+        return bool(self.batch.rows) and time.monotonic() - self.batch.created_at >= self.linger_sec
+
+    def linger_left_ms(self, default_ms: int) -> int:
+        if not self.batch.rows:
+            return default_ms
+        left_sec = self.linger_sec - (time.monotonic() - self.batch.created_at)
+        return max(0, min(default_ms, int(left_sec * 1000)))
+
+    def swap(self) -> Batch:
+        """Hand the filled batch over and start filling a fresh one."""
+        batch, self.batch = self.batch, Batch()
+        return batch
+
+
+class BackgroundFlusher:
+    """Writes batches in a background thread, at most one batch in flight."""
+
+    def __init__(self, insert_func: Callable[[list], None]):
+        self.insert_func = insert_func
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='etl-flusher')
+        self.in_flight = None
+
+    def submit(self, batch: Batch):
+        if self.in_flight is not None:
+            raise RuntimeError('Previous batch has not been collected yet.')
+        self.in_flight = self.executor.submit(self._flush, batch)
+
+    def wait(self) -> Optional[Batch]:
+        """Block until the in-flight batch is written and return it."""
+        if self.in_flight is None:
+            return None
+        future, self.in_flight = self.in_flight, None
+        return future.result()
+
+    def collect(self) -> Optional[Batch]:
+        """Return the in-flight batch if it is already written, without blocking."""
+        if self.in_flight is None or not self.in_flight.done():
+            return None
+        return self.wait()
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
+
+    def _flush(self, batch: Batch) -> Batch:
+        started = time.monotonic()
+        try:
+            self.insert_func(batch.rows)
+        except Exception as ex:
+            logger.error(f'Batch of {len(batch.rows)} row(s) has not been written. {ex}')
+            batch.error = ex
+            return batch
+        finally:
+            batch.flush_sec = time.monotonic() - started
+        logger.info(
+            f'Flushed {len(batch.rows)} row(s) ({batch.size_bytes} bytes) '
+            f'in {batch.flush_sec:0.3f}s.'
+        )
+        return batch
@@ -0,0 +1,116 @@
+import logging
+import multiprocessing
+import os
+import time
+
+from core import config
+from pkg import metrics
+from pkg.clickhouse_operate import ClickHouse
+from pkg.clickhouse_pool import CONNECTION_ERRORS, is_data_error
+from pkg.spill_queue import SpillingWriter, SpillQueue, SpillQueueFull
+from pkg.view_events import compact
+
+logger = logging.getLogger(__name__)
+
+# raised right away, the runner consumes the batch again later
+RETRY_LATER_ERRORS = (*CONNECTION_ERRORS, SpillQueueFull)
+
+
+class RejectedBatch(Exception):
+    """Clickhouse does not take the values of a batch and there is no dead letter queue for it."""
+
+
+class BatchWriter:
+    """Compacts a batch if enabled and writes it to clickhouse or to the spill queue.
+
+    Connection errors, and a full spill queue, are raised, the runner consumes the batch again.
+    Other errors are retried ETL_INSERT_MAX_ATTEMPTS times. A batch clickhouse still refuses
+    the values of is moved to the dead letter queue then, so one bad row can not stop the
+    partition, without the queue RejectedBatch is raised. Anything else, e.g. a read-only
+    replica, is raised as well and the batch is consumed again.
+    """
+
+    def __init__(self, clickhouse_operate: ClickHouse):
+        if config.ETL_COMPACT_WATCH_MARKS and clickhouse_operate.insert_mode == 'rows':
+            # The rows mode writes no marks column, every compacted row would count as one mark.
+            raise ValueError('ETL_COMPACT_WATCH_MARKS needs CLICKHOUSE_INSERT_MODE columnar or typed.')
+        self.clickhouse_operate = clickhouse_operate
+        # Every worker process needs queues of its own.
+        worker_name = multiprocessing.current_process().name
+        self.dead_letter = None
+        if config.ETL_DEAD_LETTER_DIR:
+            self.dead_letter = SpillQueue(
+                directory=os.path.join(config.ETL_DEAD_LETTER_DIR, worker_name),
+                segment_max_bytes=config.ETL_SPILL_SEGMENT_MAX_BYTES,
+            )
+        self.spilling_writer = None
+        if config.ETL_SPILL_DIR:
+            self.spilling_writer = SpillingWriter(
+                clickhouse=clickhouse_operate,
+                spill=SpillQueue(
+                    directory=os.path.join(config.ETL_SPILL_DIR, worker_name),
+                    segment_max_bytes=config.ETL_SPILL_SEGMENT_MAX_BYTES,
+                ),
+                retry_interval_sec=config.ETL_SPILL_RETRY_INTERVAL_SEC,
+                replay_batches=config.ETL_SPILL_REPLAY_BATCHES,
+                max_bytes=config.ETL_SPILL_MAX_BYTES,
+                max_attempts=config.ETL_INSERT_MAX_ATTEMPTS,
+                on_reject=self.reject,
+                drain_timeout_sec=config.ETL_SPILL_DRAIN_TIMEOUT_SEC,
+            )
+
+    def write(self, rows: list):
+        if config.ETL_COMPACT_WATCH_MARKS:
+            compacted = compact(rows)
+            logger.info(f'Compacted {len(rows)} watch mark(s) into {len(compacted)} row(s).')
+            rows = compacted
+        for attempt in range(1, config.ETL_INSERT_MAX_ATTEMPTS + 1):
+            try:
+                self._write(rows)
+                return
+            except (*RETRY_LATER_ERRORS, RejectedBatch):
+                raise
+            except Exception as ex:
+                if attempt >= config.ETL_INSERT_MAX_ATTEMPTS:
+                    if not is_data_error(ex):
+                        raise
+                    self.reject(rows, ex)
+                    return
+                logger.warning(f'Batch of {len(rows)} row(s) failed, '
+                               f'attempt {attempt} of {config.ETL_INSERT_MAX_ATTEMPTS}. {ex}')
+                time.sleep(config.ETL_INSERT_RETRY_DELAY_SEC * attempt)
+
+    def _write(self, rows: list):
+        if self.spilling_writer is not None:
+            self.spilling_writer.write(rows)
+        else:
+            self.clickhouse_operate.ch_insert(insert_values=rows)
+
+    def is_replay_due(self) -> bool:
+        return self.spilling_writer is not None and self.spilling_writer.is_replay_due()
+
+    def replay_spill(self):
+        """Replay spilled batches without waiting for a new batch, e.g. on a quiet topic.
+
+        Must not run concurrently with write, the runners call it from the insert thread.
+        """
+        if self.is_replay_due():
+            self.spilling_writer.replay()
+
+    def reject(self, rows: list, error: Exception):
+        """Move a batch clickhouse does not take out of the way, its offsets get committed."""
+        if self.dead_letter is None:
+            raise RejectedBatch(f'Batch of {len(rows)} row(s) rejected by clickhouse, first row '
+                                f'{rows[0] if rows else None}, set ETL_DEAD_LETTER_DIR to move it aside. {error}') from error
+        self.dead_letter.append(rows)
+        metrics.DEAD_LETTER_ROWS.inc(len(rows))
+        logger.error(f'Batch of {len(rows)} row(s) moved to the dead letter queue '
+                     f'in {self.dead_letter.directory}. {error}')
+
+    def close(self):
+        try:
+            if self.spilling_writer is not None:
+                self.spilling_writer.close()
+        finally:
+            if self.dead_letter is not None:
+                self.dead_letter.close()
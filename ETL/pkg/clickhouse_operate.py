@@ -1,59 +1,113 @@
 import logging
+import zlib
+from collections import defaultdict
+from typing import Dict, List
+from uuid import UUID
+
 import backoff
-from clickhouse_driver import Client
-from clickhouse_driver.errors import NetworkError, CannotParseUuidError, Error
 from core import config
 from core.req_handler import create_backoff_hdlr
+from pkg import metrics
+from pkg.clickhouse_pool import CONNECTION_ERRORS, ClickHousePool
+from pkg.view_events import to_columns
 
 logger = logging.getLogger(__name__)
 back_off_hdlr = create_backoff_hdlr(logger)
 
 
+# columns written by every insert mode, in the order of the ViewEvent fields they come from
+INSERT_COLUMNS = {
+    'rows': ('film_id', 'user_id', 'timestamp'),
+    'columnar': ('film_id', 'user_id', 'timestamp', 'position_ms', 'marks'),
+    'typed': ('film_id', 'user_id', 'position_ms', 'marks', 'topic', 'event_time'),
+}
+
+
+def shard_of(film_id: UUID, shards: int) -> int:
+    """Shard the distributed table picks for the film with its CRC32(toString(film_id)) sharding key."""
+    return zlib.crc32(str(film_id).encode()) % shards
+
+
 class ClickHouse:
-    def __init__(self):
-        self.clickhouse_host = config.CLICKHOUSE_HOST
-        self.clickhouse_user = config.CLICKHOUSE_USER
-        self.clickhouse_password = config.CLICKHOUSE_PASSWORD
-        self.clickhouse_database = config.CLICKHOUSE_DATABASE
-        self.clickhouse_table = config.CLICKHOUSE_TABLE
+    def __init__(self, database: str = None, table: str = None, insert_mode: str = None, pool_size: int = None,
+                 shard_database: str = None):
+        self.clickhouse_database = database or config.CLICKHOUSE_DATABASE
+        # database of the shard tables, written to instead of the distributed one with shard routing
+        self.shard_database = shard_database or config.CLICKHOUSE_SHARD_DATABASE
+        self.clickhouse_table = table or config.CLICKHOUSE_TABLE
+        self.insert_mode = insert_mode or config.CLICKHOUSE_INSERT_MODE
+        self.pool = None
+        self.shard_pools = []
+        if config.CLICKHOUSE_INSERT_ROUTING == 'shard':
+            # One pool per shard, in the order of the shards in the cluster config.
+            self.shard_pools = [
+                self._create_pool([host], pool_size or config.CLICKHOUSE_POOL_SIZE)
+                for host in config.CLICKHOUSE_SHARD_HOSTS
+            ]
+        else:
+            self.pool = self._create_pool(config.CLICKHOUSE_HOSTS, pool_size or config.CLICKHOUSE_POOL_SIZE)
 
-    @backoff.on_exception(
-        backoff.fibo,
-        exception=(ConnectionRefusedError, Error),
-        max_time=60,
-        max_tries=100,
-        on_backoff=back_off_hdlr,
-    )
-    def connection(self):
-        client = Client(host=self.clickhouse_host,
-                        user=self.clickhouse_user,
-                        password=self.clickhouse_password)
-        try:
-            logger.info('Trying to connect clickhouse.')
-            client.connection.connect()
-            logger.info('Connected to clickhouse.')
-            return client
-        except Exception as ex:
-            logger.error(f'Connection refused error clickhouse. {ex}')
-            raise ConnectionRefusedError
+    @staticmethod
+    def _create_pool(hosts: List[str], size: int) -> ClickHousePool:
+        return ClickHousePool(
+            hosts=hosts,
+            size=size,
+            user=config.CLICKHOUSE_USER,
+            password=config.CLICKHOUSE_PASSWORD,
+            health_check_interval_sec=config.CLICKHOUSE_HEALTH_CHECK_INTERVAL_SEC,
+        )
 
     @backoff.on_exception(
         backoff.fibo,
-        exception=(NetworkError, CannotParseUuidError),
+        exception=CONNECTION_ERRORS,
         max_time=60,
-        on_backoff=back_off_hdlr,
+        on_backoff=[back_off_hdlr, metrics.on_backoff],
     )
     def ch_insert(self, insert_values: list):
         try:
-            client = self.connection()
             logger.info(f'Start insert in clickhouse.')
-            client.execute(
-                f"INSERT INTO {self.clickhouse_database}.{self.clickhouse_table} (film_id, user_id, timestamp) VALUES",
-                (tuple(row) for row in insert_values))
+            self.insert(insert_values)
             logger.info(f'{len(insert_values)} row(s) added in clickhouse.')
-            client.disconnect()
-        except NetworkError as ex:
+        except CONNECTION_ERRORS as ex:
             logger.error(f'Query error CLICKHOUSE {ex}')
-            raise ConnectionRefusedError
+            raise
         except Exception as ex:
             logger.error(f'Error when pasting data on clickhouse. {ex}')
+            raise
+
+    def insert(self, insert_values: list):
+        """Single insert attempt, without retries."""
+        try:
+            self._insert(insert_values)
+        except Exception as ex:
+            metrics.INSERT_ERRORS.labels(type(ex).__name__).inc()
+            raise
+
+    def _insert(self, insert_values: list):
+        if not self.shard_pools:
+            self._execute(self.pool, self.clickhouse_database, insert_values)
+            return
+        # A retry after a partial failure sends the same blocks to the shards that already
+        # took them, replicated tables deduplicate those.
+        for shard, rows in self.split_by_shard(insert_values).items():
+            self._execute(self.shard_pools[shard], self.shard_database, rows)
+
+    def split_by_shard(self, insert_values: list) -> Dict[int, list]:
+        shards = defaultdict(list)
+        for row in insert_values:
+            shards[shard_of(row[0], len(self.shard_pools))].append(row)
+        return shards
+
+    def _execute(self, pool: ClickHousePool, database: str, insert_values: list):
+        columns = INSERT_COLUMNS[self.insert_mode]
+        query = f"INSERT INTO {database}.{self.clickhouse_table} ({', '.join(columns)}) VALUES"
+        with pool.client() as client:
+            if self.insert_mode == 'rows':
+                client.execute(query, (row[:3] for row in insert_values))
+            else:
+                client.execute(query, to_columns(insert_values, columns), columnar=True)
+
+    def close(self):
+        for pool in [self.pool, *self.shard_pools]:
+            if pool is not None:
+                pool.close()
@@ -0,0 +1,138 @@
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import List
+
+from clickhouse_driver import Client
+from clickhouse_driver.errors import Error, ErrorCodes, NetworkError, SocketTimeoutError
+
+logger = logging.getLogger(__name__)
+
+CONNECTION_ERRORS = (NetworkError, SocketTimeoutError, EOFError)
+
+# codes of values a table does not take, the same rows fail the same way on every attempt
+DATA_ERROR_CODES = frozenset((
+    ErrorCodes.CANNOT_PARSE_TEXT,
+    ErrorCodes.CANNOT_PARSE_ESCAPE_SEQUENCE,
+    ErrorCodes.CANNOT_PARSE_QUOTED_STRING,
+    ErrorCodes.CANNOT_PARSE_INPUT_ASSERTION_FAILED,
+    ErrorCodes.CANNOT_PARSE_DATE,
+    ErrorCodes.CANNOT_PARSE_DATETIME,
+    ErrorCodes.CANNOT_PARSE_NUMBER,
+    ErrorCodes.CANNOT_PARSE_UUID,
+    ErrorCodes.CANNOT_PARSE_DOMAIN_VALUE_FROM_STRING,
+    ErrorCodes.CANNOT_CONVERT_TYPE,
+    ErrorCodes.TYPE_MISMATCH,
+    ErrorCodes.VALUE_IS_OUT_OF_RANGE_OF_DATA_TYPE,
+    ErrorCodes.CANNOT_INSERT_VALUE_OF_DIFFERENT_SIZE_INTO_TUPLE,
+    ErrorCodes.INCORRECT_DATA,
+))
+
+
+def is_data_error(error: Exception) -> bool:
+    """Clickhouse, or the driver, refuses the values of the batch, any other error may pass on a retry."""
+    return isinstance(error, Error) and error.code in DATA_ERROR_CODES
+
+
+class PooledClient:
+    def __init__(self, client: Client, host: str):
+        self.client = client
+        self.host = host
+        self.released_at = None
+
+    def is_stale(self, interval_sec: float) -> bool:
+        return self.released_at is not None and time.monotonic() - self.released_at >= interval_sec
+
+
+class ClickHousePool:
+    """Long-lived clickhouse clients spread round-robin across the cluster nodes."""
+
+    def __init__(self, hosts: List[str], size: int, user: str, password: str,
+                 health_check_interval_sec: float, connect_timeout_sec: float = 10):
+        self.hosts = hosts
+        self.size = size
+        self.user = user
+        self.password = password
+        self.health_check_interval_sec = health_check_interval_sec
+        self.connect_timeout_sec = connect_timeout_sec
+        self.next_host = itertools.cycle(hosts)
+        # released clients, the last released is handed out first
+        self.idle: List[PooledClient] = []
+        self.created = 0
+        # guards idle and created, notified when a client is released or dropped
+        self.available = threading.Condition()
+
+    @contextmanager
+    def client(self):
+        pooled = self.acquire()
+        try:
+            yield pooled.client
+        except CONNECTION_ERRORS:
+            # The node may be gone, the next client goes to another one.
+            self.discard(pooled)
+            raise
+        except Exception:
+            self.release(pooled)
+            raise
+        self.release(pooled)
+
+    def acquire(self) -> PooledClient:
+        pooled = self._take()
+        if pooled.is_stale(self.health_check_interval_sec) and not self._is_alive(pooled):
+            # A fresh client is handed out unchecked, its own errors go to the caller.
+            self.discard(pooled)
+            pooled = self._take()
+        return pooled
+
+    def release(self, pooled: PooledClient):
+        pooled.released_at = time.monotonic()
+        with self.available:
+            self.idle.append(pooled)
+            self.available.notify()
+
+    def discard(self, pooled: PooledClient):
+        pooled.client.disconnect()
+        with self.available:
+            self.created -= 1
+            # A thread waiting for a client may open a new one in its place.
+            self.available.notify()
+        logger.warning(f'Clickhouse connection to {pooled.host} has been dropped.')
+
+    def close(self):
+        with self.available:
+            idle, self.idle = self.idle, []
+        for pooled in idle:
+            pooled.client.disconnect()
+
+    def _take(self) -> PooledClient:
+        """Return an idle client, or a new one while the pool is not full, waiting for either."""
+        with self.available:
+            while not self.idle and self.created >= self.size:
+                self.available.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.created += 1
+            host = next(self.next_host)
+        logger.info(f'Opening clickhouse connection to {host}.')
+        try:
+            client = Client(host=host,
+                            user=self.user,
+                            password=self.password,
+                            connect_timeout=self.connect_timeout_sec)
+        except Exception:
+            with self.available:
+                self.created -= 1
+                self.available.notify()
+            raise
+        return PooledClient(client, host)
+
+    @staticmethod
+    def _is_alive(pooled: PooledClient) -> bool:
+        try:
+            pooled.client.execute('SELECT 1')
+        except (Error, EOFError) as ex:
+            logger.warning(f'Clickhouse health check on {pooled.host} failed. {ex}')
+            return False
+        return True
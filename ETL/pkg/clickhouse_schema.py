@@ -0,0 +1,205 @@
+import logging
+import time
+from datetime import datetime
+from typing import List
+
+from clickhouse_driver import Client
+
+from pkg.view_events import ANONYMOUS_USER_ID
+from core import config
+
+logger = logging.getLogger(__name__)
+
+AUTH_VIEWS_TOPIC = 'auth_views_labels'
+UNAUTH_VIEWS_TOPIC = 'unauth_views_labels'
+
+# watch position text of the raw views table, for tables storing position_ms only
+POSITION_TEXT = ("concat(formatDateTime(toDateTime(intDiv(position_ms, 1000), 'UTC'), '%H:%M:%S'), '.', "
+                 "substring(toString(1000 + position_ms % 1000), 2), '000')")
+
+# Typed views layout, rows of a film/user pair are stored together and sorted by time,
+# so codecs see slowly changing neighbours and position ranges can be filtered.
+VIEWS_V2_TABLES = [
+    """CREATE TABLE IF NOT EXISTS {shard_db}.{table} (
+        event_time DateTime DEFAULT now() CODEC(DoubleDelta, LZ4),
+        film_id UUID,
+        user_id UUID CODEC(ZSTD(1)),
+        position_ms UInt32 CODEC(Delta, ZSTD(1)),
+        marks UInt32 DEFAULT 1 CODEC(T64, LZ4),
+        topic LowCardinality(String),
+        authorized UInt8 MATERIALIZED user_id != toUUID('{anonymous_user_id}') CODEC(T64, LZ4),
+        timestamp String ALIAS {position_text}
+    ) ENGINE = ReplicatedMergeTree('/clickhouse/tables/{{shard}}/{table}', '{{replica}}')
+    PARTITION BY toYYYYMM(event_time) ORDER BY (film_id, user_id, event_time)""",
+]
+
+VIEWS_V2_DISTRIBUTED = [
+    """CREATE TABLE IF NOT EXISTS {database}.{table} AS {shard_db}.{table}
+    ENGINE = Distributed('company_cluster', '', {table}, CRC32(toString(film_id)))""",
+]
+
+# Copies one daily partition of the raw views table, rows inserted with the 'rows' mode have no position_ms
+# and topic, both are restored from the timestamp string and the user id.
+VIEWS_V2_BACKFILL = f"""INSERT INTO {{database}}.{{table}} (event_time, film_id, user_id, position_ms, marks, topic)
+    SELECT event_time, film_id, user_id,
+        if(position_ms > 0, position_ms, toUInt32(
+            toUInt32OrZero(splitByChar(':', timestamp)[1]) * 3600000
+            + toUInt32OrZero(splitByChar(':', timestamp)[2]) * 60000
+            + round(toFloat64OrZero(splitByChar(':', timestamp)[3]) * 1000))),
+        marks,
+        if(user_id = toUUID('{ANONYMOUS_USER_ID}'), '{UNAUTH_VIEWS_TOPIC}', '{AUTH_VIEWS_TOPIC}')
+    FROM {{shard_db}}.{{source}} WHERE toYYYYMMDD(event_time) = %(partition)s AND event_time < %(before)s"""
+
+# Rollups are kept next to the raw rows of every shard: the materialized views fire on
+# inserts into the shard tables, the distributed tables gather them for reads.
+# Rollup tables also get a replica in the replica database of the second replica of every
+# shard, filled by replication only: views on both replicas would count every row twice.
+# Statements are also listed in clickhouse/clickhouse.ddl.
+ROLLUP_TABLES = [
+    # watch marks and unique viewers per film per day
+    """CREATE TABLE IF NOT EXISTS {shard_db}.{table}_film_daily (
+        day Date,
+        film_id UUID,
+        marks SimpleAggregateFunction(sum, UInt64),
+        viewers AggregateFunction(uniq, UUID)
+    ) ENGINE = ReplicatedAggregatingMergeTree('/clickhouse/tables/{{shard}}/{table}_film_daily', '{{replica}}')
+    PARTITION BY toYYYYMM(day) ORDER BY (film_id, day)""",
+    # latest watch position of every authorized user per film, for "continue watching"
+    """CREATE TABLE IF NOT EXISTS {shard_db}.{table}_latest_position (
+        user_id UUID,
+        film_id UUID,
+        event_time DateTime,
+        position_ms UInt32,
+        timestamp String
+    ) ENGINE = ReplicatedReplacingMergeTree('/clickhouse/tables/{{shard}}/{table}_latest_position', '{{replica}}',
+                                            event_time)
+    ORDER BY (user_id, film_id)""",
+]
+
+ROLLUP_VIEWS = [
+    """CREATE MATERIALIZED VIEW IF NOT EXISTS {shard_db}.{table}_film_daily_mv TO {shard_db}.{table}_film_daily
+    AS {film_daily_select}""",
+    """CREATE MATERIALIZED VIEW IF NOT EXISTS {shard_db}.{table}_latest_position_mv
+    TO {shard_db}.{table}_latest_position
+    AS {latest_position_select}""",
+]
+
+ROLLUP_DISTRIBUTED = [
+    """CREATE TABLE IF NOT EXISTS {database}.{table}_film_daily AS {shard_db}.{table}_film_daily
+    ENGINE = Distributed('company_cluster', '', {table}_film_daily, CRC32(toString(film_id)))""",
+    """CREATE TABLE IF NOT EXISTS {database}.{table}_latest_position AS {shard_db}.{table}_latest_position
+    ENGINE = Distributed('company_cluster', '', {table}_latest_position, CRC32(toString(film_id)))""",
+]
+
+ROLLUP_BACKFILL = [
+    "INSERT INTO {shard_db}.{table}_film_daily {film_daily_select}",
+    "INSERT INTO {shard_db}.{table}_latest_position {latest_position_select}",
+]
+
+FILM_DAILY_SELECT = """SELECT toDate(event_time) AS day, film_id, sum(toUInt64(marks)) AS marks, uniqState(user_id) AS viewers
+    FROM {shard_db}.{table} GROUP BY day, film_id"""
+
+LATEST_POSITION_SELECT = f"""SELECT user_id, film_id, event_time, position_ms, {{timestamp}} AS timestamp
+    FROM {{shard_db}}.{{table}} WHERE user_id != toUUID('{ANONYMOUS_USER_ID}')"""
+
+
+def render(statements: List[str], table: str, typed: bool = False, **names) -> List[str]:
+    """Fill in table names, typed tables have no timestamp column to read the position text from."""
+    names = {
+        'database': config.CLICKHOUSE_DATABASE,
+        'shard_db': config.CLICKHOUSE_SHARD_DATABASE,
+        'table': table,
+        'timestamp': POSITION_TEXT if typed else 'timestamp',
+        'position_text': POSITION_TEXT,
+        'anonymous_user_id': ANONYMOUS_USER_ID,
+        **names,
+    }
+    selects = {
+        'film_daily_select': FILM_DAILY_SELECT.format(**names),
+        'latest_position_select': LATEST_POSITION_SELECT.format(**names),
+    }
+    return [statement.format(**names, **selects) for statement in statements]
+
+
+def execute_on_hosts(hosts: List[str], statements: List[str], params: dict = None, settings: dict = None):
+    """Run the statements on the hosts, one node after another."""
+    for host in hosts:
+        client = Client(host=host, user=config.CLICKHOUSE_USER, password=config.CLICKHOUSE_PASSWORD)
+        try:
+            for statement in statements:
+                client.execute(statement, params, settings=settings)
+        finally:
+            client.disconnect()
+        logger.info(f'{len(statements)} statement(s) applied on {host}.')
+
+
+def execute_on_shards(statements: List[str], params: dict = None, settings: dict = None):
+    """Run the statements on the first replica of every shard."""
+    execute_on_hosts(config.CLICKHOUSE_SHARD_HOSTS, statements, params, settings)
+
+
+def create_replicated_tables(statements: List[str], table: str, typed: bool = False):
+    """Create Replicated* tables on every replica of every shard, {shard} and {replica} come from the node macros."""
+    statements = ['CREATE DATABASE IF NOT EXISTS {shard_db}', *statements]
+    execute_on_shards(render(statements, table, typed))
+    execute_on_hosts(
+        config.CLICKHOUSE_REPLICA_HOSTS,
+        render(statements, table, typed, shard_db=config.CLICKHOUSE_REPLICA_DATABASE),
+    )
+
+
+def create_rollups(table: str = None, backfill: bool = False, typed: bool = None):
+    """Create rollup tables and materialized views on the raw views table.
+
+    Backfill aggregates the rows already in the table, run it only together with
+    the first creation of the views, otherwise rows are counted twice.
+    """
+    table = table or config.CLICKHOUSE_TABLE
+    if typed is None:
+        typed = config.CLICKHOUSE_INSERT_MODE == 'typed'
+    create_replicated_tables(ROLLUP_TABLES, table, typed)
+    if backfill:
+        execute_on_shards(render(ROLLUP_BACKFILL, table, typed))
+    execute_on_shards(render(ROLLUP_VIEWS + ROLLUP_DISTRIBUTED, table, typed))
+
+
+def create_views_v2(table: str):
+    create_replicated_tables(VIEWS_V2_TABLES, table)
+    execute_on_shards(render(VIEWS_V2_DISTRIBUTED, table))
+
+
+def backfill_views_v2(source: str, table: str, before: datetime = None, partitions: List[str] = None,
+                      skip_partitions: int = 0):
+    """Copy the raw views table into the typed one partition by partition.
+
+    Only rows older than `before` are copied, pass the time the ETL switched to the typed table.
+
+    Rows go through the distributed table, so they land on the shard owning the film
+    whatever shard they were written to. A partition copied twice is copied twice,
+    restart an interrupted backfill with the partitions it has not finished.
+    """
+    # One cutoff for every shard and partition, rows arriving during the backfill are left to the ETL.
+    before = before or datetime.now()
+    for host in config.CLICKHOUSE_SHARD_HOSTS:
+        client = Client(host=host, user=config.CLICKHOUSE_USER, password=config.CLICKHOUSE_PASSWORD)
+        try:
+            found = [
+                partition for partition, in client.execute(
+                    'SELECT DISTINCT partition FROM system.parts '
+                    'WHERE database = %(database)s AND table = %(table)s AND active ORDER BY partition',
+                    {'database': config.CLICKHOUSE_SHARD_DATABASE, 'table': source},
+                )
+                if partitions is None or partition in partitions
+            ][skip_partitions:]
+            statement, = render([VIEWS_V2_BACKFILL], table, source=source)
+            for number, partition in enumerate(found, start=1):
+                started = time.monotonic()
+                client.execute(
+                    statement,
+                    {'partition': int(partition), 'before': before},
+                    settings={'insert_distributed_sync': 1},
+                )
+                logger.info(f'{host}: partition {partition} copied into {table} in {time.monotonic() - started:0.1f}s '
+                            f'({number}/{len(found)}).')
+        finally:
+            client.disconnect()
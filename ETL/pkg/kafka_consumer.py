@@ -1,5 +1,6 @@
 import logging
 import backoff
+from aiokafka import AIOKafkaConsumer
 from kafka import KafkaConsumer
 from kafka.errors import NoBrokersAvailable, KafkaError
 from core.req_handler import create_backoff_hdlr
@@ -29,11 +30,10 @@ class KafkaConsumerClient:
         max_tries = 100,
         on_backoff=back_off_hdlr,
     )
-    def create_consumer(self):
+    def create_consumer(self, listener=None, partitions=None):
         try:
             logger.info('Trying to connect to kafka')
             consumer = KafkaConsumer(
-                *self.topics,
                 auto_offset_reset=self.auto_offset_reset,
                 enable_auto_commit=self.enable_auto_commit,
                 bootstrap_servers=self.bootstrap_servers,
@@ -45,8 +45,69 @@ class KafkaConsumerClient:
                 heartbeat_interval_ms=self.heartbeat_interval_ms,
                 api_version_auto_timeout_ms=self.api_version_auto_timeout_ms
             )
+            if partitions is not None:
+                consumer.assign(partitions)
+            else:
+                consumer.subscribe(self.topics, listener=listener)
             logger.info('Successful connection to kafka')
             return consumer
         except Exception as ex:
             logger.error(f'Error connecting to kafka')
             raise NoBrokersAvailable
+
+    @backoff.on_exception(
+        backoff.fibo,
+        exception=(KafkaError, NoBrokersAvailable),
+        max_time=60,
+        max_tries=100,
+        on_backoff=back_off_hdlr,
+    )
+    def create_replay_consumer(self, max_poll_records: int = 500):
+        """Consumer outside of any group: it neither joins the group nor commits offsets."""
+        try:
+            logger.info('Trying to connect to kafka')
+            consumer = KafkaConsumer(
+                group_id=None,
+                enable_auto_commit=False,
+                bootstrap_servers=self.bootstrap_servers,
+                max_poll_records=max_poll_records,
+                retry_backoff_ms=self.retry_backoff_ms,
+                reconnect_backoff_ms=self.reconnect_backoff_ms,
+                reconnect_backoff_max_ms=self.reconnect_backoff_max_ms,
+                api_version_auto_timeout_ms=self.api_version_auto_timeout_ms
+            )
+            logger.info('Successful connection to kafka')
+            return consumer
+        except Exception as ex:
+            logger.error(f'Error connecting to kafka {ex}')
+            raise NoBrokersAvailable
+
+    @backoff.on_exception(
+        backoff.fibo,
+        exception=(KafkaError, NoBrokersAvailable),
+        max_time=60,
+        max_tries=100,
+        on_backoff=back_off_hdlr,
+    )
+    async def create_async_consumer(self, listener=None, partitions=None):
+        consumer = AIOKafkaConsumer(
+            auto_offset_reset=self.auto_offset_reset,
+            enable_auto_commit=False,
+            bootstrap_servers=self.bootstrap_servers,
+            group_id=self.group_id,
+            retry_backoff_ms=self.retry_backoff_ms,
+            heartbeat_interval_ms=self.heartbeat_interval_ms,
+        )
+        if partitions is not None:
+            consumer.assign(partitions)
+        else:
+            consumer.subscribe(self.topics, listener=listener)
+        try:
+            logger.info('Trying to connect to kafka')
+            await consumer.start()
+        except Exception as ex:
+            logger.error(f'Error connecting to kafka {ex}')
+            await consumer.stop()
+            raise NoBrokersAvailable
+        logger.info('Successful connection to kafka')
+        return consumer
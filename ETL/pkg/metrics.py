@@ -0,0 +1,83 @@
+import logging
+import multiprocessing
+import time
+from typing import Dict
+
+from kafka.structs import TopicPartition
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from core import config
+
+logger = logging.getLogger(__name__)
+
+# Every worker process serves its own metrics on ETL_METRICS_PORT + worker number.
+BATCH_ROWS = Histogram(
+    'etl_batch_rows', 'Rows in a batch handed over to clickhouse, before compaction',
+    buckets=(10, 50, 100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000),
+)
+BATCH_BYTES = Histogram(
+    'etl_batch_bytes', 'Kafka message bytes in a batch handed over to clickhouse',
+    buckets=(1 << 10, 1 << 13, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24, 1 << 26),
+)
+FLUSH_SECONDS = Histogram(
+    'etl_flush_seconds', 'Time to write a batch, retries and backoff included',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+ROWS_FLUSHED = Counter('etl_rows_flushed', 'Rows written to clickhouse or the spill queue')
+INSERT_ERRORS = Counter('etl_insert_errors', 'Failed clickhouse insert attempts', ['error'])
+DEAD_LETTER_ROWS = Counter('etl_dead_letter_rows', 'Rows of batches clickhouse rejected, moved aside and committed')
+BACKOFF_SECONDS = Counter('etl_backoff_seconds', 'Time spent waiting before clickhouse insert retries')
+BUFFERED_ROWS = Gauge('etl_buffered_rows', 'Rows consumed but not written and committed yet')
+CONSUMER_LAG = Gauge(
+    'etl_consumer_lag', 'Messages between the committed offset and the end of the partition',
+    ['topic', 'partition'],
+)
+
+
+def start_metrics_server():
+    if not config.ETL_METRICS_PORT:
+        return
+    # Worker processes are started with a '-<number>' suffixed name, see ETLSupervisor.
+    name = multiprocessing.current_process().name
+    number = int(name.rsplit('-', 1)[1]) if name.startswith('etl-worker-') else 0
+    port = config.ETL_METRICS_PORT + number
+    start_http_server(port)
+    logger.info(f'Metrics are served on port {port}.')
+
+
+def observe_batch(rows: int, size_bytes: int, flush_sec: float):
+    BATCH_ROWS.observe(rows)
+    BATCH_BYTES.observe(size_bytes)
+    FLUSH_SECONDS.observe(flush_sec)
+    ROWS_FLUSHED.inc(rows)
+
+
+def on_backoff(details: dict):
+    BACKOFF_SECONDS.inc(details['wait'])
+
+
+class LagReporter:
+    """Updates the lag gauges at most once per ETL_METRICS_LAG_INTERVAL_SEC."""
+
+    def __init__(self):
+        self.reported_at = 0.0
+        self.partitions = set()
+
+    def is_due(self) -> bool:
+        return bool(config.ETL_METRICS_PORT) and \
+            time.monotonic() - self.reported_at >= config.ETL_METRICS_LAG_INTERVAL_SEC
+
+    def report(self, highwaters: Dict[TopicPartition, int], offsets: Dict[TopicPartition, int]):
+        """Set lags of the partitions with a known end and committed (or consumed) offset."""
+        self.reported_at = time.monotonic()
+        reported = set()
+        for partition, highwater in highwaters.items():
+            offset = offsets.get(partition)
+            if highwater is None or offset is None:
+                continue
+            CONSUMER_LAG.labels(partition.topic, partition.partition).set(max(highwater - offset, 0))
+            reported.add(partition)
+        # Revoked partitions are reported by their new owner.
+        for partition in self.partitions - reported:
+            CONSUMER_LAG.remove(partition.topic, partition.partition)
+        self.partitions = reported
@@ -0,0 +1,248 @@
+import logging
+import mmap
+import os
+import pickle
+import struct
+import time
+from typing import Callable, List, Optional
+
+from pkg.clickhouse_pool import is_data_error
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct('>I')
+SEGMENT_SUFFIX = '.seg'
+CURSOR_FILE = 'cursor'
+
+
+class SpillQueue:
+    """Batches kept in append-only segment files, read back in the order they were written.
+
+    A record is a 4-byte length followed by the pickled rows. The position of the
+    oldest unread record is stored in the cursor file, fully read segments are removed.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+        # bytes of the segment files, read records of the oldest one included
+        self.size_bytes = sum(os.path.getsize(self._path(name)) for name in self.segments)
+        self.writer = None
+        self.reader = None
+        self.reader_segment = None
+        self.read_position = 0
+        self._load_cursor()
+        if self.segments:
+            logger.warning(f'Spill queue in {directory} holds {len(self.segments)} segment(s) to replay.')
+
+    def is_empty(self) -> bool:
+        return not self.segments
+
+    def append(self, rows: list):
+        payload = pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.writer is None or self.writer.tell() >= self.segment_max_bytes:
+            self._open_segment()
+        self.writer.write(RECORD_HEADER.pack(len(payload)))
+        self.writer.write(payload)
+        self.size_bytes += RECORD_HEADER.size + len(payload)
+        self.writer.flush()
+        # The batch offsets are committed to kafka right after, it has to be on disk by then.
+        os.fsync(self.writer.fileno())
+
+    def peek(self) -> Optional[list]:
+        """Return the oldest batch without removing it."""
+        while self.segments:
+            view = self._map_oldest()
+            if view is not None and self.read_position + RECORD_HEADER.size <= len(view):
+                size, = RECORD_HEADER.unpack_from(view, self.read_position)
+                start = self.read_position + RECORD_HEADER.size
+                if start + size <= len(view):
+                    return pickle.loads(view[start:start + size])
+                logger.error(f'Spill segment {self.segments[0]} ends with a truncated record.')
+            if self._is_writing(self.segments[0]):
+                return None
+            self._remove_oldest()
+        return None
+
+    def pop(self):
+        """Drop the batch returned by the last peek."""
+        size, = RECORD_HEADER.unpack_from(self.reader, self.read_position)
+        self.read_position += RECORD_HEADER.size + size
+        if self.read_position >= len(self.reader) and not self._is_writing(self.segments[0]):
+            self._remove_oldest()
+            return
+        if self.read_position >= len(self.reader) and self.writer.tell() == self.read_position:
+            # Everything written so far has been read, start over with a new segment.
+            self.writer.close()
+            self.writer = None
+            self._remove_oldest()
+            return
+        self._save_cursor()
+
+    def close(self):
+        self._close_reader()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def _is_writing(self, segment: str) -> bool:
+        return self.writer is not None and self.segments[-1] == segment
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _open_segment(self):
+        if self.writer is not None:
+            self.writer.close()
+        name = f'{time.time_ns():020d}{SEGMENT_SUFFIX}'
+        self.writer = open(self._path(name), 'ab')
+        self.segments.append(name)
+
+    def _map_oldest(self) -> Optional[mmap.mmap]:
+        segment = self.segments[0]
+        if self.reader_segment != segment:
+            self._close_reader()
+            self.reader_segment = segment
+        size = os.path.getsize(self._path(segment))
+        if self.reader is None or len(self.reader) < size:
+            # The segment being written grows, map it again to see new records.
+            self._close_reader(keep_segment=True)
+            if not size:
+                return None
+            with open(self._path(segment), 'rb') as segment_file:
+                self.reader = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.reader
+
+    def _close_reader(self, keep_segment: bool = False):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        if not keep_segment:
+            self.reader_segment = None
+
+    def _remove_oldest(self):
+        self._close_reader()
+        path = self._path(self.segments.pop(0))
+        self.size_bytes -= os.path.getsize(path)
+        os.remove(path)
+        self.read_position = 0
+        self._save_cursor()
+
+    def _load_cursor(self):
+        try:
+            with open(self._path(CURSOR_FILE)) as cursor:
+                segment, position = cursor.read().split()
+        except (FileNotFoundError, ValueError):
+            return
+        if self.segments and self.segments[0] == segment:
+            self.read_position = int(position)
+
+    def _save_cursor(self):
+        tmp_path = self._path(f'{CURSOR_FILE}.tmp')
+        with open(tmp_path, 'w') as cursor:
+            cursor.write(f'{self.segments[0] if self.segments else "-"} {self.read_position}')
+        os.replace(tmp_path, self._path(CURSOR_FILE))
+
+
+class SpillQueueFull(Exception):
+    """Clickhouse is unavailable and the spill queue has no room left, the batch is not written."""
+
+
+class SpillingWriter:
+    """Writes batches to clickhouse and parks them in the spill queue while it is unavailable.
+
+    The first failed insert is not retried, the batch goes to the queue right away, unless
+    clickhouse refuses its values: that error is raised, the caller decides on the batch.
+    Spilled batches are replayed by replay(), called for every written batch and
+    periodically by the runners, and drained on close as far as clickhouse takes them.
+    """
+
+    def __init__(self, clickhouse, spill: SpillQueue, retry_interval_sec: float, replay_batches: int,
+                 max_bytes: int = 0, max_attempts: int = 1, on_reject: Callable[[list, Exception], None] = None,
+                 drain_timeout_sec: float = 0):
+        self.clickhouse = clickhouse
+        self.spill = spill
+        self.retry_interval_sec = retry_interval_sec
+        self.replay_batches = replay_batches
+        self.max_bytes = max_bytes
+        self.max_attempts = max_attempts
+        self.on_reject = on_reject
+        self.drain_timeout_sec = drain_timeout_sec
+        self.next_retry = 0.0
+        # failed replays of the oldest spilled batch in a row
+        self.head_attempts = 0
+
+    def write(self, rows: List[tuple]):
+        if self.spill.is_empty():
+            try:
+                self.clickhouse.insert(rows)
+                return
+            except Exception as ex:
+                if is_data_error(ex):
+                    raise
+                logger.error(f'Clickhouse does not take batches, spilling them to disk. {ex}')
+                self.next_retry = time.monotonic() + self.retry_interval_sec
+        if self.max_bytes and self.spill.size_bytes >= self.max_bytes:
+            raise SpillQueueFull(f'Spill queue in {self.spill.directory} holds {self.spill.size_bytes} bytes.')
+        # Newer batches go behind the spilled ones to keep the insert order.
+        self.spill.append(rows)
+        if self.is_replay_due():
+            self.replay()
+
+    def is_replay_due(self) -> bool:
+        return not self.spill.is_empty() and time.monotonic() >= self.next_retry
+
+    def replay(self, batches: Optional[int] = None, deadline: Optional[float] = None):
+        """Move up to replay_batches spilled batches into clickhouse, oldest first.
+
+        A batch clickhouse refuses the values of max_attempts times in a row is handed to
+        on_reject and dropped from the queue, so it does not hold back the ones behind it.
+        Other errors leave the queue as it is until the next retry.
+        """
+        for _ in range(batches or self.replay_batches):
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            rows = self.spill.peek()
+            if rows is None:
+                logger.info('Spill queue has been drained.')
+                return
+            try:
+                self.clickhouse.insert(rows)
+            except Exception as ex:
+                if not is_data_error(ex):
+                    logger.error(f'Spilled batch replay failed, next try in {self.retry_interval_sec}s. {ex}')
+                    self.next_retry = time.monotonic() + self.retry_interval_sec
+                    return
+                self.head_attempts += 1
+                if self.head_attempts < self.max_attempts:
+                    logger.error(f'Spilled batch rejected by clickhouse, attempt {self.head_attempts} '
+                                 f'of {self.max_attempts}, next try in {self.retry_interval_sec}s. {ex}')
+                    self.next_retry = time.monotonic() + self.retry_interval_sec
+                    return
+                if self.on_reject is None:
+                    logger.error(f'Spilled batch of {len(rows)} row(s) rejected by clickhouse, it is kept '
+                                 f'at the head of the queue. {ex}')
+                    self.next_retry = time.monotonic() + self.retry_interval_sec
+                    return
+                self.on_reject(rows, ex)
+            self.head_attempts = 0
+            self.spill.pop()
+
+    def close(self):
+        try:
+            self.drain()
+        finally:
+            self.spill.close()
+
+    def drain(self):
+        if self.drain_timeout_sec and not self.spill.is_empty():
+            logger.info(f'Draining the spill queue for up to {self.drain_timeout_sec}s.')
+            deadline = time.monotonic() + self.drain_timeout_sec
+            while not self.spill.is_empty() and time.monotonic() < deadline:
+                self.next_retry = 0.0
+                self.replay(deadline=deadline)
+                if time.monotonic() < self.next_retry:
+                    # clickhouse is still unavailable, the queue is replayed after restart
+                    break
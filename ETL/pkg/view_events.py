@@ -0,0 +1,67 @@
+import time
+from collections import Counter
+from typing import Iterable, List, NamedTuple, Sequence
+from uuid import UUID
+
+ANONYMOUS_USER_ID = UUID('00000000-0000-0000-0000-000000000000')
+
+
+class ViewEvent(NamedTuple):
+    film_id: UUID
+    user_id: UUID
+    timestamp: str
+    position_ms: int
+    # number of watch marks this event stands for, see compact()
+    marks: int = 1
+    topic: str = ''
+    # unix time of the kafka message, seconds
+    event_time: int = 0
+
+
+def position_to_ms(timestamp: str) -> int:
+    """Convert watch position in 'HH:MM:SS[.ffffff]' format into milliseconds."""
+    hours, minutes, seconds = timestamp.split(':')
+    return (int(hours) * 3600 + int(minutes) * 60) * 1000 + round(float(seconds) * 1000)
+
+
+def parse_view_event(key: bytes, value: bytes, topic: str = '', timestamp_ms: int = -1) -> ViewEvent:
+    """Build an event from the '<film_id>_<user_id>' message key and the position value."""
+    film_id, user_id = key.split(b'_')
+    timestamp = value.decode('utf-8')
+    return ViewEvent(
+        film_id=UUID(film_id.decode('ascii')),
+        user_id=UUID(user_id.decode('ascii')),
+        timestamp=timestamp,
+        position_ms=position_to_ms(timestamp),
+        topic=topic,
+        # messages of the old format carry no timestamp (-1)
+        event_time=timestamp_ms // 1000 if timestamp_ms > 0 else int(time.time()),
+    )
+
+
+def to_columns(events: Sequence[ViewEvent], fields: Iterable[str] = ViewEvent._fields) -> List[tuple]:
+    """Transpose events into one tuple of values per requested ViewEvent field."""
+    if not events:
+        return [() for _ in fields]
+    columns = list(zip(*events))
+    return [columns[ViewEvent._fields.index(field)] for field in fields]
+
+
+def compact(events: Sequence[ViewEvent]) -> List[ViewEvent]:
+    """Keep the latest watch mark of every film/user pair, counting the marks it replaces.
+
+    Anonymous marks share one user id but come from different viewers, they are kept as is.
+    """
+    latest = {}
+    marks = Counter()
+    anonymous = []
+    for event in events:
+        if event.user_id == ANONYMOUS_USER_ID:
+            anonymous.append(event)
+            continue
+        pair = event[:2]
+        latest[pair] = event
+        marks[pair] += event.marks
+    compacted = [event._replace(marks=marks[pair]) for pair, event in latest.items()]
+    compacted.extend(anonymous)
+    return compacted
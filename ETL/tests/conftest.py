@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules of the ETL import each other from the ETL directory, as they do in the container.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
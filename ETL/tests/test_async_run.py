@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from clickhouse_driver.errors import ErrorCodes, ServerException
+from kafka.structs import TopicPartition
+
+from core import config
+from etl_async_run import AsyncETLProcessRunner
+from pkg.batch_writer import RejectedBatch
+
+PARTITION = TopicPartition('auth_views_labels', 0)
+KEY = b'00000000-0000-0000-0000-000000000001_00000000-0000-0000-0000-000000000002'
+
+
+class StreamExhausted(Exception):
+    """Everything in the fake topic has been committed."""
+
+
+class Message:
+    def __init__(self, offset: int):
+        self.key = KEY
+        self.value = f'00:00:{offset:02d}'.encode()
+        self.topic = PARTITION.topic
+        self.offset = offset
+        self.timestamp = 1000
+
+
+class FakeConsumer:
+    """One partition of `size` messages, fetched from the current position."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.position_ = 0
+        self.commits = []
+        self.seeks = []
+
+    async def getmany(self, timeout_ms: int, max_records: int):
+        if self.position_ >= self.size:
+            if self.commits and self.commits[-1][PARTITION] >= self.size:
+                raise StreamExhausted
+            await asyncio.sleep(timeout_ms / 1000)
+            return {}
+        end = min(self.size, self.position_ + max_records)
+        messages = [Message(offset) for offset in range(self.position_, end)]
+        self.position_ = end
+        return {PARTITION: messages}
+
+    def seek(self, partition, offset):
+        self.seeks.append(offset)
+        self.position_ = offset
+
+    async def commit(self, offsets):
+        self.commits.append(dict(offsets))
+
+    def assignment(self):
+        return {PARTITION}
+
+    def highwater(self, partition):
+        return self.size
+
+    async def position(self, partition):
+        return self.position_
+
+    async def stop(self):
+        pass
+
+
+class FakeWriter:
+    """Writes batches in the insert threads, holding or failing batches by their first offset."""
+
+    def __init__(self, delays: dict = None, failures: dict = None, error: Exception = None):
+        self.delays = delays or {}
+        self.failures = failures or {}
+        self.error = error or ServerException('replica is read only', code=ErrorCodes.TABLE_IS_READ_ONLY)
+        self.written = []
+        self.lock = threading.Lock()
+
+    def write(self, rows):
+        first = int(rows[0].timestamp.rsplit(':', 1)[1])
+        time.sleep(self.delays.get(first, 0))
+        with self.lock:
+            if self.failures.get(first):
+                self.failures[first] -= 1
+                raise self.error
+            self.written.append(first)
+
+    def is_replay_due(self):
+        return False
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def async_config(monkeypatch):
+    monkeypatch.setattr(config, 'KAFKA_BATCH_SIZE', 2)
+    monkeypatch.setattr(config, 'KAFKA_POLL_TIMEOUT_MS', 10)
+    monkeypatch.setattr(config, 'ETL_FLUSH_LINGER_SEC', 0.05)
+    monkeypatch.setattr(config, 'ETL_ASYNC_FETCH_MAX_RECORDS', 2)
+    monkeypatch.setattr(config, 'ETL_ASYNC_INSERT_CONCURRENCY', 2)
+    monkeypatch.setattr(config, 'ETL_SPILL_DIR', '')
+
+
+def run(consumer: FakeConsumer, writer: FakeWriter, error=StreamExhausted):
+    runner = AsyncETLProcessRunner()
+    runner.batch_writer = writer
+
+    async def create_async_consumer(listener=None, partitions=None):
+        return consumer
+
+    runner.kafka_consumer.create_async_consumer = create_async_consumer
+    with pytest.raises(error):
+        asyncio.run(asyncio.wait_for(runner.run(), timeout=10))
+    return runner
+
+
+def committed(consumer: FakeConsumer):
+    return [offsets[PARTITION] for offsets in consumer.commits]
+
+
+def test_batches_finishing_out_of_order_are_committed_in_order(async_config):
+    consumer = FakeConsumer(size=4)
+    # the first batch is written after the second one
+    writer = FakeWriter(delays={0: 0.2})
+
+    run(consumer, writer)
+
+    assert writer.written == [2, 0]
+    assert committed(consumer) == [4]
+
+
+def test_failed_insert_rewinds_to_the_committed_offset(async_config):
+    consumer = FakeConsumer(size=6)
+    # the second batch fails once while the third one is still being written
+    writer = FakeWriter(delays={2: 0.1, 4: 0.2}, failures={2: 1})
+
+    runner = run(consumer, writer)
+
+    assert consumer.seeks == [2]
+    assert committed(consumer)[0] == 2
+    assert committed(consumer) == sorted(committed(consumer))
+    assert committed(consumer)[-1] == 6
+    assert set(writer.written) == {0, 2, 4}
+    assert runner.pending_rows == 0
+
+
+def test_failed_first_insert_rewinds_to_the_first_fetched_offset(async_config):
+    consumer = FakeConsumer(size=4)
+    writer = FakeWriter(failures={0: 1})
+
+    run(consumer, writer)
+
+    assert consumer.seeks == [0]
+    assert committed(consumer)[-1] == 4
+    assert set(writer.written) == {0, 2}
+
+
+def test_rejected_batch_stops_the_runner(async_config):
+    consumer = FakeConsumer(size=4)
+    writer = FakeWriter(delays={2: 0.1}, failures={0: 1}, error=RejectedBatch('bad values'))
+
+    run(consumer, writer, error=RejectedBatch)
+
+    assert consumer.seeks == []
+    assert consumer.commits == []
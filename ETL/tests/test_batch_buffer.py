@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+from kafka.structs import TopicPartition
+
+from pkg.batch_buffer import BackgroundFlusher, Batch, BatchBuffer
+
+PARTITION = TopicPartition('auth_views_labels', 0)
+
+
+def test_buffer_is_full_on_rows():
+    buffer = BatchBuffer(max_rows=2, max_bytes=1000, linger_sec=60)
+    buffer.append('a', size=1, partition=PARTITION, offset=0)
+    assert not buffer.is_full()
+    buffer.append('b', size=1, partition=PARTITION, offset=1)
+    assert buffer.is_full()
+
+
+def test_buffer_is_full_on_bytes():
+    buffer = BatchBuffer(max_rows=100, max_bytes=10, linger_sec=60)
+    buffer.append('a', size=6, partition=PARTITION, offset=0)
+    assert not buffer.is_full()
+    buffer.append('b', size=4, partition=PARTITION, offset=1)
+    assert buffer.is_full()
+
+
+def test_buffer_expires_after_linger():
+    buffer = BatchBuffer(max_rows=100, max_bytes=1000, linger_sec=0.05)
+    assert not buffer.is_expired()
+    assert buffer.linger_left_ms(1000) == 1000
+    buffer.append('a', size=1, partition=PARTITION, offset=0)
+    assert not buffer.is_expired()
+    assert 0 < buffer.linger_left_ms(1000) <= 50
+    time.sleep(0.06)
+    assert buffer.is_expired()
+    assert buffer.linger_left_ms(1000) == 0
+
+
+def test_buffer_tracks_offsets_of_skipped_messages():
+    other = TopicPartition('unauth_views_labels', 3)
+    buffer = BatchBuffer(max_rows=100, max_bytes=1000, linger_sec=60)
+    buffer.append('a', size=1, partition=PARTITION, offset=10)
+    buffer.track(PARTITION, 11)
+    buffer.append('b', size=1, partition=other, offset=5)
+
+    batch = buffer.swap()
+
+    assert batch.rows == ['a', 'b']
+    assert batch.start_offsets == {PARTITION: 10, other: 5}
+    assert batch.end_offsets == {PARTITION: 12, other: 6}
+    assert len(buffer) == 0
+    assert not buffer.is_expired()
+
+
+def test_flusher_writes_in_background():
+    written = []
+    release = threading.Event()
+
+    def insert(rows):
+        release.wait(1)
+        written.append(rows)
+
+    flusher = BackgroundFlusher(insert_func=insert)
+    flusher.submit(Batch(rows=['a']))
+    assert flusher.collect() is None
+    with pytest.raises(RuntimeError):
+        flusher.submit(Batch(rows=['b']))
+
+    release.set()
+    batch = flusher.wait()
+    flusher.close()
+
+    assert batch.rows == ['a'] and batch.error is None
+    assert written == [['a']]
+    assert flusher.wait() is None
+
+
+def test_flusher_returns_failed_batch():
+    error = ValueError('rejected')
+
+    def insert(rows):
+        raise error
+
+    flusher = BackgroundFlusher(insert_func=insert)
+    flusher.submit(Batch(rows=['a']))
+    batch = flusher.wait()
+    flusher.close()
+
+    assert batch.error is error
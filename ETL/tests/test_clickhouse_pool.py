@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+from clickhouse_driver.errors import NetworkError, ServerException
+
+from pkg import clickhouse_pool
+from pkg.clickhouse_pool import ClickHousePool
+
+
+class FakeClient:
+    def __init__(self, host, **kwargs):
+        self.host = host
+        self.alive = True
+        self.disconnected = False
+
+    def execute(self, query):
+        if not self.alive:
+            raise NetworkError('connection reset')
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(clickhouse_pool, 'Client', FakeClient)
+    return ClickHousePool(hosts=['node1', 'node3'], size=1, user='app', password='qwe123',
+                          health_check_interval_sec=0)
+
+
+def acquire_in_thread(pool):
+    acquired = []
+    thread = threading.Thread(target=lambda: acquired.append(pool.acquire()), daemon=True)
+    thread.start()
+    return thread, acquired
+
+
+def test_released_client_is_reused(pool):
+    pooled = pool.acquire()
+    pool.release(pooled)
+
+    assert pool.acquire() is pooled
+    assert pool.created == 1
+
+
+def test_waiter_gets_the_released_client(pool):
+    pooled = pool.acquire()
+    thread, acquired = acquire_in_thread(pool)
+    thread.join(0.1)
+    assert thread.is_alive()
+
+    pool.release(pooled)
+    thread.join(1)
+
+    assert acquired == [pooled]
+
+
+def test_waiter_opens_a_new_client_after_a_discard(pool):
+    pooled = pool.acquire()
+    thread, acquired = acquire_in_thread(pool)
+    thread.join(0.1)
+
+    pool.discard(pooled)
+    thread.join(1)
+
+    assert not thread.is_alive()
+    assert acquired[0] is not pooled
+    assert acquired[0].host == 'node3'
+    assert pool.created == 1
+
+
+def test_stale_dead_client_is_replaced(pool):
+    pooled = pool.acquire()
+    pool.release(pooled)
+    pooled.client.alive = False
+
+    fresh = pool.acquire()
+
+    assert fresh is not pooled
+    assert pooled.client.disconnected
+
+
+def test_connection_error_drops_the_client(pool):
+    with pytest.raises(NetworkError):
+        with pool.client():
+            raise NetworkError('connection reset')
+
+    assert pool.created == 0
+    assert pool.idle == []
+
+
+def test_query_error_keeps_the_client(pool):
+    with pytest.raises(ServerException):
+        with pool.client():
+            raise ServerException('unknown table')
+
+    assert pool.created == 1
+    assert len(pool.idle) == 1
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import pytest
+
+from core import config
+from pkg import clickhouse_schema
+
+SHARD_HOSTS = ['node1', 'node3', 'node5']
+REPLICA_HOSTS = ['node2', 'node4', 'node6']
+
+
+def applied_statements(monkeypatch, create):
+    applied = []
+    monkeypatch.setattr(config, 'CLICKHOUSE_SHARD_HOSTS', SHARD_HOSTS)
+    monkeypatch.setattr(config, 'CLICKHOUSE_REPLICA_HOSTS', REPLICA_HOSTS)
+    monkeypatch.setattr(config, 'CLICKHOUSE_SHARD_DATABASE', 'shard')
+    monkeypatch.setattr(config, 'CLICKHOUSE_REPLICA_DATABASE', 'replica')
+    monkeypatch.setattr(
+        clickhouse_schema, 'execute_on_hosts',
+        lambda hosts, statements, params=None, settings=None: applied.append((hosts, statements)),
+    )
+    create()
+    return applied
+
+
+def test_rollup_tables_are_created_on_every_replica(monkeypatch):
+    applied = applied_statements(monkeypatch, lambda: clickhouse_schema.create_rollups('views'))
+
+    (shard_hosts, shard_tables), (replica_hosts, replica_tables), (view_hosts, views) = applied
+    assert shard_hosts == SHARD_HOSTS
+    assert replica_hosts == REPLICA_HOSTS
+    assert shard_tables[0] == 'CREATE DATABASE IF NOT EXISTS shard'
+    assert replica_tables[0] == 'CREATE DATABASE IF NOT EXISTS replica'
+    assert all('replica.views_film_daily' in table or 'replica.views_latest_position' in table
+               for table in replica_tables[1:])
+    assert replica_tables[1:] == [table.replace('shard.', 'replica.') for table in shard_tables[1:]]
+    # materialized views fire on the first replicas only, replication brings their rows to the second ones
+    assert view_hosts == SHARD_HOSTS
+    assert any('MATERIALIZED VIEW' in view for view in views)
+
+
+def test_views_v2_tables_are_created_on_every_replica(monkeypatch):
+    applied = applied_statements(monkeypatch, lambda: clickhouse_schema.create_views_v2('views_v2'))
+
+    assert [hosts for hosts, _ in applied] == [SHARD_HOSTS, REPLICA_HOSTS, SHARD_HOSTS]
+    assert "ReplicatedMergeTree('/clickhouse/tables/{shard}/views_v2', '{replica}')" in applied[1][1][1]
+    assert 'Distributed' in applied[2][1][0]
+
+
+class FakeClient:
+    """Shard node holding the given daily partitions of the raw views table."""
+
+    partitions = {}
+    executed = []
+
+    def __init__(self, host, **kwargs):
+        self.host = host
+
+    def execute(self, query, params=None, settings=None):
+        if query.startswith('SELECT DISTINCT partition'):
+            return [(partition,) for partition in self.partitions[self.host]]
+        self.executed.append((self.host, params['partition'], params['before']))
+        return []
+
+    def disconnect(self):
+        pass
+
+
+@pytest.fixture
+def shards(monkeypatch):
+    monkeypatch.setattr(config, 'CLICKHOUSE_SHARD_HOSTS', ['node1', 'node3'])
+    monkeypatch.setattr(clickhouse_schema, 'Client', FakeClient)
+    FakeClient.partitions = {'node1': ['20220901', '20220902'], 'node3': ['20220901', '20220903']}
+    FakeClient.executed = []
+    return FakeClient.executed
+
+
+def test_backfill_copies_every_partition_once_per_shard_with_one_cutoff(shards):
+    clickhouse_schema.backfill_views_v2('views', 'views_v2')
+
+    assert [(host, partition) for host, partition, _ in shards] == [
+        ('node1', 20220901), ('node1', 20220902), ('node3', 20220901), ('node3', 20220903),
+    ]
+    assert len({before for _, _, before in shards}) == 1
+
+
+def test_backfill_resumes_with_the_requested_partitions(shards):
+    before = datetime(2022, 9, 3, 12)
+
+    clickhouse_schema.backfill_views_v2('views', 'views_v2', before=before,
+                                        partitions=['20220902', '20220903'])
+
+    assert shards == [('node1', 20220902, before), ('node3', 20220903, before)]
+
+
+def test_backfill_skips_partitions_copied_before(shards):
+    clickhouse_schema.backfill_views_v2('views', 'views_v2', skip_partitions=1)
+
+    assert [(host, partition) for host, partition, _ in shards] == [('node1', 20220902), ('node3', 20220903)]
@@ -0,0 +1,88 @@
+from uuid import uuid4
+
+from kafka.structs import OffsetAndTimestamp, TopicPartition
+
+from core import config
+from etl_replay import parse_args, plan_ranges
+from pkg.clickhouse_operate import ClickHouse
+
+TOPIC = 'auth_views_labels'
+
+
+class FakeConsumer:
+    """Partitions of one topic, each with its [beginning, end) offsets."""
+
+    def __init__(self, offsets: dict, times: dict = None):
+        self.offsets = {TopicPartition(TOPIC, number): bounds for number, bounds in offsets.items()}
+        # partition number -> offset of the first message at or after the requested time
+        self.times = times or {}
+
+    def partitions_for_topic(self, topic):
+        return {partition.partition for partition in self.offsets if partition.topic == topic}
+
+    def beginning_offsets(self, partitions):
+        return {partition: self.offsets[partition][0] for partition in partitions}
+
+    def end_offsets(self, partitions):
+        return {partition: self.offsets[partition][1] for partition in partitions}
+
+    def offsets_for_times(self, timestamps):
+        return {
+            partition: OffsetAndTimestamp(self.times[partition.partition], timestamp)
+            if partition.partition in self.times else None
+            for partition, timestamp in timestamps.items()
+        }
+
+
+def ranges(consumer, *argv):
+    return {
+        partition.partition: bounds
+        for partition, bounds in plan_ranges(consumer, parse_args(['--topics', TOPIC, *argv])).items()
+    }
+
+
+def test_whole_partitions_are_replayed_by_default():
+    consumer = FakeConsumer({0: (0, 10), 1: (5, 6)})
+
+    assert ranges(consumer) == {0: (0, 10), 1: (5, 6)}
+
+
+def test_empty_partitions_are_skipped():
+    consumer = FakeConsumer({0: (7, 7), 1: (0, 3)})
+
+    assert ranges(consumer) == {1: (0, 3)}
+
+
+def test_offsets_are_clamped_to_the_partition():
+    consumer = FakeConsumer({0: (100, 200), 1: (0, 50), 2: (60, 61)})
+
+    assert ranges(consumer, '--from-offset', '40', '--to-offset', '150') == {0: (100, 150), 1: (40, 50), 2: (60, 61)}
+
+
+def test_single_offset_range():
+    consumer = FakeConsumer({0: (0, 10)})
+
+    assert ranges(consumer, '--from-offset', '4', '--to-offset', '5') == {0: (4, 5)}
+
+
+def test_time_range_and_partition_filter():
+    consumer = FakeConsumer({0: (0, 10), 1: (0, 10), 2: (0, 10)}, times={0: 3, 1: 8})
+
+    planned = ranges(consumer, '--partitions', '0', '2', '--from-time', '2022-09-01T00:00')
+
+    # nothing at or after the time in partition 2, it starts at its end
+    assert planned == {0: (3, 10)}
+
+
+def test_shard_routing_writes_to_the_requested_shard_database(monkeypatch):
+    monkeypatch.setattr(config, 'CLICKHOUSE_INSERT_ROUTING', 'shard')
+    monkeypatch.setattr(config, 'CLICKHOUSE_SHARD_HOSTS', ['node1', 'node3'])
+    executed = []
+    monkeypatch.setattr(ClickHouse, '_execute', lambda self, pool, database, rows: executed.append(database))
+    args = parse_args(['--shard-database', 'replay_shard'])
+    clickhouse = ClickHouse(database=args.database, shard_database=args.shard_database)
+
+    clickhouse.insert([(uuid4(), uuid4(), '00:00:01') for _ in range(10)])
+
+    assert set(executed) == {'replay_shard'}
+    clickhouse.close()
@@ -0,0 +1,207 @@
+import pytest
+from clickhouse_driver.errors import ErrorCodes, NetworkError, ServerException
+from kafka.structs import TopicPartition
+
+import etl_run
+from core import config
+from pkg.batch_buffer import Batch
+from pkg.batch_writer import BatchWriter, RejectedBatch
+
+PARTITION = TopicPartition('auth_views_labels', 0)
+OTHER = TopicPartition('auth_views_labels', 1)
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.commits = []
+        self.seeks = {}
+
+    def commit(self, offsets):
+        self.commits.append({partition: meta.offset for partition, meta in offsets.items()})
+
+    def seek(self, partition, offset):
+        self.seeks[partition] = offset
+
+    def assignment(self):
+        return {PARTITION, OTHER}
+
+
+class FakeClickHouse:
+    def __init__(self, error=None):
+        self.error = error
+        self.inserts = []
+
+    def ch_insert(self, insert_values):
+        self.inserts.append(insert_values)
+        if self.error is not None:
+            raise self.error
+
+
+@pytest.fixture
+def runner():
+    runner = etl_run.ETLProcessRunner()
+    runner.consumer = FakeConsumer()
+    yield runner
+    runner.flusher.close()
+    runner.clickhouse_operate.close()
+
+
+def test_written_batch_offsets_are_committed(runner):
+    batch = Batch(rows=['a'], start_offsets={PARTITION: 5}, end_offsets={PARTITION: 7})
+
+    assert runner.on_batch_written(batch)
+
+    assert runner.consumer.commits == [{PARTITION: 7}]
+    assert runner.committed_offsets == {PARTITION: 7}
+
+
+def test_unavailable_clickhouse_rewinds_to_the_failed_batch(runner):
+    runner.buffer.append('c', size=1, partition=PARTITION, offset=9)
+    runner.buffer.append('d', size=1, partition=OTHER, offset=3)
+    failed = Batch(rows=['a', 'b'], start_offsets={PARTITION: 5}, end_offsets={PARTITION: 9},
+                   error=NetworkError('down'))
+
+    assert not runner.on_batch_written(failed)
+
+    assert runner.consumer.commits == []
+    assert runner.consumer.seeks == {PARTITION: 5, OTHER: 3}
+    assert len(runner.buffer) == 0
+
+
+def test_rejected_batch_is_not_rewound(runner):
+    failed = Batch(rows=['a'], start_offsets={PARTITION: 5}, end_offsets={PARTITION: 6},
+                   error=RejectedBatch('bad values'))
+
+    with pytest.raises(RejectedBatch):
+        runner.on_batch_written(failed)
+
+    assert runner.consumer.seeks == {}
+    assert runner.consumer.commits == []
+
+
+def test_other_errors_rewind(runner):
+    failed = Batch(rows=['a'], start_offsets={PARTITION: 5}, end_offsets={PARTITION: 6},
+                   error=ServerException('replica is read only', code=ErrorCodes.TABLE_IS_READ_ONLY))
+
+    assert not runner.on_batch_written(failed)
+
+    assert runner.consumer.seeks == {PARTITION: 5}
+
+
+@pytest.fixture
+def writer_config(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'ETL_SPILL_DIR', '')
+    monkeypatch.setattr(config, 'ETL_DEAD_LETTER_DIR', str(tmp_path))
+    monkeypatch.setattr(config, 'ETL_INSERT_MAX_ATTEMPTS', 3)
+    monkeypatch.setattr(config, 'ETL_INSERT_RETRY_DELAY_SEC', 0)
+
+
+def test_rejected_batch_is_dead_lettered_after_max_attempts(writer_config):
+    clickhouse = FakeClickHouse(error=ServerException('Cannot parse uuid', code=ErrorCodes.CANNOT_PARSE_UUID))
+    writer = BatchWriter(clickhouse)
+
+    writer.write(['a', 'b'])
+
+    assert len(clickhouse.inserts) == 3
+    assert writer.dead_letter.peek() == ['a', 'b']
+    writer.close()
+
+
+def test_rejected_batch_is_raised_without_dead_letter_queue(writer_config, monkeypatch):
+    monkeypatch.setattr(config, 'ETL_DEAD_LETTER_DIR', '')
+    clickhouse = FakeClickHouse(error=ServerException('Cannot parse uuid', code=ErrorCodes.CANNOT_PARSE_UUID))
+    writer = BatchWriter(clickhouse)
+
+    with pytest.raises(RejectedBatch):
+        writer.write(['a'])
+
+
+def test_transient_server_error_is_raised_after_max_attempts(writer_config):
+    clickhouse = FakeClickHouse(error=ServerException('Too many parts', code=ErrorCodes.TOO_MANY_PARTS))
+    writer = BatchWriter(clickhouse)
+
+    with pytest.raises(ServerException):
+        writer.write(['a'])
+
+    assert len(clickhouse.inserts) == 3
+    assert writer.dead_letter.is_empty()
+    writer.close()
+
+
+def test_connection_error_is_raised_at_once(monkeypatch):
+    monkeypatch.setattr(config, 'ETL_SPILL_DIR', '')
+    monkeypatch.setattr(config, 'ETL_DEAD_LETTER_DIR', '')
+    clickhouse = FakeClickHouse(error=NetworkError('down'))
+    writer = BatchWriter(clickhouse)
+
+    with pytest.raises(NetworkError):
+        writer.write(['a'])
+
+    assert len(clickhouse.inserts) == 1
+
+
+class Message:
+    def __init__(self, partition: TopicPartition, offset: int):
+        self.key = b'00000000-0000-0000-0000-000000000001_00000000-0000-0000-0000-000000000002'
+        self.value = b'00:00:01'
+        self.topic = partition.topic
+        self.offset = offset
+        self.timestamp = 1000
+
+
+def test_failed_flush_rewinds_partitions_not_buffered_yet(runner):
+    runner.buffer.max_rows = 2
+    runner.flusher.wait = lambda: Batch(rows=['a'], start_offsets={PARTITION: 0}, end_offsets={PARTITION: 2},
+                                        error=NetworkError('down'))
+    records = {
+        PARTITION: [Message(PARTITION, 2), Message(PARTITION, 3)],
+        OTHER: [Message(OTHER, 5), Message(OTHER, 6)],
+    }
+
+    runner.consume(records)
+
+    assert runner.consumer.seeks == {PARTITION: 0, OTHER: 5}
+    assert len(runner.buffer) == 0
+
+
+@pytest.mark.parametrize('error, drained', [(SystemExit(0), True), (RejectedBatch('bad values'), False)])
+def test_only_a_clean_stop_drains(monkeypatch, error, drained):
+    drains = []
+
+    def run(self):
+        raise error
+
+    monkeypatch.setattr(etl_run.ETLProcessRunner, 'run', run)
+    monkeypatch.setattr(etl_run.ETLProcessRunner, 'drain', lambda self: drains.append(self))
+
+    with pytest.raises(type(error)):
+        etl_run.ETLProcessRunner.start_etl()
+
+    assert bool(drains) is drained
+
+
+class FailedReplay:
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def done(self):
+        return True
+
+    def exception(self):
+        return self.error
+
+
+def test_failed_spill_replay_is_logged(runner, caplog):
+    runner.spill_replay = FailedReplay(OSError('disk is full'))
+
+    runner.replay_spill()
+
+    assert 'disk is full' in caplog.text
+    assert runner.spill_replay is None
+
+
+def test_rejected_spilled_batch_stops_the_worker(runner):
+    runner.spill_replay = FailedReplay(RejectedBatch('bad values'))
+
+    with pytest.raises(RejectedBatch):
+        runner.replay_spill()
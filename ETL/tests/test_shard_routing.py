@@ -0,0 +1,26 @@
+from uuid import uuid4
+
+from core import config
+from pkg.clickhouse_operate import ClickHouse, shard_of
+
+
+def test_shard_of_uses_the_ieee_crc32_of_clickhouse():
+    # CRC32('123456789') is the 0xCBF43926 check value of the IEEE polynomial ClickHouse uses.
+    assert shard_of('123456789', 1000) == 0xCBF43926 % 1000
+    assert all(0 <= shard_of(uuid4(), 3) < 3 for _ in range(100))
+
+
+def test_rows_are_split_by_the_shard_of_their_film(monkeypatch):
+    monkeypatch.setattr(config, 'CLICKHOUSE_INSERT_ROUTING', 'shard')
+    monkeypatch.setattr(config, 'CLICKHOUSE_SHARD_HOSTS', ['node1', 'node3', 'node5'])
+    clickhouse = ClickHouse()
+    rows = [(uuid4(), uuid4(), '00:00:01') for _ in range(50)]
+    rows.append((rows[0][0], uuid4(), '00:00:02'))
+
+    shards = clickhouse.split_by_shard(rows)
+
+    assert set(shards) <= {0, 1, 2}
+    assert sorted(row for shard_rows in shards.values() for row in shard_rows) == sorted(rows)
+    for shard, shard_rows in shards.items():
+        assert all(shard_of(row[0], 3) == shard for row in shard_rows)
+    clickhouse.close()
@@ -0,0 +1,146 @@
+import pytest
+from clickhouse_driver.errors import ErrorCodes, NetworkError, ServerException
+
+from pkg.spill_queue import SpillingWriter, SpillQueue, SpillQueueFull
+
+
+class FakeClickHouse:
+    def __init__(self):
+        self.errors = []
+        self.inserted = []
+
+    def insert(self, rows):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.inserted.append(rows)
+
+
+@pytest.fixture
+def spill(tmp_path):
+    spill = SpillQueue(str(tmp_path), segment_max_bytes=64)
+    yield spill
+    spill.close()
+
+
+def drain(spill):
+    batches = []
+    while (rows := spill.peek()) is not None:
+        batches.append(rows)
+        spill.pop()
+    return batches
+
+
+def test_batches_are_read_in_write_order_across_segments(spill):
+    batches = [[('row', number)] * 3 for number in range(5)]
+    for rows in batches:
+        spill.append(rows)
+
+    assert len(spill.segments) > 1
+    assert drain(spill) == batches
+    assert spill.is_empty()
+    assert spill.size_bytes == 0
+
+
+def test_unread_batches_survive_reopen(tmp_path):
+    spill = SpillQueue(str(tmp_path), segment_max_bytes=1024)
+    for number in range(3):
+        spill.append([number])
+    spill.peek()
+    spill.pop()
+    size_bytes = spill.size_bytes
+    spill.close()
+
+    reopened = SpillQueue(str(tmp_path), segment_max_bytes=1024)
+
+    assert reopened.size_bytes == size_bytes
+    assert drain(reopened) == [[1], [2]]
+    reopened.close()
+
+
+def test_batches_are_spilled_while_clickhouse_is_unavailable(spill):
+    clickhouse = FakeClickHouse()
+    clickhouse.errors = [NetworkError('down')]
+    writer = SpillingWriter(clickhouse, spill, retry_interval_sec=60, replay_batches=10)
+
+    writer.write([1])
+    writer.write([2])
+
+    assert clickhouse.inserted == []
+    assert not writer.is_replay_due()
+
+    writer.replay()
+
+    assert clickhouse.inserted == [[1], [2]]
+    assert spill.is_empty()
+
+
+def test_batches_are_spilled_while_a_replica_is_read_only(spill):
+    clickhouse = FakeClickHouse()
+    clickhouse.errors = [ServerException('read only', code=ErrorCodes.TABLE_IS_READ_ONLY)]
+    writer = SpillingWriter(clickhouse, spill, retry_interval_sec=60, replay_batches=10)
+
+    writer.write([1])
+
+    assert spill.peek() == [1]
+
+
+def test_refused_values_are_not_spilled(spill):
+    clickhouse = FakeClickHouse()
+    clickhouse.errors = [ServerException('bad row', code=ErrorCodes.CANNOT_PARSE_TEXT)]
+    writer = SpillingWriter(clickhouse, spill, retry_interval_sec=60, replay_batches=10)
+
+    with pytest.raises(ServerException):
+        writer.write([1])
+
+    assert spill.is_empty()
+
+
+def test_rejected_spilled_batch_is_kept_without_on_reject(spill):
+    clickhouse = FakeClickHouse()
+    writer = SpillingWriter(clickhouse, spill, retry_interval_sec=0, replay_batches=10)
+    spill.append([1])
+    clickhouse.errors = [ServerException('bad row', code=ErrorCodes.CANNOT_PARSE_TEXT)]
+
+    writer.replay()
+
+    assert spill.peek() == [1]
+
+
+def test_full_spill_queue_refuses_batches(spill):
+    clickhouse = FakeClickHouse()
+    clickhouse.errors = [NetworkError('down')]
+    writer = SpillingWriter(clickhouse, spill, retry_interval_sec=60, replay_batches=10, max_bytes=1)
+    writer.write([1])
+
+    with pytest.raises(SpillQueueFull):
+        writer.write([2])
+
+
+def test_rejected_spilled_batch_is_handed_over_and_dropped(spill):
+    clickhouse = FakeClickHouse()
+    rejected = []
+    writer = SpillingWriter(clickhouse, spill, retry_interval_sec=0, replay_batches=10, max_attempts=2,
+                            on_reject=lambda rows, ex: rejected.append(rows))
+    spill.append([1])
+    spill.append([2])
+    clickhouse.errors = [ServerException('bad row', code=ErrorCodes.CANNOT_PARSE_TEXT)] * 2
+
+    writer.replay()
+    assert rejected == []
+    writer.replay()
+
+    assert rejected == [[1]]
+    assert clickhouse.inserted == [[2]]
+
+
+def test_close_drains_the_spill_queue(tmp_path):
+    clickhouse = FakeClickHouse()
+    spill = SpillQueue(str(tmp_path), segment_max_bytes=1024)
+    spill.append([1])
+    spill.append([2])
+    writer = SpillingWriter(clickhouse, spill, retry_interval_sec=60, replay_batches=1, drain_timeout_sec=5)
+    writer.next_retry = float('inf')
+
+    writer.close()
+
+    assert clickhouse.inserted == [[1], [2]]
@@ -0,0 +1,47 @@
+import time
+
+from kafka.structs import TopicPartition
+
+from core import config
+from etl_run import ETLSupervisor, parse_partitions
+
+TOPIC = 'auth_views_labels'
+
+
+def test_parse_partitions():
+    assert parse_partitions(f'{TOPIC}:0, {TOPIC}:2,') == [TopicPartition(TOPIC, 0), TopicPartition(TOPIC, 2)]
+    assert parse_partitions('') == []
+
+
+def test_partitions_are_split_between_workers():
+    partitions = parse_partitions(','.join(f'{TOPIC}:{number}' for number in range(5)))
+    supervisor = ETLSupervisor(workers=2, partitions=partitions)
+
+    assert [p.partition for p in supervisor.worker_partitions(0)] == [0, 2, 4]
+    assert [p.partition for p in supervisor.worker_partitions(1)] == [1, 3]
+
+
+def test_workers_are_capped_by_partitions():
+    supervisor = ETLSupervisor(workers=4, partitions=parse_partitions(f'{TOPIC}:0,{TOPIC}:1'))
+
+    assert supervisor.workers == 2
+    assert all(supervisor.worker_partitions(number) for number in range(supervisor.workers))
+
+
+def test_workers_without_pinned_partitions_join_the_group():
+    supervisor = ETLSupervisor(workers=3)
+
+    assert supervisor.workers == 3
+    assert supervisor.worker_partitions(0) is None
+
+
+def test_restart_delay_backs_off_and_resets(monkeypatch):
+    monkeypatch.setattr(config, 'ETL_WORKER_RESTART_DELAY_SEC', 1)
+    monkeypatch.setattr(config, 'ETL_WORKER_RESTART_MAX_DELAY_SEC', 4)
+    supervisor = ETLSupervisor(workers=1)
+    supervisor.started_at[0] = time.monotonic()
+
+    assert [supervisor.restart_delay(0) for _ in range(4)] == [1, 2, 4, 4]
+
+    supervisor.started_at[0] = time.monotonic() - 4
+    assert supervisor.restart_delay(0) == 1
@@ -0,0 +1,58 @@
+from uuid import uuid4
+
+import pytest
+
+from core import config
+from pkg.batch_writer import BatchWriter
+from pkg.clickhouse_operate import ClickHouse
+from pkg.view_events import ANONYMOUS_USER_ID, ViewEvent, compact, position_to_ms, to_columns
+
+
+def event(film_id, user_id, timestamp, marks=1):
+    return ViewEvent(film_id, user_id, timestamp, position_to_ms(timestamp), marks)
+
+
+def test_position_to_ms():
+    assert position_to_ms('01:02:03.5') == 3723500
+
+
+def test_compact_keeps_the_latest_mark_of_a_pair():
+    film_id, user_id, other_user_id = uuid4(), uuid4(), uuid4()
+    events = [
+        event(film_id, user_id, '00:00:01'),
+        event(film_id, other_user_id, '00:00:05'),
+        event(film_id, user_id, '00:00:02', marks=3),
+        event(film_id, user_id, '00:00:03'),
+    ]
+
+    assert compact(events) == [
+        event(film_id, user_id, '00:00:03', marks=5),
+        event(film_id, other_user_id, '00:00:05'),
+    ]
+
+
+def test_compact_keeps_anonymous_marks():
+    film_id = uuid4()
+    events = [event(film_id, ANONYMOUS_USER_ID, '00:00:01'), event(film_id, ANONYMOUS_USER_ID, '00:00:02')]
+
+    assert compact(events) == events
+
+
+def test_compaction_is_refused_in_rows_mode(monkeypatch):
+    monkeypatch.setattr(config, 'ETL_COMPACT_WATCH_MARKS', True)
+    clickhouse = ClickHouse(insert_mode='rows')
+
+    with pytest.raises(ValueError):
+        BatchWriter(clickhouse)
+    clickhouse.close()
+
+
+def test_to_columns_transposes_the_requested_fields():
+    film_id, user_id = uuid4(), uuid4()
+    events = [event(film_id, user_id, '00:00:01'), event(film_id, user_id, '00:00:02', marks=3)]
+
+    assert to_columns(events, ('position_ms', 'film_id', 'marks')) == [(1000, 2000), (film_id, film_id), (1, 3)]
+
+
+def test_to_columns_of_no_events():
+    assert to_columns([], ('film_id', 'user_id')) == [(), ()]
@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends, Header
 from pydantic import BaseModel
 
 from api.views_decorators import inner_token_required
+from pkg.cache_storage.tiered_storage import TieredCacheService, get_tiered_storage_service
 from services.films import FilmService, get_film_service
 from api.models.resp_models import FilmRespModel
 
@@ -48,3 +49,25 @@ async def get_films_list(
     Get filtered films list with pagination.
     """
     return await film_service.get_films_by_id(req.ids)
+
+
+@router.get(
+    '/cache_stats/',
+    tags=["inner"],
+    responses={
+        200: {
+            "description": "Hit and miss counters of the worker cache tiers.",
+        },
+    }
+)
+@inner_token_required
+async def get_cache_stats(
+        internal_token=Header(
+            description="Internal token for communicating between services"
+        ),
+        cache_storage: TieredCacheService = Depends(get_tiered_storage_service)
+) -> dict:
+    """
+    Get cache counters of the worker that served the request.
+    """
+    return cache_storage.stats()
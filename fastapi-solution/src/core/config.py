@@ -10,6 +10,14 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "127.0.0.1"
     REDIS_PORT: int = 6379
 
+    # Кэш в памяти воркера перед Redis, 0 записей отключает его
+    CACHE_L1_MAX_SIZE: int = 10000
+    CACHE_L1_TTL_SEC: float = 30
+    # Фильмы, персоны и жанры по ID: после мягкого TTL отдаются из кэша
+    # и обновляются в фоне, после жесткого TTL удаляются
+    CACHE_SOFT_TTL_SEC: int = 60 * 5
+    CACHE_HARD_TTL_SEC: int = 60 * 30
+
     # Настройки Elasticsearch
     ELASTIC_HOST: str = "127.0.0.1"
     ELASTIC_PORT: int = 9200
@@ -20,6 +28,11 @@ class Settings(BaseSettings):
 
     # Auth endpoint
     AUTH_SERVICE: str = "http://127.0.0.1:8000/auth_api/v1/auth/check_roles"
+    AUTH_POOL_SIZE: int = 100
+    AUTH_TIMEOUT_SEC: float = 5
+    # Результаты проверки токенов в памяти воркера, не дольше срока жизни токена
+    AUTH_CACHE_TTL_SEC: float = 30
+    AUTH_CACHE_MAX_SIZE: int = 10000
 
     # Sentry
     MOVIES_SENTRY_SDK: str = "https://82ccca49e570413f8cb6aa3424d2af34@o1336827.ingest.sentry.io/6613101"
@@ -16,6 +16,7 @@ from api.v1 import films, genre, person, inner_views
 from core.config import Settings
 from db import elastic, redis
 from core.logger import setup_logging
+from services.auth import get_auth_service
 
 logger = logging.getLogger()
 
@@ -67,6 +68,7 @@ async def startup():
     elastic.es = AsyncElasticsearch(
         hosts=[f'{Settings().ELASTIC_HOST}:{Settings().ELASTIC_PORT}']
     )
+    await get_auth_service().start()
 
 
 @app.on_event('shutdown')
@@ -74,6 +76,7 @@ async def shutdown():
     redis.redis.close()
     await redis.redis.wait_closed()
     await elastic.es.close()
+    await get_auth_service().close()
 
 app.add_middleware(RequestContextMiddleware)
 
@@ -0,0 +1,82 @@
+import logging
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
+
+from core.config import Settings
+from pkg.cache_storage.storage import ABSCacheStorage
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCacheService(ABSCacheStorage):
+    """In-process LRU cache with a TTL, entries live in the memory of one worker.
+
+    Values are kept as bytes, like redis returns them. An entry set with a longer
+    expire than the TTL leaves memory after the TTL, its ttl is still counted
+    from the expire, so it matches the copy of the entry in redis.
+    """
+
+    def __init__(self, max_size: int, ttl_sec: float) -> None:
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        # key -> (evicted at, expires at, data)
+        self.entries: 'OrderedDict[str, Tuple[float, float, bytes]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get_data(self, key: str) -> Optional[bytes]:
+        data, _ = await self.get_data_with_ttl(key)
+        return data
+
+    async def get_data_with_ttl(self, key: str) -> Tuple[Optional[bytes], Optional[float]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, None
+        evicted_at, expires_at, data = entry
+        now = time.monotonic()
+        if evicted_at <= now:
+            del self.entries[key]
+            self.misses += 1
+            return None, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return data, expires_at - now
+
+    async def set_data(self, key: str, data: Union[str, bytes], expire: Optional[float] = None):
+        if self.max_size <= 0:
+            return
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        now = time.monotonic()
+        expires_at = now + (self.ttl_sec if expire is None else expire)
+        self.entries[key] = (min(now + self.ttl_sec, expires_at), expires_at, data)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def get_many_data(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [await self.get_data(key) for key in keys]
+
+    async def set_many_data(self, data: Dict[str, Union[str, bytes]], expire: Optional[float] = None):
+        for key, value in data.items():
+            await self.set_data(key, value, expire=expire)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / requests if requests else 0.0,
+        }
+
+
+@lru_cache()
+def get_memory_storage_service() -> MemoryCacheService:
+    return MemoryCacheService(
+        max_size=Settings().CACHE_L1_MAX_SIZE,
+        ttl_sec=Settings().CACHE_L1_TTL_SEC,
+    )
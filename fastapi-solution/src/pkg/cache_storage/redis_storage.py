@@ -1,6 +1,6 @@
 import logging
 from functools import lru_cache
-from typing import Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from aioredis import Redis
 from db.redis import get_redis
@@ -27,13 +27,30 @@ class RedisCacheService(ABSCacheStorage):
                 logger.info(f"data not found in redis.")
             return data
 
-    async def set_data(self, key: str, data: Union[str, bytes]):
+    async def get_data_with_ttl(self, key: str) -> Tuple[Optional[bytes], Optional[float]]:
+        """Data and seconds left before it expires, both read in one round-trip."""
+        logger.info(f"getting data with ttl from redis by key: {key}")
+        pipe = self.redis.pipeline()
+        pipe.get(key)
+        pipe.pttl(key)
+        try:
+            data, ttl_ms = await pipe.execute()
+        except Exception:
+            logger.exception("error while getting data from redis")
+            return None, None
+        if not data:
+            logger.info(f"data not found in redis.")
+            return None, None
+        # -1 is returned for keys without expiry
+        return data, ttl_ms / 1000 if ttl_ms >= 0 else None
+
+    async def set_data(self, key: str, data: Union[str, bytes], expire: int = EXPIRATION_TIME_SECONDS):
         logger.info(f"inserting data to redis cache with key: {key}")
         try:
             await self.redis.set(
                 key,
                 data,
-                expire=EXPIRATION_TIME_SECONDS
+                expire=expire
             )
         except Exception:
             logger.exception("error while inserting data in redis")
@@ -41,6 +58,29 @@ class RedisCacheService(ABSCacheStorage):
             logger.info(f"successfully added to reddis.")
 
 
+    async def get_many_data(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Data of every key in one MGET, None for the missing ones."""
+        if not keys:
+            return []
+        logger.info(f"getting {len(keys)} keys from redis")
+        try:
+            return await self.redis.mget(*keys)
+        except Exception:
+            logger.exception("error while getting data from redis")
+            return [None] * len(keys)
+
+    async def set_many_data(self, data: Dict[str, Union[str, bytes]], expire: int = EXPIRATION_TIME_SECONDS):
+        if not data:
+            return
+        logger.info(f"inserting {len(data)} keys to redis cache")
+        pipe = self.redis.pipeline()
+        for key, value in data.items():
+            pipe.set(key, value, expire=expire)
+        try:
+            await pipe.execute()
+        except Exception:
+            logger.exception("error while inserting data in redis")
+
 @lru_cache()
 def get_redis_storage_service(
         redis: Redis = Depends(get_redis),
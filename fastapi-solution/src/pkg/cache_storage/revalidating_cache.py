@@ -0,0 +1,62 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Optional, Set, Type
+
+from pydantic import BaseModel
+
+from pkg.cache_storage.storage import ABSCacheStorage
+from pkg.single_flight.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class RevalidatingCache:
+    """Stale-while-revalidate reads of json documents, returned as models.
+
+    Loaded documents are checked against the model before they are stored, so a
+    malformed one is not served from the cache. Entries are stored for hard_ttl_sec. Once an entry is older than soft_ttl_sec
+    it is still returned, and a background task loads it again; callers only wait
+    for the storage when the entry is missing. The age is taken from the ttl left,
+    so entries keep the plain document format and need no extra keys.
+    """
+
+    def __init__(self, cache_storage: ABSCacheStorage, model: Type[BaseModel],
+                 soft_ttl_sec: int, hard_ttl_sec: int) -> None:
+        self.cache_storage = cache_storage
+        self.model = model
+        self.soft_ttl_sec = soft_ttl_sec
+        self.hard_ttl_sec = max(hard_ttl_sec, soft_ttl_sec)
+        self.single_flight = SingleFlight()
+        # the loop keeps weak references to tasks only
+        self.refreshes: Set[asyncio.Task] = set()
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[Optional[dict]]]) -> Optional[BaseModel]:
+        data, ttl = await self.cache_storage.get_data_with_ttl(key=key)
+        if data:
+            if ttl is not None and ttl < self.hard_ttl_sec - self.soft_ttl_sec:
+                self._refresh(key, loader)
+            return self.model(**json.loads(data))
+        return await self.single_flight.do(key, lambda: self._load(key, loader))
+
+    def _refresh(self, key: str, loader: Callable[[], Awaitable[Optional[dict]]]):
+        if key in self.single_flight.calls:
+            return
+        logger.info(f"refreshing stale cache entry in background, key: {key}")
+        task = asyncio.ensure_future(self.single_flight.do(key, lambda: self._load(key, loader)))
+        self.refreshes.add(task)
+        task.add_done_callback(self._refreshed)
+
+    def _refreshed(self, task: asyncio.Task):
+        self.refreshes.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"background cache refresh failed: {task.exception()}")
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Optional[dict]]]) -> Optional[BaseModel]:
+        document = await loader()
+        if document is None:
+            return None
+        # A malformed document fails here, before it gets cached.
+        item = self.model(**document)
+        await self.cache_storage.set_data(key=key, data=json.dumps(document), expire=self.hard_ttl_sec)
+        return item
@@ -10,3 +10,15 @@ class ABSCacheStorage(ABC):
     @abstractmethod
     def set_data(self, **kwargs):
         pass
+
+    @abstractmethod
+    def get_data_with_ttl(self, **kwargs):
+        pass
+
+    @abstractmethod
+    def get_many_data(self, **kwargs):
+        pass
+
+    @abstractmethod
+    def set_many_data(self, **kwargs):
+        pass
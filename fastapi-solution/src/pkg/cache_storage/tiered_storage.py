@@ -0,0 +1,94 @@
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
+
+from fastapi import Depends
+from pkg.cache_storage.memory_storage import MemoryCacheService, get_memory_storage_service
+from pkg.cache_storage.redis_storage import get_redis_storage_service
+from pkg.cache_storage.storage import ABSCacheStorage
+
+logger = logging.getLogger(__name__)
+
+
+class TieredCacheService(ABSCacheStorage):
+    """Worker memory in front of redis.
+
+    Redis hits are copied into memory, writes go to both tiers. The memory TTL
+    is shorter than the redis one, it bounds how long workers disagree.
+    """
+
+    def __init__(self, memory: MemoryCacheService, redis: ABSCacheStorage) -> None:
+        self.memory = memory
+        self.redis = redis
+        self.redis_hits = 0
+        self.redis_misses = 0
+
+    async def get_data(self, key: str) -> Optional[bytes]:
+        data = await self.memory.get_data(key)
+        if data is not None:
+            return data
+        data = await self.redis.get_data(key)
+        if not data:
+            self.redis_misses += 1
+            return data
+        self.redis_hits += 1
+        await self.memory.set_data(key, data)
+        return data
+
+    async def get_data_with_ttl(self, key: str) -> Tuple[Optional[bytes], Optional[float]]:
+        data, ttl = await self.memory.get_data_with_ttl(key)
+        if data is not None:
+            return data, ttl
+        data, ttl = await self.redis.get_data_with_ttl(key)
+        if not data:
+            self.redis_misses += 1
+            return data, ttl
+        self.redis_hits += 1
+        await self.memory.set_data(key, data, expire=ttl)
+        return data, ttl
+
+    async def set_data(self, key: str, data: Union[str, bytes], expire: Optional[int] = None):
+        await self.memory.set_data(key, data, expire=expire)
+        if expire is None:
+            await self.redis.set_data(key, data)
+        else:
+            await self.redis.set_data(key, data, expire=expire)
+
+    async def get_many_data(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Memory first, the rest in one redis round-trip.
+
+        MGET returns no ttl, redis hits are not copied into memory, where they would
+        look fresher or older than they are.
+        """
+        found = await self.memory.get_many_data(keys)
+        missing = [number for number, data in enumerate(found) if data is None]
+        if missing:
+            from_redis = await self.redis.get_many_data([keys[number] for number in missing])
+            for number, data in zip(missing, from_redis):
+                if data:
+                    self.redis_hits += 1
+                    found[number] = data
+                else:
+                    self.redis_misses += 1
+        return found
+
+    async def set_many_data(self, data: Dict[str, Union[str, bytes]], expire: Optional[int] = None):
+        await self.memory.set_many_data(data, expire=expire)
+        if expire is None:
+            await self.redis.set_many_data(data)
+        else:
+            await self.redis.set_many_data(data, expire=expire)
+
+    def stats(self) -> dict:
+        return {
+            'memory': self.memory.stats(),
+            'redis': {'hits': self.redis_hits, 'misses': self.redis_misses},
+        }
+
+
+@lru_cache()
+def get_tiered_storage_service(
+        memory: MemoryCacheService = Depends(get_memory_storage_service),
+        redis: ABSCacheStorage = Depends(get_redis_storage_service),
+) -> TieredCacheService:
+    return TieredCacheService(memory, redis)
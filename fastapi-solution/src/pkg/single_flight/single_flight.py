@@ -0,0 +1,33 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one run of the loader.
+
+    The loader runs in its own task, a cancelled caller does not cancel it
+    for the others waiting on the same key.
+    """
+
+    def __init__(self) -> None:
+        self.calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        call = self.calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(loader())
+            self.calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            logger.info(f"joining in-flight load of key: {key}")
+        return await asyncio.shield(call)
+
+    def _forget(self, key: str, call: asyncio.Future):
+        if self.calls.get(key) is call:
+            del self.calls[key]
+        # Every caller may have been cancelled, nobody else retrieves the error then.
+        if not call.cancelled() and call.exception():
+            logger.info(f"in-flight load of key {key} failed: {call.exception()}")
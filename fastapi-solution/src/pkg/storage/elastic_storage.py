@@ -1,6 +1,6 @@
 import logging
 from functools import lru_cache
-from typing import Dict, Union
+from typing import Dict, List, Optional, Union
 
 import backoff
 from db import elastic_queries
@@ -44,6 +44,27 @@ class ElasticService(ABSStorage):
             return None
         return doc
 
+    @backoff.on_exception(
+        backoff.fibo,
+        ConnectionError,
+        max_time=BACKOFF_MAX_TIME,
+        on_backoff=back_off_hdlr,
+    )
+    async def get_by_ids(self,
+                         ids: List[str],
+                         index_name: str) -> List[Optional[Dict]]:
+        """Получение записей из эластика по списку id одним запросом.
+
+        :param ids:
+        :param index_name:
+        :return: записи в порядке ids, None для ненайденных
+        """
+        if not ids:
+            return []
+        logger.info(f"getting {len(ids)} docs from elastic index:{index_name}")
+        response = await self.elastic.mget(body={"ids": ids}, index=index_name)
+        return [doc if doc.get('found') else None for doc in response['docs']]
+
     @backoff.on_exception(
         backoff.fibo,
         ConnectionError,
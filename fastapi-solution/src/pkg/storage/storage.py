@@ -10,3 +10,7 @@ class ABSStorage(ABC):
     @abstractmethod
     def search(self, **kwargs):
         pass
+
+    @abstractmethod
+    def get_by_ids(self, **kwargs):
+        pass
@@ -1,17 +1,73 @@
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import time
 from functools import lru_cache
+from typing import Optional
+
 import aiohttp
 from core.config import Settings
+from pkg.cache_storage.memory_storage import MemoryCacheService
+
+logger = logging.getLogger(__name__)
+
+
+def token_expires_at(token: str) -> Optional[float]:
+    """Expiry time of a jwt, read without verifying it, the auth service does that."""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError, binascii.Error):
+        return None
 
 
 class AuthService:
+    """Validates tokens with the auth service over one pooled session.
+
+    Successful validations are kept in worker memory for AUTH_CACHE_TTL_SEC,
+    never past the expiry of the token. Tokens are kept as hashes only.
+    """
+
     def __init__(self):
         self.auth_url = Settings().AUTH_SERVICE
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.cache = MemoryCacheService(
+            max_size=Settings().AUTH_CACHE_MAX_SIZE,
+            ttl_sec=Settings().AUTH_CACHE_TTL_SEC,
+        )
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=Settings().AUTH_POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(total=Settings().AUTH_TIMEOUT_SEC),
+        )
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
 
     async def validate(self, token: str):
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        cached = await self.cache.get_data(key)
+        if cached:
+            return json.loads(cached)
+
+        if self.session is None:
+            # Called before the startup event, e.g. by a test client.
+            await self.start()
         headers = {"Authorization": f"Bearer {token}"}
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(self.auth_url) as response:
-                return await response.json()
+        async with self.session.get(self.auth_url, headers=headers) as response:
+            result = await response.json()
+
+        expires_at = token_expires_at(token)
+        if result.get('user_roles') and expires_at:
+            expire = min(Settings().AUTH_CACHE_TTL_SEC, expires_at - time.time())
+            if expire > 0:
+                await self.cache.set_data(key, json.dumps(result), expire=expire)
+        return result
 
 
 @lru_cache()
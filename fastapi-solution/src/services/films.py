@@ -3,10 +3,12 @@ import logging
 from functools import lru_cache
 from typing import List, Optional, Tuple
 
+from core.config import Settings
 from fastapi import Depends
 from models.film import FilmFull
-from pkg.cache_storage.redis_storage import get_redis_storage_service
+from pkg.cache_storage.revalidating_cache import RevalidatingCache
 from pkg.cache_storage.storage import ABSCacheStorage
+from pkg.cache_storage.tiered_storage import get_tiered_storage_service
 from pkg.storage.elastic_storage import get_elastic_storage_service
 from pkg.storage.storage import ABSStorage
 
@@ -24,6 +26,12 @@ class FilmService(ABSService):
     ):
         self.cache_storage = cache_storage
         self.storage = storage
+        self.cache = RevalidatingCache(
+            cache_storage,
+            FilmFull,
+            soft_ttl_sec=Settings().CACHE_SOFT_TTL_SEC,
+            hard_ttl_sec=Settings().CACHE_HARD_TTL_SEC,
+        )
 
     async def get_by_id(self, film_id: str) -> Optional[FilmFull]:
         """
@@ -32,19 +40,16 @@ class FilmService(ABSService):
         logger.info("FilmService get_by_id started...")
 
         logger.info("Trying to get film from cache.")
-        film_data = await self.cache_storage.get_data(f"film_{film_id}")
-        if film_data:
-            return FilmFull(**json.loads(film_data))
+        return await self.cache.get(
+            f"film_{film_id}",
+            lambda: self._load_film(film_id)
+        )
 
+    async def _load_film(self, film_id: str) -> Optional[dict]:
         logger.info("Trying to get film from elastic.")
         film_doc = await self.storage.get_by_id(film_id, FILMS_INDEX_NAME)
         if film_doc:
-            logger.info("Caching film that have been found in storage.")
-            await self.cache_storage.set_data(
-                f"film_{film_id}",
-                json.dumps(film_doc['_source'])
-            )
-            return FilmFull(**film_doc['_source'])
+            return film_doc['_source']
 
         return None
 
@@ -195,38 +200,41 @@ class FilmService(ABSService):
 
     async def get_films_by_id(self, ids: List[str]) -> List[FilmFull]:
         """
-        Get list of filmworks by id from es.
+        Get list of filmworks by id from cache or es, in the order of ids.
+        Films are cached one by one, under the keys get_by_id uses.
         """
         logger.info("FilmService get_films_by_id started...")
+        ids = [str(film_id) for film_id in ids]
+        keys = [f"film_{film_id}" for film_id in ids]
+
+        logger.info("Trying to get films from cache.")
+        cached = await self.cache_storage.get_many_data(keys=keys)
+        films = {
+            film_id: FilmFull(**json.loads(film_data))
+            for film_id, film_data in zip(ids, cached) if film_data
+        }
 
-        logger.info(f"Trying to get films from elastic by ids: {ids}")
-        film_doc = await self.storage.search(
-            index_name=FILMS_INDEX_NAME,
-            query={
-                "query": {
-                    "terms": {
-                        "_id": ids
-                    }
-                },
-                "sort": [{
-                    "imdb_rating": {
-                        "order": "desc"
-                    }
-                }],
+        missing = list(dict.fromkeys(film_id for film_id in ids if film_id not in films))
+        if missing:
+            logger.info(f"Trying to get films from elastic by ids: {missing}")
+            film_docs = await self.storage.get_by_ids(ids=missing, index_name=FILMS_INDEX_NAME)
+            found = {
+                film_id: film_doc['_source']
+                for film_id, film_doc in zip(missing, film_docs) if film_doc
             }
-        )
-
-        if film_doc:
-            hits_sources = [
-                hit['_source'] for hit in film_doc.get('hits', {}).get('hits', [])
-            ]
-            return [FilmFull(**hit_source) for hit_source in hits_sources]
-        return []
+            films.update({film_id: FilmFull(**source) for film_id, source in found.items()})
+            if found:
+                logger.info("Caching films that have been found in storage.")
+                await self.cache_storage.set_many_data(
+                    data={f"film_{film_id}": json.dumps(source) for film_id, source in found.items()},
+                    expire=Settings().CACHE_HARD_TTL_SEC,
+                )
 
+        return [films[film_id] for film_id in ids if film_id in films]
 
 @lru_cache()
 def get_film_service(
-        cache_storage: ABSCacheStorage = Depends(get_redis_storage_service),
+        cache_storage: ABSCacheStorage = Depends(get_tiered_storage_service),
         elastic: ABSStorage = Depends(get_elastic_storage_service),
 ) -> FilmService:
     return FilmService(storage=elastic, cache_storage=cache_storage)
@@ -2,11 +2,13 @@ import json
 from functools import lru_cache
 from typing import List, Optional, Tuple, Union
 
+from core.config import Settings
 from db.elastic_queries import match_query
 from fastapi import Depends
 from models.genre import Genres
-from pkg.cache_storage.redis_storage import get_redis_storage_service
+from pkg.cache_storage.revalidating_cache import RevalidatingCache
 from pkg.cache_storage.storage import ABSCacheStorage
+from pkg.cache_storage.tiered_storage import get_tiered_storage_service
 from pkg.storage.elastic_storage import get_elastic_storage_service
 from pkg.storage.storage import ABSStorage
 
@@ -16,6 +18,12 @@ class GenreService:
     def __init__(self, elastic: ABSStorage, cache_storage: ABSCacheStorage):
         self.cache_storage = cache_storage
         self.elastic = elastic
+        self.cache = RevalidatingCache(
+            cache_storage,
+            Genres,
+            soft_ttl_sec=Settings().CACHE_SOFT_TTL_SEC,
+            hard_ttl_sec=Settings().CACHE_HARD_TTL_SEC,
+        )
 
     async def get_list(self,
                        page_size: int,
@@ -59,24 +67,19 @@ class GenreService:
         Returns: Optional[Genres]
         """
 
-        cashed_data = await self.cache_storage.get_data(key=genre_id)
-        if cashed_data:
-            genre = Genres.parse_raw(cashed_data)
-            return genre
+        return await self.cache.get(genre_id, lambda: self._load_genre(genre_id))
 
+    async def _load_genre(self, genre_id: str) -> Optional[dict]:
         doc = await self.elastic.get_by_id(id=genre_id, index_name='genres')
 
         if not doc:
             return None
-        genre = Genres(**doc['_source'])
-        await self.cache_storage.set_data(key=f"{genre_id}", data=json.dumps(doc['_source']))
-
-        return genre
+        return doc['_source']
 
 
 @lru_cache()
 def get_genre_service(
-        redis: ABSCacheStorage = Depends(get_redis_storage_service),
+        redis: ABSCacheStorage = Depends(get_tiered_storage_service),
         elastic: ABSStorage = Depends(get_elastic_storage_service),
 ) -> GenreService:
     return GenreService(elastic, redis)
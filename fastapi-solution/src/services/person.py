@@ -3,12 +3,14 @@ from functools import lru_cache
 from typing import Tuple, Union
 
 from api.v1.films import FilmRating
+from core.config import Settings
 from db.elastic_queries import *
 from fastapi import Depends
 from models.film import FilmFull
 from models.person import Person
-from pkg.cache_storage.redis_storage import get_redis_storage_service
+from pkg.cache_storage.revalidating_cache import RevalidatingCache
 from pkg.cache_storage.storage import ABSCacheStorage
+from pkg.cache_storage.tiered_storage import get_tiered_storage_service
 from pkg.storage.elastic_storage import get_elastic_storage_service
 from pkg.storage.storage import ABSStorage
 from services.films import FilmService
@@ -19,6 +21,12 @@ class PersonService:
     def __init__(self, elastic: ABSStorage, cache_storage: ABSCacheStorage):
         self.cache_storage = cache_storage
         self.elastic = elastic
+        self.cache = RevalidatingCache(
+            cache_storage,
+            Person,
+            soft_ttl_sec=Settings().CACHE_SOFT_TTL_SEC,
+            hard_ttl_sec=Settings().CACHE_HARD_TTL_SEC,
+        )
 
     async def get_by_id(self, person_id: str) -> Optional[Person]:
         """Получение персоны по ID.
@@ -26,19 +34,14 @@ class PersonService:
         :param person_id: str
         :return: Optional[Person]
         """
-        cashed_data = await self.cache_storage.get_data(key=person_id)
-        if cashed_data:
-            person = Person.parse_raw(cashed_data)
-            return person
+        return await self.cache.get(person_id, lambda: self._load_person(person_id))
 
+    async def _load_person(self, person_id: str) -> Optional[dict]:
         doc = await self.elastic.get_by_id(id=person_id, index_name='person')
 
         if not doc:
             return None
-        person = Person(**doc['_source'])
-        await self.cache_storage.set_data(key=f"{person_id}", data=json.dumps(doc['_source']))
-
-        return person
+        return doc['_source']
 
     async def get_list(self,
                        page_size: int,
@@ -200,7 +203,7 @@ class PersonService:
 
 @lru_cache()
 def get_person_service(
-        redis: ABSCacheStorage = Depends(get_redis_storage_service),
+        redis: ABSCacheStorage = Depends(get_tiered_storage_service),
         elastic: ABSStorage = Depends(get_elastic_storage_service),
 ) -> PersonService:
     return PersonService(elastic, redis)
@@ -0,0 +1,128 @@
+import base64
+import json
+
+import pytest
+
+from pkg.cache_storage import memory_storage
+from services import auth
+from services.auth import AuthService, token_expires_at
+
+NOW = 1_000_000.0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = NOW
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class FakeResponse:
+    def __init__(self, result: dict):
+        self.result = result
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def json(self):
+        return self.result
+
+
+class FakeSession:
+    """Stands in for aiohttp.ClientSession, answers every check with the same roles."""
+
+    def __init__(self, **kwargs):
+        self.result = {'user_roles': ['subscription']}
+        self.requests = 0
+
+    def get(self, url, headers):
+        self.requests += 1
+        return FakeResponse(self.result)
+
+    async def close(self):
+        pass
+
+
+def token(exp=None) -> str:
+    payload = {} if exp is None else {'exp': exp}
+    encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+    return f'header.{encoded}.signature'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(memory_storage, 'time', clock)
+    monkeypatch.setattr(auth, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def service(monkeypatch, clock):
+    monkeypatch.setattr(auth.aiohttp, 'ClientSession', FakeSession)
+    monkeypatch.setattr(auth.aiohttp, 'TCPConnector', lambda **kwargs: None)
+    return AuthService()
+
+
+def test_token_expires_at():
+    assert token_expires_at(token(exp=NOW)) == NOW
+    assert token_expires_at(token()) is None
+    assert token_expires_at('not a jwt') is None
+
+
+@pytest.mark.asyncio
+async def test_validation_is_cached_for_the_cache_ttl(service, clock):
+    await service.start()
+    valid_token = token(exp=NOW + 3600)
+
+    assert await service.validate(valid_token) == {'user_roles': ['subscription']}
+    clock.now += service.cache.ttl_sec - 1
+    await service.validate(valid_token)
+    assert service.session.requests == 1
+
+    clock.now += 1
+    await service.validate(valid_token)
+    assert service.session.requests == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_validation_never_outlives_the_token(service, clock):
+    await service.start()
+    expiring_token = token(exp=NOW + 5)
+
+    await service.validate(expiring_token)
+    clock.now += 4
+    await service.validate(expiring_token)
+    assert service.session.requests == 1
+
+    clock.now += 1
+    await service.validate(expiring_token)
+    assert service.session.requests == 2
+
+
+@pytest.mark.asyncio
+async def test_expired_and_unknown_tokens_are_not_cached(service):
+    await service.start()
+
+    await service.validate(token(exp=NOW - 1))
+    await service.validate(token())
+    service.session.result = {'detail': 'invalid token'}
+    await service.validate(token(exp=NOW + 3600))
+
+    assert service.cache.entries == {}
+
+
+@pytest.mark.asyncio
+async def test_validate_before_startup_opens_the_session(service):
+    assert service.session is None
+
+    assert await service.validate(token(exp=NOW + 3600)) == {'user_roles': ['subscription']}
+    assert isinstance(service.session, FakeSession)
+    await service.close()
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from pkg.cache_storage.memory_storage import MemoryCacheService
+from services.films import FilmService
+
+
+class FakeElastic:
+    """Documents by id, mget returns None for the ids it does not have."""
+
+    def __init__(self, documents: dict):
+        self.documents = documents
+        self.requested = []
+
+    async def get_by_ids(self, ids, index_name):
+        self.requested.append(list(ids))
+        return [
+            {'_id': film_id, '_source': self.documents[film_id]} if film_id in self.documents else None
+            for film_id in ids
+        ]
+
+
+def film(film_id: str) -> dict:
+    return {'id': film_id, 'title': f'Film {film_id}', 'imdb_rating': 7.5}
+
+
+@pytest.fixture
+def cache():
+    return MemoryCacheService(max_size=100, ttl_sec=60)
+
+
+async def films_by_id(cache, elastic, ids):
+    films = await FilmService(storage=elastic, cache_storage=cache).get_films_by_id(ids)
+    return [film.id for film in films]
+
+
+@pytest.mark.asyncio
+async def test_films_come_in_the_requested_order(cache):
+    elastic = FakeElastic({film_id: film(film_id) for film_id in 'abc'})
+
+    assert await films_by_id(cache, elastic, ['c', 'a', 'b']) == ['c', 'a', 'b']
+
+
+@pytest.mark.asyncio
+async def test_partial_cache_hit_is_backfilled_from_elastic(cache):
+    await cache.set_data('film_b', json.dumps(film('b')))
+    elastic = FakeElastic({film_id: film(film_id) for film_id in 'abc'})
+
+    assert await films_by_id(cache, elastic, ['a', 'b', 'c']) == ['a', 'b', 'c']
+
+    assert elastic.requested == [['a', 'c']]
+    assert json.loads(await cache.get_data('film_c')) == film('c')
+
+
+@pytest.mark.asyncio
+async def test_missing_films_are_skipped_and_not_cached(cache):
+    elastic = FakeElastic({'a': film('a')})
+
+    assert await films_by_id(cache, elastic, ['a', 'missing']) == ['a']
+    assert await cache.get_data('film_missing') is None
+
+
+@pytest.mark.asyncio
+async def test_duplicate_ids_are_fetched_once(cache):
+    elastic = FakeElastic({film_id: film(film_id) for film_id in 'ab'})
+
+    assert await films_by_id(cache, elastic, ['a', 'b', 'a']) == ['a', 'b', 'a']
+    assert elastic.requested == [['a', 'b']]
+
+
+@pytest.mark.asyncio
+async def test_malformed_film_is_not_cached(cache):
+    elastic = FakeElastic({'a': film('a'), 'b': {'title': 'No id'}})
+
+    with pytest.raises(ValueError):
+        await films_by_id(cache, elastic, ['a', 'b'])
+
+    assert await cache.get_data('film_a') is None
@@ -0,0 +1,62 @@
+import pytest
+
+from pkg.cache_storage import memory_storage
+from pkg.cache_storage.memory_storage import MemoryCacheService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(memory_storage, 'time', clock)
+    return clock
+
+
+@pytest.mark.asyncio
+async def test_entry_expires_after_ttl(clock):
+    cache = MemoryCacheService(max_size=10, ttl_sec=30)
+    await cache.set_data('film', '{"id": 1}')
+
+    clock.now += 29
+    assert await cache.get_data('film') == b'{"id": 1}'
+    clock.now += 1
+    assert await cache.get_data('film') is None
+    assert cache.stats() == {'size': 0, 'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+
+
+@pytest.mark.asyncio
+async def test_longer_expire_leaves_memory_after_ttl_and_keeps_its_ttl(clock):
+    cache = MemoryCacheService(max_size=10, ttl_sec=30)
+    await cache.set_data('film', b'data', expire=300)
+
+    clock.now += 10
+    assert await cache.get_data_with_ttl('film') == (b'data', 290)
+    clock.now += 20
+    assert await cache.get_data_with_ttl('film') == (None, None)
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_entry_is_evicted(clock):
+    cache = MemoryCacheService(max_size=2, ttl_sec=30)
+    await cache.set_data('first', b'1')
+    await cache.set_data('second', b'2')
+    await cache.get_data('first')
+
+    await cache.set_data('third', b'3')
+
+    assert await cache.get_many_data(['first', 'second', 'third']) == [b'1', None, b'3']
+
+
+@pytest.mark.asyncio
+async def test_zero_max_size_disables_the_cache(clock):
+    cache = MemoryCacheService(max_size=0, ttl_sec=30)
+    await cache.set_many_data({'film': b'data'})
+
+    assert await cache.get_data('film') is None
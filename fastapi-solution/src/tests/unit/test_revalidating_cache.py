@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from pkg.cache_storage.revalidating_cache import RevalidatingCache
+
+
+class Document(BaseModel):
+    id: str
+
+
+class FakeCacheStorage:
+    """Entries with the ttl they have left, the clock does not move."""
+
+    def __init__(self):
+        self.entries = {}
+
+    async def get_data_with_ttl(self, key: str):
+        return self.entries.get(key, (None, None))
+
+    async def set_data(self, key: str, data: str, expire: int = None):
+        self.entries[key] = (data.encode('utf-8'), expire)
+
+
+class Loader:
+    def __init__(self, document: dict = None):
+        self.calls = 0
+        self.document = document
+
+    async def __call__(self):
+        self.calls += 1
+        return self.document
+
+
+@pytest.fixture
+def storage():
+    return FakeCacheStorage()
+
+
+@pytest.fixture
+def cache(storage):
+    return RevalidatingCache(storage, Document, soft_ttl_sec=300, hard_ttl_sec=1800)
+
+
+@pytest.mark.asyncio
+async def test_fresh_entry_is_served_from_cache(storage, cache):
+    storage.entries['film'] = (json.dumps({'id': 'cached'}).encode(), 1600)
+    loader = Loader({'id': 'loaded'})
+
+    assert await cache.get('film', loader) == Document(id='cached')
+    assert loader.calls == 0
+    assert not cache.refreshes
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_and_refreshed_in_background(storage, cache):
+    storage.entries['film'] = (json.dumps({'id': 'cached'}).encode(), 1400)
+    loader = Loader({'id': 'loaded'})
+
+    assert await cache.get('film', loader) == Document(id='cached')
+    assert await cache.get('film', loader) == Document(id='cached')
+    await asyncio.gather(*cache.refreshes)
+
+    assert loader.calls == 1
+    assert storage.entries['film'] == (json.dumps({'id': 'loaded'}).encode(), 1800)
+
+
+@pytest.mark.asyncio
+async def test_missing_entry_is_loaded_and_cached_for_hard_ttl(storage, cache):
+    loader = Loader({'id': 'loaded'})
+
+    assert await cache.get('film', loader) == Document(id='loaded')
+    assert storage.entries['film'] == (json.dumps({'id': 'loaded'}).encode(), 1800)
+
+
+@pytest.mark.asyncio
+async def test_missing_document_is_not_cached(storage, cache):
+    assert await cache.get('film', Loader()) is None
+    assert storage.entries == {}
+
+
+@pytest.mark.asyncio
+async def test_malformed_document_is_not_cached(storage, cache):
+    with pytest.raises(ValidationError):
+        await cache.get('film', Loader({'title': 'no id'}))
+    assert storage.entries == {}
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from pkg.single_flight.single_flight import SingleFlight
+
+
+class SlowLoader:
+    def __init__(self, error: Exception = None):
+        self.calls = 0
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {'id': self.calls}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_load():
+    single_flight = SingleFlight()
+    loader = SlowLoader()
+    calls = [asyncio.ensure_future(single_flight.do('film', loader)) for _ in range(10)]
+    await asyncio.sleep(0)
+
+    loader.release.set()
+
+    assert await asyncio.gather(*calls) == [{'id': 1}] * 10
+    assert loader.calls == 1
+    assert single_flight.calls == {}
+
+
+@pytest.mark.asyncio
+async def test_finished_load_is_not_reused():
+    single_flight = SingleFlight()
+    loader = SlowLoader()
+    loader.release.set()
+
+    await single_flight.do('film', loader)
+
+    assert await single_flight.do('film', loader) == {'id': 2}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_load():
+    single_flight = SingleFlight()
+    loader = SlowLoader()
+    first = asyncio.ensure_future(single_flight.do('film', loader))
+    second = asyncio.ensure_future(single_flight.do('film', loader))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    loader.release.set()
+
+    assert await second == {'id': 1}
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_error_reaches_every_caller():
+    single_flight = SingleFlight()
+    loader = SlowLoader(error=ConnectionError('elastic is down'))
+    calls = [asyncio.ensure_future(single_flight.do('film', loader)) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    loader.release.set()
+
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert single_flight.calls == {}
@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Optional
 
 from pydantic import BaseSettings
 
@@ -8,6 +9,8 @@ class MongoSettings(BaseSettings):
     port: int = 27017
     db_name: str = 'UGC_DB'
     scores_collection: str = 'FILM_RATINGS'
+    # threads writing chunks of the scores file at once
+    load_workers: int = 4
 
     class Config:
         env_prefix = 'MONGO_'
@@ -17,12 +20,19 @@ class DataSettings(BaseSettings):
     scores_csv_path: str
     movies_csv_path: str
     batch_size: int = 10000
+    # rows of the scores file to load, the whole file when not set
+    max_rows: Optional[int] = None
+    # progress of the scores load, a restarted load continues from it
+    scores_checkpoint_path: str = 'scores_load.checkpoint'
 
 
-class ElasticSearchSettings(BaseException):
+class ElasticSearchSettings(BaseSettings):
     host: str = 'localhost'
     port: int = 9200
     movies_index = 'movies'
+    bulk_chunk_size: int = 2000
+    bulk_max_chunk_bytes: int = 10 * 1024 * 1024
+    bulk_thread_count: int = 4
 
     class Config:
         env_prefix = 'ES_'
@@ -1,69 +1,100 @@
-from datetime import datetime
+import argparse
+import cProfile
+import json
+from typing import Dict, Iterator, List
 
 import pandas as pd
-from faker import Faker
 from tqdm.auto import tqdm
 
 from core.settings import get_settings
 from core.logger import logger
-from pkg.mongo_loader import get_mongo_loader
+from pkg.checkpoint import Checkpoint
+from pkg.mongo_loader import ParallelMongoLoader, get_mongo_loader, score_object_ids
 from pkg.elastic_loader import get_es_loader
+from pkg.profiler import LoadProfiler, StageRun
+from pkg.user_names import synthetic_user_names
 
 settings = get_settings()
+profiler = LoadProfiler()
 
 
-def from_csv_data_generator(csv_path: str, batch_size: int = 10000):
-    df = prepare_dataframe(csv_path)
-    start_idx = 0
-    end_idx = start_idx + batch_size
+def from_csv_data_generator(csv_path: str, batch_size: int = 10000, skip_rows: int = 0) -> Iterator[List[Dict]]:
+    """Yield batches of score records, the file is read one batch sized chunk at a time."""
+    logger.info('Start reading csv file...')
+    max_rows = settings.data.max_rows
+    if max_rows is not None:
+        max_rows = max(max_rows - skip_rows, 0)
+    # Skipped lines are not parsed, the header line is kept.
+    reader = pd.read_csv(
+        csv_path,
+        chunksize=batch_size,
+        nrows=max_rows,
+        skiprows=range(1, skip_rows + 1) if skip_rows else None,
+    )
+    chunks = iter(reader)
     while True:
-        batch = df[start_idx:end_idx].T.to_dict().values()
-        if len(batch) == 0:
-            raise StopIteration
-        yield batch
-        start_idx = end_idx
-        end_idx = start_idx + batch_size
+        with profiler.stage('csv parse') as run:
+            chunk = next(chunks, None)
+            if chunk is not None:
+                run.rows, run.bytes = len(chunk), chunk_bytes(chunk)
+        if chunk is None:
+            return
+        with profiler.stage('preprocessing') as run:
+            chunk = prepare_dataframe(chunk)
+            run.rows, run.bytes = len(chunk), chunk_bytes(chunk)
+        with profiler.stage('to records') as run:
+            records = dataframe_to_records(chunk)
+            run.rows = len(records)
+        yield records
 
 
-def prepare_dataframe(csv_path: str) -> pd.DataFrame:
-    logger.info('Start reading csv file...')
-    df = pd.read_csv(csv_path)[:1000000]
-    logger.info('Start dataframe preprocessing...')
-    df['date'] = df['date'].apply(lambda x: datetime.strptime(x, '%Y-%m-%d'))
+def chunk_bytes(df: pd.DataFrame) -> int:
+    # deep memory usage walks the python objects, only worth it when profiling
+    return int(df.memory_usage(index=False, deep=True).sum()) if profiler.enabled else 0
+
+
+def dataframe_to_records(df: pd.DataFrame) -> List[Dict]:
+    """Build one dict per row from whole columns, values are converted to python types."""
+    names = list(df.columns)
+    columns = [df[name].tolist() for name in names]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def prepare_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
     df = df.rename(columns={'date': 'time_stamp'})
-    faker = Faker()
-    user_names = [faker.email() for _ in range(len(df))]
-    df['user_name'] = user_names
-    del user_names
+    df['user_name'] = synthetic_user_names(df['user_id'])
+    df['_id'] = score_object_ids(df['time_stamp'], df['movie_id'], df['user_id'])
     return df
 
 
 def load_scores_to_mongo():
-    data_generator = from_csv_data_generator(csv_path=settings.data.scores_csv_path)
-    mongo_loader = get_mongo_loader()
+    checkpoint = Checkpoint(settings.data.scores_checkpoint_path, source=settings.data.scores_csv_path)
+    if checkpoint.rows:
+        logger.info(f'Resuming from checkpoint, {checkpoint.rows} row(s) already loaded')
+    data_generator = from_csv_data_generator(
+        csv_path=settings.data.scores_csv_path,
+        batch_size=settings.data.batch_size,
+        skip_rows=checkpoint.rows,
+    )
+    mongo_loader = ParallelMongoLoader(
+        loader=get_mongo_loader(),
+        db=settings.mongo.db_name,
+        collection=settings.mongo.scores_collection,
+        workers=settings.mongo.load_workers,
+        checkpoint=checkpoint,
+        profiler=profiler,
+    )
     logger.info('Start loading netflix score data to UGC Mongo')
-    try:
-        while True:
-            batch = next(data_generator)
-            mongo_loader.insert_data_batched(
-                db=settings.mongo.db_name,
-                collection=settings.mongo.scores_collection,
-                data=batch
-            )
-            logger.info('Batch of data loaded in mongo')
-    except:
-        pass
+    loaded = mongo_loader.load(data_generator)
+    logger.info(f'{loaded} score(s) loaded in mongo, {checkpoint.rows} in total')
 
 
-def load_movies_to_elastic():
-    logger.info('Start loading netflix data to elasticsearch')
-    df = pd.read_csv(settings.data.movies_csv_path, encoding="ISO-8859-1",
-                     header=None, names=['movie_id', 'year', 'title'])
-    es_loader = get_es_loader()
-    for _, row in tqdm(df.iterrows()):
-        document = {
-            'id': row['movie_id'],
-            'title': row['title'],
+def movie_documents(df: pd.DataFrame) -> Iterator[Dict]:
+    for movie_id, title in zip(df['movie_id'].tolist(), df['title'].fillna('').tolist()):
+        yield {
+            'id': movie_id,
+            'title': title,
             'imdb_rating': 7.7777777,
             'genre': [],
             'description': '',
@@ -73,12 +104,54 @@ def load_movies_to_elastic():
             'actors': [],
             'writers': []
         }
-        es_loader.save_documents('movies', [document])
 
 
-def main():
-    load_scores_to_mongo()
-    load_movies_to_elastic()
+def counted_bytes(documents: Iterator[Dict], run: StageRun) -> Iterator[Dict]:
+    """Pass the documents through, adding their json size to the stage bytes."""
+    for document in documents:
+        run.bytes += len(json.dumps(document))
+        yield document
+
+
+def load_movies_to_elastic():
+    logger.info('Start loading netflix data to elasticsearch')
+    df = pd.read_csv(settings.data.movies_csv_path, encoding="ISO-8859-1",
+                     header=None, names=['movie_id', 'year', 'title'])
+    es_loader = get_es_loader()
+    with profiler.stage('es write') as run:
+        documents = movie_documents(df)
+        if profiler.enabled:
+            documents = counted_bytes(documents, run)
+        indexed = es_loader.bulk_load(settings.es.movies_index, tqdm(documents, total=len(df)))
+        run.rows = indexed
+    logger.info(f'{indexed} movie(s) loaded in elasticsearch')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load netflix prize data into UGC Mongo and Elasticsearch.')
+    parser.add_argument('--profile', action='store_true',
+                        help='print per-stage timings, throughput and the process memory high-water mark at the end')
+    parser.add_argument('--profile-dump', metavar='PATH',
+                        help='also write a cProfile dump of the main thread, for snakeviz or pstats')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    global profiler
+    args = parse_args(argv)
+    profiler = LoadProfiler(enabled=args.profile or bool(args.profile_dump))
+    cprofile = cProfile.Profile() if args.profile_dump else None
+    if cprofile is not None:
+        cprofile.enable()
+    try:
+        load_scores_to_mongo()
+        load_movies_to_elastic()
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.profile_dump)
+            logger.info(f'cProfile dump written to {args.profile_dump}')
+        profiler.report()
 
 
 if __name__ == '__main__':
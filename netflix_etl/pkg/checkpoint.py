@@ -0,0 +1,33 @@
+import json
+import os
+
+from core.logger import logger
+
+
+class Checkpoint:
+    """Number of leading chunks and rows of a source file committed to the storage.
+
+    The file is replaced atomically, an interrupted load resumes from the last saved state.
+    """
+
+    def __init__(self, path: str, source: str) -> None:
+        self.path = path
+        self.source = source
+        self.chunks = 0
+        self.rows = 0
+        if os.path.exists(path):
+            with open(path) as checkpoint_file:
+                state = json.load(checkpoint_file)
+            if state.get('source') == source:
+                self.chunks, self.rows = state['chunks'], state['rows']
+            else:
+                logger.warning(f'Checkpoint {path} belongs to {state.get("source")}, ignoring it.')
+
+    def save(self, chunks: int, rows: int) -> None:
+        self.chunks, self.rows = chunks, rows
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump({'source': self.source, 'chunks': chunks, 'rows': rows}, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(tmp_path, self.path)
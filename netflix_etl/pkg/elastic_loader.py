@@ -1,10 +1,12 @@
+from contextlib import contextmanager
 from functools import lru_cache
 
-from typing import Any, Dict, Iterator, List
+from typing import Any, Dict, Iterable, Iterator
 
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import bulk, parallel_bulk
 
+from core.logger import logger
 from core.settings import Settings, get_settings
 
 
@@ -13,7 +15,7 @@ class ElasticLoader:
         self.settings = settings
         self.es_client = Elasticsearch(hosts=[{"host": self.settings.es.host, "port": self.settings.es.port}])
 
-    def _documents_data_generator(self, index: str, documents: List[Any]) -> Iterator[Dict[Any, Any]]:
+    def _documents_data_generator(self, index: str, documents: Iterable[Any]) -> Iterator[Dict[Any, Any]]:
         for document in documents:
             yield {
                 '_id': document['id'],
@@ -26,6 +28,53 @@ class ElasticLoader:
         data_generator = self._documents_data_generator(index, documents)
         bulk(self.es_client, data_generator)
 
+    def bulk_load(self, index: str, documents: Iterable[Any]) -> int:
+        """Index a stream of documents with parallel bulk requests, return the number indexed."""
+        indexed = 0
+        with self.bulk_indexing(index):
+            results = parallel_bulk(
+                self.es_client,
+                self._documents_data_generator(index, documents),
+                thread_count=self.settings.es.bulk_thread_count,
+                chunk_size=self.settings.es.bulk_chunk_size,
+                max_chunk_bytes=self.settings.es.bulk_max_chunk_bytes,
+            )
+            for ok, _ in results:
+                indexed += ok
+        return indexed
+
+    @contextmanager
+    def bulk_indexing(self, index: str):
+        """Turn off refreshes and replicas of the index for the load, restore them after.
+
+        A missing index is created with them turned off, the mapping still comes
+        from the documents, and gets the default settings after the load.
+        """
+        bulk_settings = {'refresh_interval': '-1', 'number_of_replicas': 0}
+        if self.es_client.indices.exists(index=index):
+            current = self.es_client.indices.get_settings(
+                index=index,
+                name=['index.refresh_interval', 'index.number_of_replicas'],
+            )
+            index_settings = next(iter(current.values()), {}).get('settings', {}).get('index', {})
+            self.es_client.indices.put_settings(index=index, body={'index': bulk_settings})
+        else:
+            index_settings = {}
+            self.es_client.indices.create(index=index, body={'settings': {'index': bulk_settings}})
+        try:
+            yield
+        finally:
+            # A missing refresh interval is the default one, None resets it.
+            self.es_client.indices.put_settings(
+                index=index,
+                body={'index': {
+                    'refresh_interval': index_settings.get('refresh_interval'),
+                    'number_of_replicas': index_settings.get('number_of_replicas', 1),
+                }},
+            )
+            self.es_client.indices.refresh(index=index)
+            logger.info(f'Settings of the {index} index restored.')
+
 
 @lru_cache()
 def get_es_loader() -> ElasticLoader:
@@ -1,22 +1,129 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from functools import lru_cache
-from typing import Dict, List
+from typing import Dict, Iterable, List, Tuple
 
+import numpy as np
+import pandas as pd
+import bson
+from bson import ObjectId
 from pymongo import InsertOne, MongoClient
+from pymongo.errors import BulkWriteError
 
+from core.logger import logger
 from core.settings import Settings, get_settings
+from pkg.checkpoint import Checkpoint
+from pkg.profiler import LoadProfiler
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def score_object_ids(time_stamps: pd.Series, movie_ids: pd.Series, user_ids: pd.Series) -> List[ObjectId]:
+    """Deterministic object ids of the scores: rating time, movie id and user id.
+
+    A user scores a movie once, so a reloaded score gets the id it already has
+    and is rejected as a duplicate instead of being stored twice.
+    """
+    parts = np.empty((len(time_stamps), 3), dtype='>u4')
+    parts[:, 0] = (time_stamps - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    parts[:, 1] = movie_ids.to_numpy()
+    parts[:, 2] = user_ids.to_numpy()
+    raw = parts.tobytes()
+    return [ObjectId(raw[offset:offset + 12]) for offset in range(0, len(raw), 12)]
 
 
 class MongoLoader:
     def __init__(self, settings: Settings) -> None:
         self.client = MongoClient(settings.mongo.host, settings.mongo.port)
 
-    def insert_data_batched(self, db: str, collection: str, data: List[Dict]) -> None:
+    def insert_data_batched(self, db: str, collection: str, data: List[Dict], ordered: bool = True) -> None:
         mongo_collection = self.client[f'{db}'][f'{collection}']
         query = [InsertOne(sample) for sample in data]
-        result = mongo_collection.bulk_write(query)
+        try:
+            result = mongo_collection.bulk_write(query, ordered=ordered)
+        except BulkWriteError as ex:
+            errors = ex.details['writeErrors']
+            if ordered or any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            logger.info(f'{len(errors)} document(s) of the batch were already loaded')
+            return None
         return result
 
 
+class ParallelMongoLoader:
+    """Writes chunks with unordered bulk writes from a pool of threads and checkpoints the progress.
+
+    Chunks finish in any order, the checkpoint only moves over the unbroken run of
+    written chunks, so a resumed load never skips a chunk.
+    """
+
+    def __init__(
+            self,
+            loader: MongoLoader,
+            db: str,
+            collection: str,
+            workers: int,
+            checkpoint: Checkpoint,
+            profiler: LoadProfiler = None,
+    ) -> None:
+        self.loader = loader
+        self.db = db
+        self.collection = collection
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.profiler = profiler or LoadProfiler()
+        self.written: Dict[int, int] = {}
+
+    def load(self, chunks: Iterable[List[Dict]]) -> int:
+        """Write the chunks following the checkpoint, return the number of rows written."""
+        pending: Dict[Future, Tuple[int, int]] = {}
+        start_rows = self.checkpoint.rows
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='mongo-loader') as executor:
+            try:
+                for number, chunk in enumerate(chunks, start=self.checkpoint.chunks):
+                    # Bounds the chunks held in memory.
+                    while len(pending) >= self.workers * 2:
+                        self._settle(pending, wait(pending, return_when=FIRST_COMPLETED).done)
+                    future = executor.submit(self._write, chunk)
+                    pending[future] = (number, len(chunk))
+                while pending:
+                    self._settle(pending, wait(pending, return_when=FIRST_COMPLETED).done)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                self._settle(pending, wait(pending).done, raise_errors=False)
+                raise
+        return self.checkpoint.rows - start_rows
+
+    def _write(self, chunk: List[Dict]) -> None:
+        with self.profiler.stage('mongo write') as run:
+            self.loader.insert_data_batched(self.db, self.collection, chunk, ordered=False)
+            run.rows = len(chunk)
+            if self.profiler.enabled:
+                # size of the documents on the wire, encoding them again is only worth it when profiling
+                run.bytes = sum(len(bson.encode(document)) for document in chunk)
+
+    def _settle(self, pending: Dict[Future, Tuple[int, int]], done: Iterable[Future], raise_errors: bool = True):
+        error = None
+        for future in done:
+            number, rows = pending.pop(future)
+            if future.cancelled():
+                continue
+            if future.exception() is not None:
+                logger.error(f'Chunk {number} has not been loaded. {future.exception()}')
+                error = error or future.exception()
+                continue
+            self.written[number] = rows
+        chunks, rows = self.checkpoint.chunks, self.checkpoint.rows
+        while chunks in self.written:
+            rows += self.written.pop(chunks)
+            chunks += 1
+        if chunks != self.checkpoint.chunks:
+            self.checkpoint.save(chunks, rows)
+            logger.info(f'{rows} row(s) in {chunks} chunk(s) loaded in mongo')
+        if error is not None and raise_errors:
+            raise error
+
+
 @lru_cache()
 def get_mongo_loader() -> MongoLoader:
     return MongoLoader(settings=get_settings())
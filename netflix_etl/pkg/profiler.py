@@ -0,0 +1,76 @@
+import resource
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from core.logger import logger
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    seconds: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    # RSS high-water mark of the whole process when the stage last ended, MB;
+    # it never goes down, growth from one stage to the next is what the stage added
+    peak_rss_mb: float = 0.0
+
+
+class StageRun:
+    """Rows and bytes handled by one run of a stage, filled in by the caller."""
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.bytes = 0
+
+
+class LoadProfiler:
+    """Per-stage timings, throughput and memory of a load, a no-op when disabled.
+
+    Stages may run in several threads at once, their seconds are busy time,
+    rows/s and MB/s are computed against it. Memory is the process peak RSS
+    seen at the end of a stage, not the memory the stage itself used.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.stages = OrderedDict()
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    @contextmanager
+    def stage(self, name: str):
+        run = StageRun()
+        if not self.enabled:
+            yield run
+            return
+        started = time.monotonic()
+        try:
+            yield run
+        finally:
+            elapsed = time.monotonic() - started
+            # ru_maxrss is reported in kilobytes on linux
+            peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            with self.lock:
+                stats = self.stages.setdefault(name, StageStats())
+                stats.calls += 1
+                stats.seconds += elapsed
+                stats.rows += run.rows
+                stats.bytes += run.bytes
+                stats.peak_rss_mb = peak_rss_mb
+
+    def report(self) -> None:
+        if not self.enabled:
+            return
+        logger.info(f'Load profile, {time.monotonic() - self.started:0.1f}s in total:')
+        logger.info(f'{"stage":<16}{"calls":>8}{"busy s":>10}{"rows":>12}{"rows/s":>12}{"MB/s":>10}{"proc peak MB":>14}')
+        for name, stats in self.stages.items():
+            rate = stats.rows / stats.seconds if stats.seconds else 0
+            mb_rate = stats.bytes / stats.seconds / 2 ** 20 if stats.seconds else 0
+            logger.info(
+                f'{name:<16}{stats.calls:>8}{stats.seconds:>10.2f}{stats.rows:>12}'
+                f'{rate:>12.0f}{mb_rate:>10.1f}{stats.peak_rss_mb:>14.1f}'
+            )
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = np.array([
+    'james', 'mary', 'john', 'patricia', 'robert', 'jennifer', 'michael', 'linda', 'william', 'elizabeth',
+    'david', 'barbara', 'richard', 'susan', 'joseph', 'jessica', 'thomas', 'sarah', 'charles', 'karen',
+    'christopher', 'nancy', 'daniel', 'lisa', 'matthew', 'betty', 'anthony', 'margaret', 'mark', 'sandra',
+], dtype=object)
+LAST_NAMES = np.array([
+    'smith', 'johnson', 'williams', 'brown', 'jones', 'garcia', 'miller', 'davis', 'rodriguez', 'martinez',
+    'hernandez', 'lopez', 'gonzalez', 'wilson', 'anderson', 'thomas', 'taylor', 'moore', 'jackson', 'martin',
+    'lee', 'perez', 'thompson', 'white', 'harris', 'sanchez', 'clark', 'ramirez', 'lewis', 'robinson',
+], dtype=object)
+DOMAINS = np.array(['example.com', 'example.org', 'example.net'], dtype=object)
+
+
+def synthetic_user_names(user_ids: pd.Series) -> pd.Series:
+    """Email-like user names derived from the netflix user ids.
+
+    Names are picked by a hash of the id, so the same user gets the same name on
+    every load, and the id itself keeps the names of different users apart.
+    """
+    hashes = pd.util.hash_pandas_object(user_ids, index=False).to_numpy()
+    first = FIRST_NAMES[hashes % len(FIRST_NAMES)]
+    last = LAST_NAMES[(hashes >> np.uint64(16)) % len(LAST_NAMES)]
+    domain = DOMAINS[(hashes >> np.uint64(32)) % len(DOMAINS)]
+    return pd.Series(first + '.' + last + user_ids.astype(str).to_numpy(dtype=object) + '@' + domain,
+                     index=user_ids.index)
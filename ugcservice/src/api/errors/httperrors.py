@@ -68,3 +68,15 @@ WrongTimestamps = HTTPException(
     status_code=HTTPStatus.BAD_REQUEST,
     detail="Wrong start/end timestamps"
 )
+StatsTimeoutError = HTTPException(
+    status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+    detail='View statistics are not available right now.',
+)
+StatsPeriodError = HTTPException(
+    status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+    detail='Wrong statistics period.',
+)
+WatchPositionNotFoundError = HTTPException(
+    status_code=HTTPStatus.NOT_FOUND,
+    detail='Watch position not found.',
+)
@@ -0,0 +1,20 @@
+from datetime import date
+from typing import List
+from uuid import UUID
+
+from core.model_config import Base
+from services.viewstats.models import DayViews, FilmViews
+
+
+class TopFilmsResponseModel(Base):
+    date_from: date
+    date_to: date
+    records: List[FilmViews]
+
+
+class FilmViewsResponseModel(Base):
+    film_id: UUID
+    date_from: date
+    date_to: date
+    total_marks: int
+    records: List[DayViews]
@@ -0,0 +1,148 @@
+import logging
+from datetime import date, timedelta
+from typing import Optional, Tuple
+from uuid import UUID
+
+from api.errors.httperrors import StatsPeriodError
+from api.v1.viewstats.models import (FilmViewsResponseModel,
+                                     TopFilmsResponseModel)
+from api.views_decorators import auth_required
+from fastapi import APIRouter, Depends, Header, Query, status
+from fastapi_limiter.depends import RateLimiter
+from services.viewstats.models import WatchPosition
+from services.viewstats.service import ViewStatsService, get_view_stats_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix='/view_stats',
+    tags=["View Statistics"]
+)
+
+RATE_LIMITER_TIMES = 20
+RATE_LIMITER_SEC = 10
+
+DEFAULT_PERIOD_DAYS = 7
+# Bounds the number of daily rollup rows one request reads.
+MAX_PERIOD_DAYS = 366
+
+responses = {
+    status.HTTP_500_INTERNAL_SERVER_ERROR: {
+        "description": "UGC storage error.",
+        "content": {
+            "application/json": {
+                "example": {"detail": "UGC storage error."},
+            },
+        },
+    },
+    status.HTTP_503_SERVICE_UNAVAILABLE: {
+        "description": "Query time budget exceeded.",
+        "content": {
+            "application/json": {
+                "example": {"detail": "View statistics are not available right now."},
+            },
+        },
+    },
+    status.HTTP_422_UNPROCESSABLE_ENTITY: {
+        "content": {
+            "application/json": {
+                "example": {"detail": "Wrong statistics period."},
+            },
+        },
+    },
+    status.HTTP_429_TOO_MANY_REQUESTS: {
+        "content": {
+            "application/json": {
+                "example": {"detail": "Too Many Requests"},
+            },
+        },
+    },
+}
+
+
+class StatsPeriod:
+    def __init__(
+            self,
+            date_from: Optional[date] = Query(
+                default=None,
+                description=f"First day of the period, {DEFAULT_PERIOD_DAYS} days before date_to by default.",
+            ),
+            date_to: Optional[date] = Query(default=None, description="Last day of the period, today by default."),
+    ):
+        self.date_to = date_to or date.today()
+        self.date_from = date_from or self.date_to - timedelta(days=DEFAULT_PERIOD_DAYS - 1)
+        if self.date_from > self.date_to or (self.date_to - self.date_from).days >= MAX_PERIOD_DAYS:
+            raise StatsPeriodError
+
+    def bounds(self) -> Tuple[date, date]:
+        return self.date_from, self.date_to
+
+
+@router.get(
+    '/top_films',
+    response_model=TopFilmsResponseModel,
+    status_code=status.HTTP_200_OK,
+    responses=responses,
+    dependencies=[Depends(RateLimiter(times=RATE_LIMITER_TIMES, seconds=RATE_LIMITER_SEC))],
+)
+async def get_top_films(
+        period: StatsPeriod = Depends(),
+        limit: int = Query(default=10, ge=1, le=100),
+        view_stats_service: ViewStatsService = Depends(get_view_stats_service),
+) -> TopFilmsResponseModel:
+    """Most watched films of the period."""
+    date_from, date_to = period.bounds()
+    return await view_stats_service.get_top_films(date_from=date_from, date_to=date_to, limit=limit)
+
+
+@router.get(
+    '/film_views',
+    response_model=FilmViewsResponseModel,
+    status_code=status.HTTP_200_OK,
+    responses=responses,
+    dependencies=[Depends(RateLimiter(times=RATE_LIMITER_TIMES, seconds=RATE_LIMITER_SEC))],
+)
+async def get_film_views(
+        film_id: UUID = Query(example="4f91f972-f071-4ac9-9c31-55f7ee3bc8aa"),
+        period: StatsPeriod = Depends(),
+        view_stats_service: ViewStatsService = Depends(get_view_stats_service),
+) -> FilmViewsResponseModel:
+    """Film views per day of the period."""
+    date_from, date_to = period.bounds()
+    return await view_stats_service.get_film_views(film_id=film_id, date_from=date_from, date_to=date_to)
+
+
+@router.get(
+    '/watch_position',
+    response_model=WatchPosition,
+    status_code=status.HTTP_200_OK,
+    responses={
+        **responses,
+        status.HTTP_404_NOT_FOUND: {
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Watch position not found."},
+                },
+            },
+        },
+        status.HTTP_401_UNAUTHORIZED: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "detail": "Action only for authorized users."
+                    },
+                },
+            },
+        },
+    },
+    dependencies=[Depends(RateLimiter(times=RATE_LIMITER_TIMES, seconds=RATE_LIMITER_SEC))],
+)
+@auth_required
+async def get_watch_position(
+        film_id: UUID = Query(example="4f91f972-f071-4ac9-9c31-55f7ee3bc8aa"),
+        token: str = Header(description="Jwt access token"),
+        view_stats_service: ViewStatsService = Depends(get_view_stats_service),
+        user_id=Depends(),
+) -> WatchPosition:
+    """Last watch position of the current user in the film."""
+    return await view_stats_service.get_watch_position(user_id=user_id, film_id=film_id)
@@ -18,6 +18,19 @@ class Settings(BaseSettings):
     REDIS_LIMITER_HOST: str = os.getenv('REDIS_LIMITER_HOST', '127.0.0.1')
     REDIS_LIMITER_PORT: str = os.getenv('REDIS_LIMITER_PORT', '6379')
 
+    # Статистика просмотров, HTTP интерфейс ClickHouse
+    CLICKHOUSE_HOST: str = os.getenv('CLICKHOUSE_HOST', 'clickhouse-node1')
+    CLICKHOUSE_PORT: int = os.getenv('CLICKHOUSE_PORT', 8123)
+    CLICKHOUSE_USER: str = os.getenv('CLICKHOUSE_USER', 'app')
+    CLICKHOUSE_PASSWORD: str = os.getenv('CLICKHOUSE_PASSWORD', 'qwe123')
+    CLICKHOUSE_DATABASE: str = os.getenv('CLICKHOUSE_DATABASE', 'default')
+    CLICKHOUSE_VIEWS_TABLE: str = os.getenv('CLICKHOUSE_VIEWS_TABLE', 'views')
+    CLICKHOUSE_POOL_SIZE: int = os.getenv('CLICKHOUSE_POOL_SIZE', 20)
+    # Бюджет времени на запрос, ClickHouse прерывает запрос по max_execution_time
+    CLICKHOUSE_QUERY_TIMEOUT_SEC: float = os.getenv('CLICKHOUSE_QUERY_TIMEOUT_SEC', 2)
+    VIEW_STATS_CACHE_SEC: int = os.getenv('VIEW_STATS_CACHE_SEC', 60)
+    WATCH_POSITION_CACHE_SEC: int = os.getenv('WATCH_POSITION_CACHE_SEC', 10)
+
     AUTH_SERVICE = os.getenv('AUTH_SERVICE', 'http://127.0.0.1:8000/auth_api/v1/auth/check_roles')
 
     ENV: str = "test"
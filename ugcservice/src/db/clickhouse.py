@@ -0,0 +1,9 @@
+from typing import Optional
+
+from aiochclient import ChClient
+
+clickhouse: Optional[ChClient] = None
+
+
+async def get_clickhouse() -> ChClient:
+    return clickhouse
@@ -1,8 +1,11 @@
 import logging
+import math
+import aiohttp
 import aioredis
 import sentry_sdk
 import uvicorn
 from aiokafka import AIOKafkaProducer
+from aiochclient import ChClient
 from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import ORJSONResponse
@@ -17,9 +20,10 @@ from api.v1.likes.views import router as user_likes_router
 from api.v1.moviescores.views import router as movie_scores_router
 from api.v1.moviewatchmark import router as movie_watchmark_router
 from api.v1.reviews.views import router as film_reviews_router
+from api.v1.viewstats.views import router as view_stats_router
 from core.config import Settings
 from core.logger import setup_logging
-from db import kafka, mongo
+from db import clickhouse, kafka, mongo
 from db import redis as redis_cashed
 
 logger = logging.getLogger()
@@ -83,11 +87,23 @@ async def startup():
     logger.info(f"Connecting to mongo DB {Settings().MONGO_HOST}:{Settings().MONGO_PORT}")
     mongo.mongo = AsyncIOMotorClient(f'{Settings().MONGO_HOST}:{Settings().MONGO_PORT}')
 
+    logger.info(f"Connecting to ClickHouse {Settings().CLICKHOUSE_HOST}:{Settings().CLICKHOUSE_PORT}")
+    # Connections of the session are reused by all queries, at most CLICKHOUSE_POOL_SIZE at once.
+    clickhouse.clickhouse = ChClient(
+        aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=Settings().CLICKHOUSE_POOL_SIZE)),
+        url=f'http://{Settings().CLICKHOUSE_HOST}:{Settings().CLICKHOUSE_PORT}/',
+        user=Settings().CLICKHOUSE_USER,
+        password=Settings().CLICKHOUSE_PASSWORD,
+        database=Settings().CLICKHOUSE_DATABASE,
+        max_execution_time=math.ceil(Settings().CLICKHOUSE_QUERY_TIMEOUT_SEC),
+    )
+
 
 @app.on_event("shutdown")
 async def shutdown():
     await redis_cashed.redis.close()
     await FastAPILimiter.close()
+    await clickhouse.clickhouse.close()
     # await kafka.kafka.stop()
 
 app.include_router(movie_watchmark_router, prefix='/ugcservice_api/v1/movie_watchmark')
@@ -95,6 +111,7 @@ app.include_router(film_reviews_router, prefix='/ugcservice_api/v1')
 app.include_router(user_likes_router, prefix='/ugcservice_api/v1/users_likes')
 app.include_router(movie_scores_router, prefix='/ugcservice_api/v1/movie_scores')
 app.include_router(bookmarks_router, prefix='/ugcservice_api/v1')
+app.include_router(view_stats_router, prefix='/ugcservice_api/v1')
 
 
 if __name__ == '__main__':
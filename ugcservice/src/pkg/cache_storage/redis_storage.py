@@ -27,13 +27,13 @@ class RedisCacheService(ABSCacheStorage):
                 logger.info(f"data not found in redis.")
             return data
 
-    async def set_data(self, key: str, data: Union[str, bytes]):
+    async def set_data(self, key: str, data: Union[str, bytes], expire: int = EXPIRATION_TIME_SECONDS):
         logger.info(f"inserting data to redis cache with key: {key}")
         try:
             await self.redis.set(
                 key,
                 data,
-                ex=EXPIRATION_TIME_SECONDS
+                ex=expire
             )
         except Exception:
             logger.exception("error while inserting data in redis")
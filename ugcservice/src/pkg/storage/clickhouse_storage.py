@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from functools import lru_cache
+from typing import List, Optional
+
+from aiochclient import ChClient
+from api.errors.httperrors import StatsTimeoutError, StorageInternalError
+from core.config import Settings
+from db.clickhouse import get_clickhouse
+from fastapi import Depends
+from pkg.storage.storage import ABSStatsStorage
+
+logger = logging.getLogger(__name__)
+
+
+class ClickHouseService(ABSStatsStorage):
+    def __init__(self, clickhouse: ChClient) -> None:
+        self.clickhouse = clickhouse
+
+    async def get_ugc_from_storage(
+            self,
+            query: str,
+            params: Optional[dict] = None,
+            timeout_sec: Optional[float] = None,
+    ) -> List[dict]:
+        """Read rows from clickhouse within the query time budget."""
+        timeout_sec = timeout_sec or Settings().CLICKHOUSE_QUERY_TIMEOUT_SEC
+        try:
+            # ClickHouse stops the query on max_execution_time, the timeout also covers
+            # waiting for a free pooled connection and the network.
+            records = await asyncio.wait_for(
+                self.clickhouse.fetch(query, params=params),
+                timeout=timeout_sec,
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"ClickHouse query exceeded {timeout_sec}s budget {query} {params}.")
+            raise StatsTimeoutError
+        except Exception:
+            logger.exception(f"Failed to get data from ClickHouse {query} {params}.")
+            raise StorageInternalError
+        return [dict(record) for record in records]
+
+
+@lru_cache()
+def get_clickhouse_storage_service(
+        clickhouse: ChClient = Depends(get_clickhouse),
+) -> ClickHouseService:
+    return ClickHouseService(clickhouse)
@@ -37,3 +37,12 @@ class ABSStorage(ABC):
     def get_avg_ugc_data(self, **kwargs):
         """absmethod."""
         pass
+
+
+class ABSStatsStorage(ABC):
+    """Read-only storage of aggregated statistics."""
+
+    @abstractmethod
+    def get_ugc_from_storage(self, **kwargs):
+        """absmethod."""
+        pass
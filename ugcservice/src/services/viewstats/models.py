@@ -0,0 +1,23 @@
+from datetime import date, datetime
+from uuid import UUID
+
+from core.model_config import Base
+
+
+class FilmViews(Base):
+    film_id: UUID
+    marks: int
+    viewers: int
+
+
+class DayViews(Base):
+    day: date
+    marks: int
+    viewers: int
+
+
+class WatchPosition(Base):
+    film_id: UUID
+    position_ms: int
+    timestamp: str
+    event_time: datetime
@@ -0,0 +1,128 @@
+import logging
+from datetime import date
+from functools import lru_cache
+from typing import Type
+from uuid import UUID
+
+from api.errors.httperrors import WatchPositionNotFoundError
+from api.v1.viewstats.models import (FilmViewsResponseModel,
+                                     TopFilmsResponseModel)
+from core.config import Settings
+from core.model_config import Base
+from fastapi import Depends
+from pkg.cache_storage.redis_storage import get_redis_storage_service
+from pkg.cache_storage.storage import ABSCacheStorage
+from pkg.storage.clickhouse_storage import get_clickhouse_storage_service
+from pkg.storage.storage import ABSStatsStorage
+from services.viewstats.models import DayViews, FilmViews, WatchPosition
+
+logger = logging.getLogger(__name__)
+
+
+def rollup_table(name: str) -> str:
+    """Distributed rollup table filled by the ETL materialized views, see ETL/pkg/clickhouse_schema.py."""
+    return f"{Settings().CLICKHOUSE_DATABASE}.{Settings().CLICKHOUSE_VIEWS_TABLE}_{name}"
+
+
+class ViewStatsService:
+    """View statistics read from the ClickHouse rollups, never from the raw views table."""
+
+    def __init__(self, stats_storage: ABSStatsStorage, cache_storage: ABSCacheStorage):
+        self.stats_storage = stats_storage
+        self.cache_storage = cache_storage
+
+    async def get_from_cache(self, key: str, model: Type[Base]):
+        cached_data = await self.cache_storage.get_data(key=key)
+        if cached_data:
+            logger.info(f"view stats retrieved from cache, key: {key}.")
+            return model.parse_raw(cached_data)
+        return None
+
+    async def get_top_films(self, date_from: date, date_to: date, limit: int) -> TopFilmsResponseModel:
+        """Most watched films of the period."""
+        cached_key = f"top_films_{date_from}_{date_to}_{limit}"
+        result = await self.get_from_cache(cached_key, TopFilmsResponseModel)
+        if result:
+            return result
+        rows = await self.stats_storage.get_ugc_from_storage(
+            query=f"""
+                SELECT film_id, sum(marks) AS marks, uniqMerge(viewers) AS viewers
+                FROM {rollup_table('film_daily')}
+                WHERE day BETWEEN {{date_from}} AND {{date_to}}
+                GROUP BY film_id
+                ORDER BY marks DESC
+                LIMIT {{limit}}
+            """,
+            params={'date_from': date_from, 'date_to': date_to, 'limit': limit},
+        )
+        result = TopFilmsResponseModel(
+            date_from=date_from,
+            date_to=date_to,
+            records=[FilmViews(**row) for row in rows],
+        )
+        await self.cache_storage.set_data(key=cached_key, data=result.json(), expire=Settings().VIEW_STATS_CACHE_SEC)
+        return result
+
+    async def get_film_views(self, film_id: UUID, date_from: date, date_to: date) -> FilmViewsResponseModel:
+        """Watch marks and unique viewers of the film per day of the period."""
+        cached_key = f"film_views_{film_id}_{date_from}_{date_to}"
+        result = await self.get_from_cache(cached_key, FilmViewsResponseModel)
+        if result:
+            return result
+        rows = await self.stats_storage.get_ugc_from_storage(
+            query=f"""
+                SELECT day, sum(marks) AS marks, uniqMerge(viewers) AS viewers
+                FROM {rollup_table('film_daily')}
+                WHERE film_id = toUUID({{film_id}}) AND day BETWEEN {{date_from}} AND {{date_to}}
+                GROUP BY day
+                ORDER BY day
+            """,
+            params={'film_id': film_id, 'date_from': date_from, 'date_to': date_to},
+        )
+        records = [DayViews(**row) for row in rows]
+        result = FilmViewsResponseModel(
+            film_id=film_id,
+            date_from=date_from,
+            date_to=date_to,
+            total_marks=sum(record.marks for record in records),
+            records=records,
+        )
+        await self.cache_storage.set_data(key=cached_key, data=result.json(), expire=Settings().VIEW_STATS_CACHE_SEC)
+        return result
+
+    async def get_watch_position(self, user_id: UUID, film_id: UUID) -> WatchPosition:
+        """Last watch position of the user in the film."""
+        cached_key = f"watch_position_{user_id}_{film_id}"
+        result = await self.get_from_cache(cached_key, WatchPosition)
+        if result:
+            return result
+        # Replaced rows may not be merged yet, argMax picks the latest one anyway.
+        rows = await self.stats_storage.get_ugc_from_storage(
+            query=f"""
+                SELECT film_id,
+                       argMax(position_ms, event_time) AS position_ms,
+                       argMax(timestamp, event_time) AS timestamp,
+                       max(event_time) AS event_time
+                FROM {rollup_table('latest_position')}
+                WHERE user_id = toUUID({{user_id}}) AND film_id = toUUID({{film_id}})
+                GROUP BY film_id
+            """,
+            params={'user_id': user_id, 'film_id': film_id},
+        )
+        if not rows:
+            raise WatchPositionNotFoundError
+        result = WatchPosition(**rows[0])
+        await self.cache_storage.set_data(
+            key=cached_key,
+            data=result.json(),
+            expire=Settings().WATCH_POSITION_CACHE_SEC,
+        )
+        return result
+
+
+@lru_cache()
+def get_view_stats_service(
+        stats_storage: ABSStatsStorage = Depends(get_clickhouse_storage_service),
+        cache_storage: ABSCacheStorage = Depends(get_redis_storage_service),
+) -> ViewStatsService:
+    return ViewStatsService(stats_storage=stats_storage, cache_storage=cache_storage)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Unit tests import the service modules from src, as the app does.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
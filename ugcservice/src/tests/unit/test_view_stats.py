@@ -0,0 +1,173 @@
+from datetime import date, datetime, timedelta
+from uuid import UUID
+
+import pytest
+from fastapi import HTTPException
+
+from api.v1.viewstats import views
+from api.v1.viewstats.views import DEFAULT_PERIOD_DAYS, MAX_PERIOD_DAYS, StatsPeriod
+from services.viewstats.models import WatchPosition
+from core.config import Settings
+from services.viewstats.service import ViewStatsService, rollup_table
+
+FILM_ID = UUID('4f91f972-f071-4ac9-9c31-55f7ee3bc8aa')
+USER_ID = UUID('0c9b2a64-5c6f-4b55-8a0f-6a2d3c1e9f01')
+
+
+class FakeStatsStorage:
+    """Returns the given rows and records the queries it gets."""
+
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.queries = []
+
+    async def get_ugc_from_storage(self, query, params=None, timeout_sec=None):
+        self.queries.append((query, params))
+        return self.rows
+
+
+class FakeCache:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    async def get_data(self, key):
+        return self.data.get(key)
+
+    async def set_data(self, key, data, expire=None):
+        self.data[key] = data
+        self.expires[key] = expire
+
+    async def delete_data(self, key):
+        self.data.pop(key, None)
+
+
+class FakeDate(date):
+    @classmethod
+    def today(cls):
+        return cls(2022, 8, 20)
+
+
+@pytest.fixture
+def today(monkeypatch):
+    monkeypatch.setattr(views, 'date', FakeDate)
+    return FakeDate.today()
+
+
+def test_period_defaults_to_the_last_days_up_to_today(today):
+    period = StatsPeriod(date_from=None, date_to=None)
+
+    assert period.bounds() == (today - timedelta(days=DEFAULT_PERIOD_DAYS - 1), today)
+
+
+def test_period_defaults_date_from_before_the_given_date_to(today):
+    period = StatsPeriod(date_from=None, date_to=date(2022, 1, 10))
+
+    assert period.bounds() == (date(2022, 1, 10) - timedelta(days=DEFAULT_PERIOD_DAYS - 1), date(2022, 1, 10))
+
+
+def test_period_of_a_single_day_is_accepted(today):
+    assert StatsPeriod(date_from=today, date_to=today).bounds() == (today, today)
+
+
+def test_period_ending_before_it_starts_is_refused(today):
+    with pytest.raises(HTTPException) as error:
+        StatsPeriod(date_from=today, date_to=today - timedelta(days=1))
+
+    assert error.value.status_code == 422
+
+
+def test_period_of_max_days_is_refused(today):
+    longest = today - timedelta(days=MAX_PERIOD_DAYS - 1)
+
+    assert StatsPeriod(date_from=longest, date_to=today).bounds() == (longest, today)
+    with pytest.raises(HTTPException):
+        StatsPeriod(date_from=longest - timedelta(days=1), date_to=today)
+
+
+@pytest.mark.asyncio
+async def test_top_films_query_reads_the_daily_rollup_with_parameters():
+    storage = FakeStatsStorage([{'film_id': FILM_ID, 'marks': 12, 'viewers': 3}])
+    service = ViewStatsService(stats_storage=storage, cache_storage=FakeCache())
+
+    result = await service.get_top_films(date_from=date(2022, 8, 1), date_to=date(2022, 8, 7), limit=5)
+
+    assert [(record.film_id, record.marks, record.viewers) for record in result.records] == [(FILM_ID, 12, 3)]
+    (query, params), = storage.queries
+    assert f"FROM {rollup_table('film_daily')}" in query
+    assert 'BETWEEN {date_from} AND {date_to}' in query
+    assert 'LIMIT {limit}' in query
+    assert params == {'date_from': date(2022, 8, 1), 'date_to': date(2022, 8, 7), 'limit': 5}
+
+
+@pytest.mark.asyncio
+async def test_top_films_come_from_cache_on_a_repeated_request():
+    storage = FakeStatsStorage([{'film_id': FILM_ID, 'marks': 12, 'viewers': 3}])
+    cache = FakeCache()
+    service = ViewStatsService(stats_storage=storage, cache_storage=cache)
+
+    first = await service.get_top_films(date_from=date(2022, 8, 1), date_to=date(2022, 8, 7), limit=5)
+    second = await service.get_top_films(date_from=date(2022, 8, 1), date_to=date(2022, 8, 7), limit=5)
+    await service.get_top_films(date_from=date(2022, 8, 1), date_to=date(2022, 8, 7), limit=6)
+
+    assert second == first
+    assert len(storage.queries) == 2
+    assert set(cache.data) == {'top_films_2022-08-01_2022-08-07_5', 'top_films_2022-08-01_2022-08-07_6'}
+
+
+@pytest.mark.asyncio
+async def test_film_views_sums_the_marks_of_the_days():
+    storage = FakeStatsStorage([
+        {'day': date(2022, 8, 1), 'marks': 4, 'viewers': 2},
+        {'day': date(2022, 8, 3), 'marks': 6, 'viewers': 1},
+    ])
+    service = ViewStatsService(stats_storage=storage, cache_storage=FakeCache())
+
+    result = await service.get_film_views(film_id=FILM_ID, date_from=date(2022, 8, 1), date_to=date(2022, 8, 7))
+
+    assert result.total_marks == 10
+    assert [record.day for record in result.records] == [date(2022, 8, 1), date(2022, 8, 3)]
+    (query, params), = storage.queries
+    assert 'film_id = toUUID({film_id})' in query
+    assert params == {'film_id': FILM_ID, 'date_from': date(2022, 8, 1), 'date_to': date(2022, 8, 7)}
+
+
+@pytest.mark.asyncio
+async def test_film_views_of_a_period_without_views_are_empty():
+    service = ViewStatsService(stats_storage=FakeStatsStorage(), cache_storage=FakeCache())
+
+    result = await service.get_film_views(film_id=FILM_ID, date_from=date(2022, 8, 1), date_to=date(2022, 8, 7))
+
+    assert result.total_marks == 0
+    assert result.records == []
+
+
+@pytest.mark.asyncio
+async def test_watch_position_reads_the_latest_position_rollup():
+    row = {
+        'film_id': FILM_ID,
+        'position_ms': 61000,
+        'timestamp': '00:01:01',
+        'event_time': datetime(2022, 8, 1, 12, 0),
+    }
+    storage = FakeStatsStorage([row])
+    cache = FakeCache()
+    service = ViewStatsService(stats_storage=storage, cache_storage=cache)
+
+    result = await service.get_watch_position(user_id=USER_ID, film_id=FILM_ID)
+
+    assert result == WatchPosition(**row)
+    (query, params), = storage.queries
+    assert f"FROM {rollup_table('latest_position')}" in query
+    assert params == {'user_id': USER_ID, 'film_id': FILM_ID}
+    assert cache.expires == {f'watch_position_{USER_ID}_{FILM_ID}': Settings().WATCH_POSITION_CACHE_SEC}
+
+
+@pytest.mark.asyncio
+async def test_missing_watch_position_is_not_found():
+    service = ViewStatsService(stats_storage=FakeStatsStorage(), cache_storage=FakeCache())
+
+    with pytest.raises(HTTPException) as error:
+        await service.get_watch_position(user_id=USER_ID, film_id=FILM_ID)
+
+    assert error.value.status_code == 404